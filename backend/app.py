@@ -1,16 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+import startup_profile
+
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request, Query, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import text, func
-import pandas as pd
+from sqlalchemy.exc import DBAPIError
 import json
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import io
 import logging
+import time
+
+startup_profile.mark("third_party_imports")
 
-from database import get_db, engine
+from database import get_db, engine, get_pool_status, warm_up_pool, DATABASE_URL
+from org_chart import ORG_CHART, ORG_CHART_ENABLED, load_hierarchy
+from org_analytics import ORG_ANALYTICS, compute_org_analytics
+from change_feed import CHANGE_FEED, CHANGE_FEED_ENABLED, parse_token
+from read_path import FAST_READ_PATH
+from prepared import REGISTRY as PREPARED
+import bulk_load
+import exports
+import index_advisor
+import negotiation
+import read_path
+import salary_raise
+import metrics
 import models
 import schemas
+import trigger_profile
+
+startup_profile.mark("project_modules")
 
 # Настройка логирования для батчевой загрузки
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +52,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие ответов по Accept-Encoding (см. negotiation.py). Объявлено раньше замера
+# времени, поэтому выполняется внутри него и время сжатия входит в длительность запроса
+@app.middleware("http")
+async def compress_response(request: Request, call_next):
+    response = await call_next(request)
+    content_type = response.headers.get("content-type")
+    content_length = response.headers.get("content-length")
+    # Без content-length - потоковый ответ (выгрузка, SSE): его не буферизуем
+    if content_length is None or "content-encoding" in response.headers:
+        return response
+    response_format = negotiation.format_of(content_type)
+    negotiation.RESPONSE_BYTES.observe(int(content_length), format=response_format, encoding="identity")
+    encoding = negotiation.choose_encoding(request.headers.get("accept-encoding"))
+    if encoding is None or not negotiation.should_compress(content_type, content_length):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    compressed = await run_in_threadpool(negotiation.compress_body, body, encoding, response_format)
+    vary = ", ".join(filter(None, [response.headers.get("vary"), "Accept-Encoding"]))
+    compressed_response = Response(content=compressed, status_code=response.status_code)
+    compressed_response.raw_headers = [
+        (name, value) for name, value in response.raw_headers
+        if name not in (b"content-length", b"vary")
+    ] + [
+        (b"content-length", str(len(compressed)).encode()),
+        (b"content-encoding", encoding.encode()),
+        (b"vary", vary.encode()),
+    ]
+    return compressed_response
+
+# Замер времени обработки запросов по шаблонам маршрутов
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Шаблон маршрута (/employees/{employee_id}), а не фактический путь,
+        # чтобы не раздувать число меток
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        metrics.observe_request(request.method, route_path, status_code, time.perf_counter() - start)
+
+@app.on_event("startup")
+def start_org_chart():
+    # Снимок оргструктуры в памяти, обновляется через LISTEN/NOTIFY (см. org_chart.py)
+    if ORG_CHART_ENABLED:
+        ORG_CHART.start(engine, DATABASE_URL)
+
+@app.on_event("startup")
+async def start_change_feed():
+    # Слушатель канала audit_changes в цикле событий воркера (см. change_feed.py)
+    if CHANGE_FEED_ENABLED:
+        CHANGE_FEED.start(engine, DATABASE_URL)
+
+@app.on_event("startup")
+def warm_up_worker():
+    # Соединения пула и сериализаторы готовятся до первого запроса к воркеру
+    read_path.warm_up((schemas.EmployeeResponse, schemas.DepartmentResponse, schemas.PositionResponse))
+    try:
+        opened = warm_up_pool()
+        logger.info("Пул соединений прогрет: %d соединений", opened)
+    except Exception as e:
+        logger.warning("Не удалось прогреть пул соединений: %s", e)
+
+@app.on_event("shutdown")
+def stop_org_chart():
+    ORG_CHART.stop()
+
+@app.on_event("shutdown")
+async def stop_change_feed():
+    await CHANGE_FEED.stop()
+
+@app.on_event("shutdown")
+def close_pool():
+    # Запросы уже завершены (graceful shutdown сервера) - соединения закрываются явно
+    engine.dispose()
+
 # ========== БАЗОВЫЕ CRUD ЭНДПОИНТЫ ==========
 
 # 1. Сотрудники (Employees)
@@ -38,9 +141,32 @@ def get_employees(
     skip: int = 0, 
     limit: int = 100, 
     department_id: int = None,
+    include_archived: bool = False,
+    fields: str = Query(None, description="Поля ответа через запятую, например first_name,last_name,department_id"),
+    include: str = Query(None, description="Связанные названия: department, position"),
     db: Session = Depends(get_db)
 ):
-    """Получить список сотрудников с фильтрацией"""
+    """
+    Получить список сотрудников с фильтрацией (include_archived - вместе с архивом уволенных).
+    fields - выбрать только перечисленные столбцы (employee_id выбирается всегда),
+    include=department,position - добавить department_name и position_title
+    """
+    try:
+        selected = read_path.parse_fields(fields, read_path.EMPLOYEE_FIELDS, key="employee_id")
+        includes = read_path.parse_includes(include)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # У архива нет ORM-модели, а ORM не умеет выбирать часть столбцов:
+    # в этих случаях список всегда строится из строк Core
+    if FAST_READ_PATH or include_archived or selected or includes:
+        query = read_path.employees_query(department_id, include_archived, selected, includes)
+        rows = db.execute(query.offset(skip).limit(limit)).all()
+        if selected or includes:
+            model = read_path.sparse_model(schemas.EmployeeResponse, selected or read_path.EMPLOYEE_FIELDS, includes)
+            return read_path.json_rows_response(model, rows)
+        return read_path.json_rows_response(schemas.EmployeeResponse, rows)
+
     query = db.query(models.Employee)
     
     if department_id:
@@ -50,9 +176,13 @@ def get_employees(
     return employees
 
 @app.get("/employees/{employee_id}", response_model=schemas.EmployeeResponse)
-def get_employee(employee_id: int, db: Session = Depends(get_db)):
-    """Получить сотрудника по ID"""
+def get_employee(employee_id: int, include_archived: bool = False, db: Session = Depends(get_db)):
+    """Получить сотрудника по ID (include_archived - искать и в архиве уволенных)"""
     employee = db.query(models.Employee).filter(models.Employee.employee_id == employee_id).first()
+    if not employee and include_archived:
+        row = db.execute(read_path.archived_employee_query(employee_id)).first()
+        if row is not None:
+            return dict(row._mapping)
     if not employee:
         raise HTTPException(status_code=404, detail="Сотрудник не найден")
     return employee
@@ -119,8 +249,26 @@ def delete_employee(employee_id: int, db: Session = Depends(get_db)):
 
 # 2. Отделы (Departments)
 @app.get("/departments/", response_model=list[schemas.DepartmentResponse])
-def get_departments(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Получить список отделов"""
+def get_departments(
+    skip: int = 0,
+    limit: int = 100,
+    fields: str = Query(None, description="Поля ответа через запятую, например department_name,employee_count"),
+    db: Session = Depends(get_db)
+):
+    """Получить список отделов (fields - только перечисленные поля, department_id выбирается всегда)"""
+    try:
+        selected = read_path.parse_fields(fields, read_path.DEPARTMENT_FIELDS, key="department_id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if selected:
+        rows = db.execute(read_path.departments_query(selected).offset(skip).limit(limit)).all()
+        return read_path.json_rows_response(read_path.sparse_model(schemas.DepartmentResponse, selected), rows)
+
+    if FAST_READ_PATH:
+        rows = db.execute(read_path.departments_query().offset(skip).limit(limit)).all()
+        return read_path.json_rows_response(schemas.DepartmentResponse, rows)
+
     departments = db.query(models.Department).offset(skip).limit(limit).all()
     return departments
 
@@ -137,103 +285,126 @@ def create_department(department: schemas.DepartmentCreate, db: Session = Depend
 @app.get("/positions/", response_model=list[schemas.PositionResponse])
 def get_positions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Получить список должностей"""
+    if FAST_READ_PATH:
+        rows = db.execute(read_path.positions_query().offset(skip).limit(limit)).all()
+        return read_path.json_rows_response(schemas.PositionResponse, rows)
+
     positions = db.query(models.Position).offset(skip).limit(limit).all()
     return positions
 
 # ========== СЛОЖНЫЕ SQL-ЗАПРОСЫ (RAW SQL) ==========
 
+# Запросы отчетов подготавливаются на сервере один раз на соединение (см. prepared.py)
+PREPARED.register("department_salary_report", """
+    SELECT 
+        d.department_id,
+        d.department_name,
+        COUNT(e.employee_id) as employee_count,
+        SUM(e.salary) as total_salary,
+        AVG(e.salary) as avg_salary
+    FROM departments d
+    LEFT JOIN employees e ON d.department_id = e.department_id
+    GROUP BY d.department_id, d.department_name
+    ORDER BY total_salary DESC
+""")
+
+PREPARED.register("employee_rows_by_ids", """
+    SELECT e.* FROM employees e WHERE e.employee_id = ANY(:ids)
+""", {"ids": "int[]"})
+
+PREPARED.register("employee_subordinates", """
+    WITH RECURSIVE subordinates AS (
+        -- Начальная точка: сам менеджер
+        SELECT e.*, 0 as level
+        FROM employees e
+        WHERE e.employee_id = :employee_id
+        
+        UNION ALL
+        
+        -- Рекурсивно находим подчиненных
+        SELECT e.*, s.level + 1
+        FROM employees e
+        INNER JOIN subordinates s ON e.manager_id = s.employee_id
+    )
+    SELECT * FROM subordinates WHERE employee_id != :employee_id
+    ORDER BY level, last_name, first_name
+""", {"employee_id": "int"})
+
+PREPARED.register("employee_hierarchy", """
+    SELECT 
+        e.employee_id,
+        e.first_name || ' ' || e.last_name as employee_name,
+        e.position_id,
+        p.position_title,
+        d.department_name,
+        m.first_name || ' ' || m.last_name as manager_name,
+        e.manager_id
+    FROM employees e
+    LEFT JOIN employees m ON e.manager_id = m.employee_id
+    LEFT JOIN departments d ON e.department_id = d.department_id
+    LEFT JOIN positions p ON e.position_id = p.position_id
+    ORDER BY d.department_name, e.last_name
+""")
+
+PREPARED.register("department_employees", """
+    SELECT 
+        e.*,
+        p.position_title,
+        m.first_name || ' ' || m.last_name as manager_name
+    FROM employees e
+    LEFT JOIN positions p ON e.position_id = p.position_id
+    LEFT JOIN employees m ON e.manager_id = m.employee_id
+    WHERE e.department_id = :department_id
+    ORDER BY e.last_name, e.first_name
+""", {"department_id": "int"})
+
 @app.get("/reports/department-salary")
-def get_department_salary_report(db: Session = Depends(get_db)):
+def get_department_salary_report(request: Request, db: Session = Depends(get_db)):
     """Отчет: общий фонд заработной платы по отделам (GROUP BY, SUM)"""
-    query = """
-        SELECT 
-            d.department_id,
-            d.department_name,
-            COUNT(e.employee_id) as employee_count,
-            SUM(e.salary) as total_salary,
-            AVG(e.salary) as avg_salary
-        FROM departments d
-        LEFT JOIN employees e ON d.department_id = e.department_id
-        GROUP BY d.department_id, d.department_name
-        ORDER BY total_salary DESC
-    """
-    result = db.execute(text(query))
-    return [dict(row._mapping) for row in result]
+    result = PREPARED.execute(db, "department_salary_report")
+    return negotiation.rows_response(request, result, result.keys())
 
 @app.get("/employees/{employee_id}/subordinates")
 def get_employee_subordinates(employee_id: int, db: Session = Depends(get_db)):
     """Найти всех подчиненных для конкретного менеджера (SELF JOIN)"""
-    query = """
-        WITH RECURSIVE subordinates AS (
-            -- Начальная точка: сам менеджер
-            SELECT e.*, 0 as level
-            FROM employees e
-            WHERE e.employee_id = :employee_id
-            
-            UNION ALL
-            
-            -- Рекурсивно находим подчиненных
-            SELECT e.*, s.level + 1
-            FROM employees e
-            INNER JOIN subordinates s ON e.manager_id = s.employee_id
-        )
-        SELECT * FROM subordinates WHERE employee_id != :employee_id
-        ORDER BY level, last_name, first_name
-    """
-    result = db.execute(text(query), {"employee_id": employee_id})
+    if ORG_CHART.ready and employee_id in ORG_CHART.snapshot:
+        # Поддерево берется из снимка в памяти, из базы читаются только строки сотрудников
+        levels = dict(ORG_CHART.snapshot.subordinates(employee_id))
+        if not levels:
+            return []
+        result = PREPARED.execute(db, "employee_rows_by_ids", {"ids": list(levels)})
+        rows = [dict(row._mapping, level=levels[row.employee_id]) for row in result]
+        rows.sort(key=lambda row: (row["level"], row["last_name"], row["first_name"]))
+        return rows
+
+    result = PREPARED.execute(db, "employee_subordinates", {"employee_id": employee_id})
     return [dict(row._mapping) for row in result]
 
 @app.get("/reports/employee-hierarchy")
-def get_employee_hierarchy(db: Session = Depends(get_db)):
+def get_employee_hierarchy(request: Request, db: Session = Depends(get_db)):
     """Иерархия сотрудников с их руководителями"""
-    query = """
-        SELECT 
-            e.employee_id,
-            e.first_name || ' ' || e.last_name as employee_name,
-            e.position_id,
-            p.position_title,
-            d.department_name,
-            m.first_name || ' ' || m.last_name as manager_name,
-            e.manager_id
-        FROM employees e
-        LEFT JOIN employees m ON e.manager_id = m.employee_id
-        LEFT JOIN departments d ON e.department_id = d.department_id
-        LEFT JOIN positions p ON e.position_id = p.position_id
-        ORDER BY d.department_name, e.last_name
-    """
-    result = db.execute(text(query))
-    return [dict(row._mapping) for row in result]
+    result = PREPARED.execute(db, "employee_hierarchy")
+    return negotiation.rows_response(request, result, result.keys())
 
 @app.get("/reports/department/{department_id}/employees")
-def get_department_employees(department_id: int, db: Session = Depends(get_db)):
+def get_department_employees(department_id: int, request: Request, db: Session = Depends(get_db)):
     """Все сотрудники указанного отдела"""
-    query = """
-        SELECT 
-            e.*,
-            p.position_title,
-            m.first_name || ' ' || m.last_name as manager_name
-        FROM employees e
-        LEFT JOIN positions p ON e.position_id = p.position_id
-        LEFT JOIN employees m ON e.manager_id = m.employee_id
-        WHERE e.department_id = :department_id
-        ORDER BY e.last_name, e.first_name
-    """
-    result = db.execute(text(query), {"department_id": department_id})
-    return [dict(row._mapping) for row in result]
+    result = PREPARED.execute(db, "department_employees", {"department_id": department_id})
+    return negotiation.rows_response(request, result, result.keys())
 
 # ========== ПРЕДСТАВЛЕНИЯ (VIEWS) ==========
 
 @app.get("/views/employee-full-info")
-def get_employee_full_info(db: Session = Depends(get_db)):
-    """Получить данные из представления v_employee_info"""
+def get_employee_full_info(request: Request, db: Session = Depends(get_db)):
+    """Получить данные из представления v_employee_info (JSON, Arrow или MessagePack по Accept)"""
     result = db.execute(text("SELECT * FROM v_employee_info ORDER BY full_name"))
-    return [dict(row._mapping) for row in result]
+    return negotiation.rows_response(request, result, result.keys())
 
 @app.get("/views/department-budget")
-def get_department_budget_view(db: Session = Depends(get_db)):
+def get_department_budget_view(request: Request, db: Session = Depends(get_db)):
     """Получить данные из представления v_department_budget"""
     result = db.execute(text("SELECT * FROM v_department_budget ORDER BY total_salary DESC"))
-    return [dict(row._mapping) for row in result]
+    return negotiation.rows_response(request, result, result.keys())
 
 # ========== ХРАНИМЫЕ ПРОЦЕДУРЫ И ФУНКЦИИ ==========
 
@@ -241,32 +412,91 @@ def get_department_budget_view(db: Session = Depends(get_db)):
 def increase_department_salary(
     department_id: int, 
     percent: float,
+    background_tasks: BackgroundTasks,
+    chunked: bool = False,
+    batch_size: int = Query(500, ge=1, le=10000),
+    background: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Повысить зарплату всем сотрудникам отдела на указанный процент"""
+    """
+    Повысить зарплату всем сотрудникам отдела на указанный процент.
+
+    По умолчанию - одним UPDATE в одной транзакции (increase_department_salaries).
+    chunked=true - порциями по batch_size с фиксацией после каждой (salary_raise.py):
+    строки отдела не блокируются на все время повышения, прогресс сохраняется, и
+    прерванный запуск продолжается через /procedures/increase-salary/runs/{run_id}/resume.
+    background=true возвращает run_id сразу, не дожидаясь окончания.
+    """
+    if chunked:
+        try:
+            run_id = salary_raise.start_run(db, department_id, percent, batch_size)
+        except salary_raise.SalaryRaiseError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except DBAPIError as e:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Ошибка: {e.orig}")
+        if background:
+            background_tasks.add_task(salary_raise.run_in_background, run_id)
+            return {"message": "Повышение запущено", "run_id": run_id}
+        return _run_salary_raise(run_id)
+
     try:
-        # Вызов хранимой процедуры
-        result = db.execute(
-            text("CALL increase_department_salary(:dept_id, :percent)"),
+        # Вызов хранимой функции; блокировки держатся до commit
+        start = time.perf_counter()
+        updated = db.execute(
+            text("SELECT * FROM increase_department_salaries(:dept_id, :percent)"),
             {"dept_id": department_id, "percent": percent}
-        )
+        ).fetchall()
+        blocked_sessions, blocked_wait_ms = salary_raise.blocked_by_current_transaction(db)
         db.commit()
-        
-        # Получение результатов обновления
-        updated_count = db.execute(
-            text("SELECT COUNT(*) FROM employees WHERE department_id = :dept_id"),
-            {"dept_id": department_id}
-        ).scalar()
+        lock_hold_ms = (time.perf_counter() - start) * 1000
         
         return {
             "message": f"Зарплаты успешно повышены на {percent}%",
             "department_id": department_id,
-            "affected_employees": updated_count
+            "affected_employees": len(updated),
+            "lock_hold_ms": round(lock_hold_ms, 1),
+            "blocked_sessions": blocked_sessions,
+            "blocked_wait_ms_max": round(blocked_wait_ms, 1)
         }
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Ошибка: {str(e)}")
 
+def _run_salary_raise(run_id: int):
+    try:
+        return salary_raise.run(run_id)
+    except salary_raise.SalaryRaiseError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except DBAPIError as e:
+        raise HTTPException(status_code=400, detail=f"Запуск {run_id} прерван: {e.orig}")
+
+@app.get("/procedures/increase-salary/runs/{run_id}")
+def get_salary_raise_run(run_id: int, db: Session = Depends(get_db)):
+    """Прогресс порционного повышения и вызванные им ожидания блокировок"""
+    raise_run = salary_raise.get_run(db, run_id)
+    if raise_run is None:
+        raise HTTPException(status_code=404, detail="Запуск не найден")
+    raise_run["deferred"] = db.execute(
+        text("SELECT COUNT(*) FROM salary_raise_deferred WHERE run_id = :run_id"), {"run_id": run_id}
+    ).scalar()
+    return raise_run
+
+@app.post("/procedures/increase-salary/runs/{run_id}/resume")
+def resume_salary_raise_run(run_id: int, background_tasks: BackgroundTasks, background: bool = False):
+    """Продолжить прерванный запуск с последней зафиксированной порции"""
+    if background:
+        background_tasks.add_task(salary_raise.run_in_background, run_id)
+        return {"message": "Повышение продолжено", "run_id": run_id}
+    return _run_salary_raise(run_id)
+
+@app.delete("/procedures/increase-salary/runs/{run_id}")
+def cancel_salary_raise_run(run_id: int, db: Session = Depends(get_db)):
+    """Отменить незавершенный запуск; уже повышенные зарплаты остаются"""
+    if not salary_raise.cancel_run(db, run_id):
+        raise HTTPException(status_code=404, detail="Незавершенный запуск не найден")
+    return {"message": "Запуск отменен", "run_id": run_id}
+
 @app.get("/functions/employee-tenure/{employee_id}")
 def get_employee_tenure(employee_id: int, db: Session = Depends(get_db)):
     """Получить стаж работы сотрудника с помощью функции"""
@@ -276,14 +506,97 @@ def get_employee_tenure(employee_id: int, db: Session = Depends(get_db)):
     )
     return [dict(row._mapping) for row in result]
 
+# ========== ЗАРПЛАТЫ НА ДАТУ ==========
+
+# Оклад на дату берется из salary_periods (15_salary_periods.sql): интервал сотрудника,
+# содержащий дату, находится по GiST-индексу, без прохода по salary_history
+
+@app.get("/payroll/as-of")
+def get_payroll_as_of(
+    as_of: date = Query(..., alias="date"),
+    department_id: int = None,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """Оклады сотрудников на дату (по отделу, в котором сотрудник был на эту дату)"""
+    result = db.execute(text("""
+        SELECT sp.employee_id,
+               COALESCE(e.first_name, a.first_name) AS first_name,
+               COALESCE(e.last_name, a.last_name) AS last_name,
+               sp.department_id, sp.salary,
+               lower(sp.valid_during) AS valid_from,
+               upper(sp.valid_during) AS valid_to,
+               a.employee_id IS NOT NULL AS archived
+        FROM salary_periods sp
+        -- Уволенные, перенесенные в архив, тоже входят в срез на прошедшую дату
+        LEFT JOIN employees e ON e.employee_id = sp.employee_id
+        LEFT JOIN employees_archive a ON a.employee_id = sp.employee_id
+        WHERE sp.valid_during @> CAST(:as_of AS DATE)
+          AND (CAST(:department_id AS INT) IS NULL OR sp.department_id = :department_id)
+        ORDER BY sp.employee_id
+        OFFSET :skip LIMIT :limit
+    """), {"as_of": as_of, "department_id": department_id, "skip": skip, "limit": limit})
+    return {"as_of": as_of, "employees": [dict(row._mapping) for row in result]}
+
+@app.get("/payroll/as-of/departments")
+def get_department_payroll_as_of(
+    as_of: date = Query(..., alias="date"),
+    db: Session = Depends(get_db)
+):
+    """Фонд оплаты труда, численность и средний оклад отделов на дату"""
+    result = db.execute(text("""
+        SELECT sp.department_id, d.department_name,
+               COUNT(*) AS employee_count,
+               SUM(sp.salary) AS salary_fund,
+               ROUND(AVG(sp.salary), 2) AS avg_salary,
+               MIN(sp.salary) AS min_salary,
+               MAX(sp.salary) AS max_salary
+        FROM salary_periods sp
+        LEFT JOIN departments d ON d.department_id = sp.department_id
+        WHERE sp.valid_during @> CAST(:as_of AS DATE)
+        GROUP BY sp.department_id, d.department_name
+        ORDER BY salary_fund DESC
+    """), {"as_of": as_of})
+    departments = [dict(row._mapping) for row in result]
+    return {
+        "as_of": as_of,
+        "total_salary_fund": sum(row["salary_fund"] for row in departments),
+        "departments": departments
+    }
+
+@app.get("/employees/{employee_id}/salary-as-of")
+def get_employee_salary_as_of(
+    employee_id: int,
+    as_of: date = Query(..., alias="date"),
+    db: Session = Depends(get_db)
+):
+    """Оклад и отдел сотрудника на дату"""
+    row = db.execute(text("""
+        SELECT employee_id, department_id, salary,
+               lower(valid_during) AS valid_from,
+               upper(valid_during) AS valid_to
+        FROM salary_periods
+        WHERE employee_id = :employee_id
+          AND valid_during @> CAST(:as_of AS DATE)
+    """), {"employee_id": employee_id, "as_of": as_of}).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Сотрудник на эту дату не работал или не найден")
+    return {"as_of": as_of, **row._mapping}
+
 # ========== БАТЧЕВАЯ ЗАГРУЗКА ДАННЫХ ==========
 
 @app.post("/batch/import-employees")
 async def batch_import_employees(
     file: UploadFile = File(...),
+    bulk: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Батчевая загрузка сотрудников из CSV файла"""
+    """
+    Батчевая загрузка сотрудников из CSV файла.
+    bulk=true - массовый режим (bulk_load.py): проверки по всему файлу, вставка одним
+    запросом без построчных триггеров и их действия одним проходом после вставки
+    """
     results = {
         "success": 0,
         "failed": 0,
@@ -294,11 +607,58 @@ async def batch_import_employees(
     try:
         # Чтение CSV файла
         contents = await file.read()
+        # pandas нужен только импорту: загружается при первом вызове, а не при старте воркера
+        import pandas as pd
         df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
         
         # Логирование начала загрузки
         logger.info(f"Начата обработка файла: {file.filename}, строк: {len(df)}")
         
+        if bulk:
+            def cell(row, column, convert):
+                value = row.get(column)
+                return convert(value) if pd.notna(value) else None
+
+            # Строки для ответа об ошибках: пустые ячейки (NaN) не сериализуются в JSON
+            echoed = df.astype(object).where(pd.notna(df), None)
+            records = []
+            for index, row in df.iterrows():
+                results["total_processed"] += 1
+                try:
+                    hire_date = cell(row, 'hire_date', lambda value: pd.to_datetime(value).date())
+                    salary = cell(row, 'salary', float)
+                    records.append((index + 1, {
+                        "first_name": cell(row, 'first_name', str),
+                        "last_name": cell(row, 'last_name', str),
+                        "email": cell(row, 'email', str),
+                        "hire_date": hire_date or datetime.now().date(),
+                        "salary": salary if salary is not None else 0.0,
+                        "department_id": cell(row, 'department_id', int),
+                        "position_id": cell(row, 'position_id', int),
+                        "manager_id": cell(row, 'manager_id', int)
+                    }))
+                except (ValueError, TypeError) as e:
+                    results["failed"] += 1
+                    results["errors"].append({"row": index + 1, "data": echoed.loc[index].to_dict(),
+                                              "error": f"Строка {index + 1}: {e}"})
+
+            if not records:
+                return results
+            loaded = await run_in_threadpool(bulk_load.import_employees, records)
+            data_by_row = {index + 1: row.to_dict() for index, row in echoed.iterrows()}
+            for row_number, error in loaded["rejected"]:
+                results["failed"] += 1
+                results["errors"].append({
+                    "row": row_number,
+                    "data": data_by_row[row_number],
+                    "error": f"Строка {row_number}: {error}"
+                })
+            results["success"] = loaded["inserted"]
+            results["elapsed_ms"] = loaded["elapsed_ms"]
+            logger.info(f"Массовый импорт завершен за {loaded['elapsed_ms']} мс. "
+                        f"Успешно: {results['success']}, Ошибок: {results['failed']}")
+            return results
+
         for index, row in df.iterrows():
             results["total_processed"] += 1
             
@@ -360,26 +720,699 @@ async def batch_import_employees(
         logger.error(f"Критическая ошибка при импорте: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Ошибка обработки файла: {str(e)}")
 
+# ========== ПРОФИЛИРОВАНИЕ ТРИГГЕРОВ ==========
+
+@app.get("/triggers/profile")
+def get_trigger_profile(table_name: str = None, db: Session = Depends(get_db)):
+    """Накопленные вызовы и время функций триггеров (pg_stat_user_functions) с их триггерами, самые дорогие первыми"""
+    return trigger_profile.cumulative(db, table_name)
+
+@app.post("/triggers/profile/{workload}")
+def run_trigger_profile(workload: str, rows: int = Query(1000, ge=1, le=100000)):
+    """
+    Нагрузка на rows сотрудниках (touch, salary, manager, insert) в транзакции с откатом:
+    время оператора и вызовы, время и доля каждого триггера
+    """
+    if workload not in trigger_profile.WORKLOADS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Неизвестная нагрузка: {workload}. Доступны: {', '.join(trigger_profile.WORKLOADS)}"
+        )
+    try:
+        return trigger_profile.profile(workload, rows)
+    except trigger_profile.TriggerProfileError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 # ========== АУДИТ И ТРИГГЕРЫ ==========
 
+# Столбцы значений, к которым применяются contains и match
+AUDIT_VALUE_COLUMNS = {"new": ["new_values"], "old": ["old_values"], "any": ["new_values", "old_values"]}
+
+def _audit_value_condition(columns: list, operator: str, param: str):
+    # Для "any" - OR по двум столбцам: оба GIN-индекса объединяются через BitmapOr
+    condition = " OR ".join(f"{column} {operator} CAST(:{param} AS {'jsonb' if operator == '@>' else 'jsonpath'})"
+                            for column in columns)
+    return f"({condition})"
+
+def _check_jsonpath(db: Session, jsonpath: str):
+    try:
+        db.execute(text("SELECT CAST(:jsonpath AS jsonpath)"), {"jsonpath": jsonpath})
+    except DBAPIError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Некорректное выражение JSONPath: {e.orig}")
+
+def _audit_changes(operation: str, old_values: dict, new_values: dict):
+    """Измененные поля записи аудита: {поле: {"old": ..., "new": ...}}"""
+    old_values, new_values = old_values or {}, new_values or {}
+    return {
+        field: {"old": old_values.get(field), "new": new_values.get(field)}
+        for field in sorted(old_values.keys() | new_values.keys())
+        if operation != "UPDATE" or old_values.get(field) != new_values.get(field)
+    }
+
 @app.get("/audit/logs")
 def get_audit_logs(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=10000),
     table_name: str = None,
     action: str = None,
+    record_id: int = None,
+    changed_by: int = None,
+    since: datetime = None,
+    until: datetime = None,
+    contains: str = None,
+    match: str = None,
+    values: str = Query("new", pattern="^(new|old|any)$"),
+    crossed: float = None,
+    crossed_field: str = Query("salary", pattern=r"^\w+$"),
+    crossed_direction: str = Query("up", pattern="^(up|down)$"),
+    before_log_id: int = None,
+    include_values: bool = True,
     db: Session = Depends(get_db)
 ):
-    """Получить журнал аудита с фильтрацией"""
-    query = db.query(models.AuditLog)
-    
+    """
+    Поиск по журналу аудита, новые записи первыми.
+    contains - JSON-фрагмент значений (оператор @>), match - JSONPath-предикат
+    (оператор @@, например $.department_id == 3); values - к каким значениям
+    они применяются (new, old, any). Оба обслуживаются GIN-индексами, для
+    JSONPath - только условия равенства. crossed - изменения, где числовое поле
+    crossed_field пересекло порог вверх (up) или вниз (down).
+    before_log_id - продолжение выдачи с места, где закончилась предыдущая страница.
+    """
+    conditions, params = [], {"skip": skip, "limit": limit}
+    if crossed is not None and table_name is None:
+        table_name = "employees"
     if table_name:
-        query = query.filter(models.AuditLog.table_name == table_name)
+        conditions.append("table_name = :table_name")
+        params["table_name"] = table_name
     if action:
-        query = query.filter(models.AuditLog.action == action)
-    
-    logs = query.order_by(models.AuditLog.changed_at.desc()).offset(skip).limit(limit).all()
-    return logs
+        conditions.append("operation_type = :action")
+        params["action"] = action.upper()
+    if record_id is not None:
+        conditions.append("record_id = :record_id")
+        params["record_id"] = record_id
+    if changed_by is not None:
+        conditions.append("changed_by = :changed_by")
+        params["changed_by"] = changed_by
+    if since is not None:
+        conditions.append("changed_at >= :since")
+        params["since"] = since
+    if until is not None:
+        conditions.append("changed_at < :until")
+        params["until"] = until
+    if before_log_id is not None:
+        conditions.append("log_id < :before_log_id")
+        params["before_log_id"] = before_log_id
+    if contains:
+        try:
+            params["contains"] = json.dumps(json.loads(contains))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="contains должен быть JSON-объектом")
+        conditions.append(_audit_value_condition(AUDIT_VALUE_COLUMNS[values], "@>", "contains"))
+    if match:
+        _check_jsonpath(db, match)
+        params["match"] = match
+        conditions.append(_audit_value_condition(AUDIT_VALUE_COLUMNS[values], "@@", "match"))
+    if crossed is not None:
+        # Выражение совпадает с индексом idx_audit_employee_new_salary (для поля salary)
+        new_value, old_value = "(new_values ->> :crossed_field)::NUMERIC", "(old_values ->> :crossed_field)::NUMERIC"
+        if crossed_direction == "up":
+            conditions.append(f"{new_value} >= :crossed AND COALESCE({old_value} < :crossed, TRUE)")
+        else:
+            conditions.append(f"{new_value} < :crossed AND {old_value} >= :crossed")
+        params["crossed"] = crossed
+        params["crossed_field"] = crossed_field
+
+    value_columns = ", old_values, new_values" if include_values else ""
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    result = db.execute(text(f"""
+        SELECT log_id, table_name, record_id, operation_type, changed_by, changed_at{value_columns}
+        FROM audit_log
+        {where}
+        ORDER BY log_id DESC
+        OFFSET :skip LIMIT :limit
+    """), params)
+    return [dict(row._mapping) for row in result]
+
+@app.get("/audit/records/{table_name}/{record_id}")
+def get_audit_record_timeline(
+    table_name: str,
+    record_id: int,
+    since: datetime = None,
+    until: datetime = None,
+    skip: int = 0,
+    limit: int = Query(500, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """
+    История одной записи в порядке времени: для каждого изменения - только
+    измененные поля со старым и новым значением (индекс idx_audit_record_timeline)
+    """
+    result = db.execute(text("""
+        SELECT log_id, operation_type, changed_by, changed_at, old_values, new_values
+        FROM audit_log
+        WHERE table_name = :table_name
+          AND record_id = :record_id
+          AND (CAST(:since AS TIMESTAMP) IS NULL OR changed_at >= :since)
+          AND (CAST(:until AS TIMESTAMP) IS NULL OR changed_at < :until)
+        ORDER BY changed_at, log_id
+        OFFSET :skip LIMIT :limit
+    """), {"table_name": table_name, "record_id": record_id, "since": since, "until": until,
+           "skip": skip, "limit": limit})
+    events = [
+        {
+            "log_id": row.log_id,
+            "operation": row.operation_type,
+            "changed_by": row.changed_by,
+            "changed_at": row.changed_at,
+            "changes": _audit_changes(row.operation_type, row.old_values, row.new_values)
+        }
+        for row in result
+    ]
+    return {"table_name": table_name, "record_id": record_id, "skip": skip, "events": events}
+
+@app.get("/audit/changes")
+async def stream_audit_changes(
+    request: Request,
+    table_name: str = None,
+    after: int = Query(None, ge=0),
+    last_event_id: str = Header(None)
+):
+    """
+    Лента изменений (Server-Sent Events): событие на каждую запись audit_log.
+    Токен возобновления - id события ("log_id:граница"); при переподключении браузер
+    передает его в Last-Event-ID, другие клиенты - тоже в Last-Event-ID или log_id в after
+    (без окна повторного чтения). Повторы после переподключения отбрасываются по log_id.
+    """
+    if not CHANGE_FEED_ENABLED:
+        raise HTTPException(status_code=503, detail="Лента изменений выключена (CHANGE_FEED_ENABLED=false)")
+    since = None
+    if last_event_id:
+        try:
+            after, since = parse_token(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID должен быть id события ленты")
+    subscriber = CHANGE_FEED.subscribe(table_name, after, since)
+    return StreamingResponse(
+        CHANGE_FEED.events(subscriber, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/audit/changes/stats")
+def get_change_feed_stats():
+    """Слушатель ленты изменений: подписчики, полученные уведомления, последний log_id"""
+    return CHANGE_FEED.stats()
+
+# ========== АРХИВ СОТРУДНИКОВ ==========
+
+# Давно уволенные переносятся из employees в employees_archive (17_employee_archive.sql),
+# и сканирования действующих сотрудников не растут вместе с возрастом компании
+
+@app.post("/archive/employees")
+def archive_inactive_employees(
+    min_inactive_days: int = Query(365, ge=0),
+    batch_size: int = Query(1000, ge=1, le=100000),
+    db: Session = Depends(get_db)
+):
+    """Перенести в архив сотрудников, уволенных больше min_inactive_days дней назад"""
+    archived = db.execute(
+        text("SELECT archive_inactive_employees(:min_inactive_days, :batch_size)"),
+        {"min_inactive_days": min_inactive_days, "batch_size": batch_size}
+    ).scalar()
+    db.commit()
+    return {"archived": archived, "min_inactive_days": min_inactive_days, "batch_size": batch_size}
+
+@app.post("/archive/employees/{employee_id}/restore")
+def restore_archived_employee(employee_id: int, db: Session = Depends(get_db)):
+    """Вернуть сотрудника из архива в employees (остается неактивным до изменения is_active)"""
+    try:
+        restored = db.execute(
+            text("SELECT restore_archived_employee(:employee_id)"), {"employee_id": employee_id}
+        ).scalar()
+        db.commit()
+    except DBAPIError as e:
+        db.rollback()
+        # Например, email уже занят новым сотрудником
+        raise HTTPException(status_code=409, detail=f"Не удалось вернуть сотрудника: {e.orig}")
+    if not restored:
+        raise HTTPException(status_code=404, detail="Сотрудника нет в архиве")
+    return {"message": "Сотрудник возвращен из архива", "employee_id": employee_id}
+
+@app.get("/archive/stats")
+def get_archive_stats(db: Session = Depends(get_db)):
+    """Размер горячей таблицы и архива: строки и занимаемое место с индексами"""
+    row = db.execute(text("""
+        SELECT
+            (SELECT COUNT(*) FROM employees WHERE is_active) AS active_employees,
+            (SELECT COUNT(*) FROM employees WHERE NOT is_active) AS inactive_in_hot_table,
+            (SELECT COUNT(*) FROM employees_archive) AS archived_employees,
+            (SELECT MAX(archived_at) FROM employees_archive) AS last_archived_at,
+            pg_total_relation_size('employees') AS hot_table_bytes,
+            pg_total_relation_size('employees_archive') AS archive_bytes
+    """)).first()
+    return dict(row._mapping)
+
+# ========== ОТПУСКА: ДОСТУПНОСТЬ И КОНФЛИКТЫ ==========
+
+# Максимальная длина периода для тепловой карты доступности
+AVAILABILITY_MAX_DAYS = 366
+# Статусы отпусков, при которых сотрудник считается отсутствующим
+ABSENCE_STATUSES = ['approved', 'taken']
+# Максимум сотрудников в одном запросе остатков отпуска
+VACATION_BALANCES_MAX_EMPLOYEES = 10000
+
+def _absence_by_day(db: Session, department_id: int, start_date: date, end_date: date, statuses: list,
+                    exclude_employee_id: int = None):
+    """
+    Число отсутствующих сотрудников отдела по дням периода.
+    Пересечение периодов ищется по GiST-индексу (оператор &&), поэтому читаются
+    только отпуска, попадающие в период, а не все отпуска отдела.
+    """
+    result = db.execute(text("""
+        SELECT day::date AS day, COUNT(DISTINCT v.employee_id) AS absent
+        FROM vacations v
+        JOIN employees e ON e.employee_id = v.employee_id
+        CROSS JOIN LATERAL generate_series(
+            GREATEST(lower(v.period), CAST(:start_date AS date)),
+            LEAST(upper(v.period) - 1, CAST(:end_date AS date)),
+            INTERVAL '1 day'
+        ) AS day
+        WHERE v.period && daterange(CAST(:start_date AS date), CAST(:end_date AS date), '[]')
+          AND v.status = ANY(:statuses)
+          AND e.department_id = :department_id
+          AND e.is_active = TRUE
+          AND (CAST(:exclude_employee_id AS int) IS NULL OR v.employee_id <> :exclude_employee_id)
+        GROUP BY day
+    """), {
+        "department_id": department_id,
+        "exclude_employee_id": exclude_employee_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "statuses": statuses
+    })
+    return {row.day: row.absent for row in result}
+
+def _department_headcount(db: Session, department_id: int) -> int:
+    return db.execute(
+        text("SELECT COUNT(*) FROM employees WHERE department_id = :department_id AND is_active = TRUE"),
+        {"department_id": department_id}
+    ).scalar()
+
+@app.get("/vacations/availability")
+def get_team_availability(
+    department_id: int,
+    start_date: date,
+    end_date: date,
+    include_requested: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Тепловая карта доступности отдела: число отсутствующих и доля присутствующих по дням"""
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Дата окончания должна быть не раньше даты начала")
+    if (end_date - start_date).days + 1 > AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Период не может превышать {AVAILABILITY_MAX_DAYS} дней")
+
+    headcount = _department_headcount(db, department_id)
+    if headcount == 0:
+        raise HTTPException(status_code=404, detail="В отделе нет активных сотрудников")
+
+    statuses = ABSENCE_STATUSES + (['requested'] if include_requested else [])
+    absent_by_day = _absence_by_day(db, department_id, start_date, end_date, statuses)
+
+    days = []
+    day = start_date
+    while day <= end_date:
+        absent = absent_by_day.get(day, 0)
+        days.append({
+            "date": day.isoformat(),
+            "absent": absent,
+            "available": headcount - absent,
+            "available_percent": round((headcount - absent) * 100 / headcount, 1)
+        })
+        day += timedelta(days=1)
+
+    return {
+        "department_id": department_id,
+        "headcount": headcount,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "statuses": statuses,
+        "min_available_percent": min(d["available_percent"] for d in days),
+        "days": days
+    }
+
+@app.get("/vacations/conflicts")
+def check_vacation_conflicts(
+    employee_id: int,
+    start_date: date,
+    end_date: date,
+    max_absent_percent: float = Query(30, ge=0, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Проверка отпуска перед согласованием: пересечения с отпусками самого сотрудника
+    и коллег по отделу, а также доля отсутствующих в отделе с учетом нового отпуска
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Дата окончания должна быть не раньше даты начала")
+    if (end_date - start_date).days + 1 > AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Период не может превышать {AVAILABILITY_MAX_DAYS} дней")
+
+    employee = db.execute(
+        text("SELECT employee_id, department_id FROM employees WHERE employee_id = :employee_id"),
+        {"employee_id": employee_id}
+    ).first()
+    if not employee:
+        raise HTTPException(status_code=404, detail="Сотрудник не найден")
+
+    overlaps = db.execute(text("""
+        SELECT
+            v.vacation_id,
+            v.employee_id,
+            e.first_name || ' ' || e.last_name AS employee_name,
+            v.start_date,
+            v.end_date,
+            v.vacation_type,
+            v.status
+        FROM vacations v
+        JOIN employees e ON e.employee_id = v.employee_id
+        WHERE v.period && daterange(CAST(:start_date AS date), CAST(:end_date AS date), '[]')
+          AND v.status IN ('requested', 'approved', 'taken')
+          AND (v.employee_id = :employee_id OR (e.department_id = :department_id AND e.is_active = TRUE))
+        ORDER BY v.start_date, v.employee_id
+    """), {
+        "employee_id": employee_id,
+        "department_id": employee.department_id,
+        "start_date": start_date,
+        "end_date": end_date
+    })
+
+    own_conflicts, team_overlaps = [], []
+    for row in overlaps:
+        item = dict(row._mapping)
+        (own_conflicts if row.employee_id == employee_id else team_overlaps).append(item)
+
+    # Пиковая доля отсутствующих, если отпуск будет утвержден
+    headcount = _department_headcount(db, employee.department_id)
+    absent_by_day = _absence_by_day(
+        db, employee.department_id, start_date, end_date, ABSENCE_STATUSES, exclude_employee_id=employee_id
+    )
+    peak_absent = max(absent_by_day.values(), default=0) + 1
+    peak_absent_percent = round(peak_absent * 100 / headcount, 1) if headcount else 100.0
+
+    # Утвержденные пересечения у самого сотрудника запрещены ограничением excl_vacations_no_overlap
+    blocking = [row for row in own_conflicts if row["status"] in ABSENCE_STATUSES]
+    return {
+        "employee_id": employee_id,
+        "department_id": employee.department_id,
+        "can_approve": not blocking and peak_absent_percent <= max_absent_percent,
+        "own_conflicts": own_conflicts,
+        "team_overlaps": team_overlaps,
+        "department_headcount": headcount,
+        "peak_absent": peak_absent,
+        "peak_absent_percent": peak_absent_percent,
+        "max_absent_percent": max_absent_percent
+    }
+
+@app.get("/vacations/balances")
+def get_vacation_balances(
+    department_id: int = None,
+    employee_ids: list[int] = Query(None),
+    year: int = None,
+    skip: int = 0,
+    limit: int = Query(1000, ge=1, le=VACATION_BALANCES_MAX_EMPLOYEES),
+    db: Session = Depends(get_db)
+):
+    """
+    Остатки отпуска для списка сотрудников, отдела или всей компании.
+    Считаются одним запросом на страницу сотрудников; результаты кэшируются
+    по сотруднику и году и сбрасываются только при изменении его отпусков.
+    """
+    year = year or date.today().year
+    page_ids = db.execute(text("""
+        SELECT employee_id
+        FROM employees
+        WHERE (CAST(:employee_ids AS int[]) IS NULL OR employee_id = ANY(:employee_ids))
+          AND (CAST(:department_id AS int) IS NULL OR department_id = :department_id)
+        ORDER BY employee_id
+        OFFSET :skip LIMIT :limit
+    """), {
+        "employee_ids": employee_ids,
+        "department_id": department_id,
+        "skip": skip,
+        "limit": limit
+    }).scalars().all()
+
+    balances = {}
+    if page_ids:
+        result = db.execute(
+            text("SELECT * FROM get_vacation_balances(:employee_ids, NULL, :year)"),
+            {"employee_ids": list(page_ids), "year": year}
+        )
+        for row in result:
+            item = balances.setdefault(row.employee_id, {"employee_id": row.employee_id, "by_type": {}})
+            values = {
+                "days_taken": row.days_taken,
+                "days_planned": row.days_planned,
+                "days_remaining": row.days_remaining,
+                "total_entitled": row.total_entitled
+            }
+            if row.vacation_type == 'total':
+                item.update(values)
+            else:
+                item["by_type"][row.vacation_type] = values
+        # Функция дозаполняет кэш остатков
+        db.commit()
+
+    return {
+        "year": year,
+        "skip": skip,
+        "limit": limit,
+        "count": len(balances),
+        "employees": list(balances.values())
+    }
+
+# ========== ПОРТФЕЛЬ ПРОЕКТОВ ==========
+
+@app.get("/projects/portfolio")
+def get_project_portfolio(
+    project_status: str = Query(None, alias="status"),
+    refresh: bool = False,
+    overallocated_limit: int = Query(100, ge=0, le=10000),
+    db: Session = Depends(get_db)
+):
+    """
+    Стоимость всех проектов, остаток бюджета и перегруженные сотрудники.
+    Читается из сводки project_cost_summary, которую триггеры обновляют при изменении
+    назначений и окладов; полный пересчет (один проход) - при refresh=true
+    или если сводка устарела.
+    """
+    stale = db.execute(text("""
+        SELECT EXISTS (
+            SELECT 1
+            FROM projects p
+            LEFT JOIN project_cost_summary s ON s.project_id = p.project_id
+            WHERE s.project_id IS NULL OR s.refreshed_on < CURRENT_DATE
+        )
+    """)).scalar()
+    if refresh or stale:
+        db.execute(text("SELECT refresh_project_cost_summary()"))
+        db.commit()
+
+    projects = db.execute(text("""
+        SELECT
+            p.project_id,
+            p.project_name,
+            p.status,
+            d.department_name,
+            p.budget,
+            s.team_members,
+            s.monthly_hr_cost,
+            p.budget - s.monthly_hr_cost as remaining_budget,
+            ROUND(s.monthly_hr_cost * 100.0 / NULLIF(p.budget, 0), 2) as budget_used_percent,
+            s.overallocated_members
+        FROM projects p
+        JOIN project_cost_summary s ON s.project_id = p.project_id
+        LEFT JOIN departments d ON d.department_id = p.department_id
+        WHERE CAST(:status AS varchar) IS NULL OR p.status = :status
+        ORDER BY s.monthly_hr_cost DESC, p.project_id
+    """), {"status": project_status})
+    projects = [dict(row._mapping) for row in projects]
+
+    overallocated = db.execute(text("""
+        SELECT
+            e.employee_id,
+            e.first_name || ' ' || e.last_name as employee_name,
+            e.department_id,
+            SUM(ep.participation_percentage) as total_allocation,
+            array_agg(ep.project_id ORDER BY ep.project_id) as project_ids
+        FROM employee_projects ep
+        JOIN employees e ON e.employee_id = ep.employee_id
+        WHERE (ep.end_date IS NULL OR ep.end_date >= CURRENT_DATE)
+          AND e.is_active = TRUE
+        GROUP BY e.employee_id, e.first_name, e.last_name, e.department_id
+        HAVING SUM(ep.participation_percentage) > 100
+        ORDER BY total_allocation DESC, e.employee_id
+        LIMIT :limit
+    """), {"limit": overallocated_limit})
+
+    return {
+        "total_budget": sum(p["budget"] or 0 for p in projects),
+        "total_monthly_hr_cost": sum(p["monthly_hr_cost"] for p in projects),
+        "projects_with_overallocation": sum(1 for p in projects if p["overallocated_members"]),
+        "projects": projects,
+        "overallocated_employees": [dict(row._mapping) for row in overallocated]
+    }
+
+# ========== ПОДБОР СОТРУДНИКОВ ПО НАВЫКАМ ==========
+
+PROFICIENCY_RANKS = {'beginner': 1, 'intermediate': 2, 'advanced': 3, 'expert': 4}
+
+def _parse_skill_requirement(value: str):
+    """Требование к навыку в формате "skill_id" или "skill_id:уровень" (advanced или 3)"""
+    skill, _, level = value.partition(":")
+    try:
+        skill_id = int(skill)
+        if not level:
+            return skill_id, 1
+        rank = PROFICIENCY_RANKS.get(level.lower()) or int(level)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Некорректное требование к навыку: {value}")
+    if rank not in PROFICIENCY_RANKS.values():
+        raise HTTPException(status_code=400, detail=f"Уровень владения должен быть от 1 до 4: {value}")
+    return skill_id, rank
+
+@app.get("/staffing/search")
+def search_staffing_candidates(
+    skill: list[str] = Query(..., description="Навык: skill_id или skill_id:уровень, можно несколько"),
+    mode: str = Query("all", pattern="^(all|any)$"),
+    certified_only: bool = False,
+    department_id: int = None,
+    limit: int = Query(20, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    Подбор сотрудников по навыкам: все (mode=all) или любые (mode=any) из навыков
+    с минимальным уровнем владения. Кандидаты ранжируются по покрытию запроса.
+    """
+    requirements = [_parse_skill_requirement(value) for value in skill]
+    result = db.execute(text("""
+        SELECT *
+        FROM search_staffing_candidates(
+            CAST(:skill_ids AS int[]), CAST(:min_levels AS int[]),
+            :match_all, :certified_only, :department_id, :limit
+        )
+    """), {
+        "skill_ids": [skill_id for skill_id, _ in requirements],
+        "min_levels": [rank for _, rank in requirements],
+        "match_all": mode == "all",
+        "certified_only": certified_only,
+        "department_id": department_id,
+        "limit": limit
+    })
+    return {
+        "mode": mode,
+        "requirements": [{"skill_id": skill_id, "min_level": rank} for skill_id, rank in requirements],
+        "candidates": [dict(row._mapping) for row in result]
+    }
+
+# ========== ОРГСТРУКТУРА (СНИМОК В ПАМЯТИ) ==========
+
+def _org_snapshot():
+    if not ORG_CHART.ready:
+        raise HTTPException(status_code=503, detail="Снимок оргструктуры не загружен")
+    return ORG_CHART.snapshot
+
+@app.get("/org-chart/stats")
+def get_org_chart_stats():
+    """Состояние снимка оргструктуры: размер, глубина, занимаемая память, обновления"""
+    return ORG_CHART.stats()
+
+@app.get("/org-chart/analytics")
+def get_org_chart_analytics(
+    span_threshold: int = Query(10, ge=0),
+    limit: int = Query(50, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """
+    Аналитика оргструктуры по всей компании: норма управляемости, глубина и
+    численность отделов, подчинение руководителю из другого отдела и проверки
+    departments.manager_id. Считается за один проход и кэшируется до изменения иерархии.
+    """
+    if ORG_CHART.ready:
+        return ORG_ANALYTICS.get(ORG_CHART, span_threshold, limit)
+    # Снимок не загружен (ORG_CHART_ENABLED=false): разовое чтение дерева без кэша
+    snapshot, department_managers = load_hierarchy(db.connection())
+    return compute_org_analytics(snapshot, department_managers, span_threshold, limit)
+
+@app.get("/org-chart/{employee_id}")
+def get_org_chart_node(employee_id: int):
+    """Глубина, число прямых и всех подчиненных и цепочка руководителей сотрудника"""
+    snapshot = _org_snapshot()
+    if employee_id not in snapshot:
+        raise HTTPException(status_code=404, detail="Сотрудник не найден")
+    node = snapshot.describe(employee_id)
+    node["direct_reports"] = snapshot.direct_reports(employee_id)
+    return node
+
+@app.get("/org-chart/{employee_id}/subordinates")
+def get_org_chart_subordinates(
+    employee_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=100000)
+):
+    """Все подчиненные сотрудника (ID и уровень) в порядке обхода дерева"""
+    snapshot = _org_snapshot()
+    if employee_id not in snapshot:
+        raise HTTPException(status_code=404, detail="Сотрудник не найден")
+    return {
+        "employee_id": employee_id,
+        "total": snapshot.subtree_size(employee_id),
+        "skip": skip,
+        "limit": limit,
+        "subordinates": [
+            {"employee_id": subordinate_id, "level": level}
+            for subordinate_id, level in snapshot.subordinates(employee_id, skip, limit)
+        ]
+    }
+
+# ========== ВЫГРУЗКА ДАННЫХ ==========
+
+@app.get("/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    export_format: str = Query("csv", alias="format"),
+    since: str = None
+):
+    """
+    Потоковая выгрузка таблицы для хранилища данных: CSV через COPY TO STDOUT,
+    Parquet и Arrow IPC пачками из серверного курсора. since - водяной знак
+    прошлой выгрузки; новый возвращается в заголовке X-Export-Watermark.
+    """
+    spec = exports.EXPORTS.get(dataset)
+    if spec is None:
+        raise HTTPException(status_code=404, detail=f"Неизвестный набор данных. Доступны: {', '.join(exports.EXPORTS)}")
+    if export_format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат должен быть одним из: {', '.join(exports.FORMATS)}")
+    if export_format != "csv" and not exports.arrow_available():
+        raise HTTPException(status_code=501, detail="Для выгрузки в Parquet/Arrow нужен пакет pyarrow")
+    try:
+        since_value = exports.parse_watermark(spec, since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Некорректный водяной знак since: {since}")
+
+    try:
+        export = exports.Export(spec, since_value)
+    except exports.ExportNotReadyError as e:
+        retry_after = max(1, exports.EXPORT_WRITER_WAIT_MS // 1000)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(retry_after)})
+    headers = {
+        "Content-Disposition": f'attachment; filename="{dataset}.{exports.EXTENSIONS[export_format]}"',
+        "X-Export-Watermark": export.watermark or "",
+        "X-Export-Since": since or "",
+    }
+    return StreamingResponse(exports.stream(export, export_format), media_type=exports.FORMATS[export_format], headers=headers)
 
 # ========== ПРОВЕРКА РАБОТЫ СИСТЕМЫ ==========
 
@@ -392,8 +1425,18 @@ def root():
             "employees": "/employees/",
             "departments": "/departments/",
             "reports": "/reports/",
+            "payroll_as_of": "/payroll/as-of/departments?date=2025-06-30",
             "batch_import": "/batch/import-employees",
-            "audit": "/audit/logs"
+            "audit": "/audit/logs",
+            "audit_changes": "/audit/changes",
+            "archive": "/archive/stats",
+            "vacations": "/vacations/availability",
+            "portfolio": "/projects/portfolio",
+            "staffing": "/staffing/search",
+            "org_chart": "/org-chart/stats",
+            "org_analytics": "/org-chart/analytics",
+            "export": "/export/employees?format=parquet",
+            "metrics": "/metrics"
         }
     }
 
@@ -420,6 +1463,11 @@ def health_check(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка системы: {str(e)}")
 
+@app.get("/database/pool")
+def get_database_pool():
+    """Статистика пула соединений: загрузка, очередь, возраст соединений, рекомендации"""
+    return get_pool_status()
+
 @app.get("/database/info")
 def get_database_info(db: Session = Depends(get_db)):
     """Получить информацию о структуре базы данных"""
@@ -447,4 +1495,71 @@ def get_database_info(db: Session = Depends(get_db)):
         "tables": tables,
         "views": views,
         "timestamp": datetime.now().isoformat()
-    }
\ No newline at end of file
+    }
+
+@app.get("/database/indexes")
+def get_index_advice(min_days: float = Query(None, ge=0), sql: bool = False, db: Session = Depends(get_db)):
+    """
+    Советник по индексам: дубликаты, префиксы и неиспользуемые индексы с оценкой экономии
+    записи, недостающие индексы для запросов эндпоинтов и внешних ключей.
+    sql=true - скрипт DROP/CREATE INDEX CONCURRENTLY
+    """
+    report = index_advisor.advise(db, min_days)
+    if sql:
+        return PlainTextResponse(index_advisor.render_sql(report))
+    return report
+
+# ========== МЕТРИКИ ПРОИЗВОДИТЕЛЬНОСТИ ==========
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/statements")
+def get_statement_metrics(limit: int = 50):
+    """Статистика по SQL-запросам (отпечаткам), отсортированная по суммарному времени"""
+    return metrics.get_statements()[:limit]
+
+@app.get("/metrics/slow-queries")
+def get_slow_queries(limit: int = 50):
+    """Журнал медленных запросов: текст, параметры и план выполнения"""
+    return {
+        "threshold_ms": metrics.SLOW_QUERY_THRESHOLD_MS,
+        "queries": metrics.get_slow_queries()[:limit]
+    }
+
+@app.get("/metrics/prepared")
+def get_prepared_statements(measure: bool = False, db: Session = Depends(get_db)):
+    """
+    Подготовленные запросы отчетов: подготовки, выполнения, попадания в кэш.
+    measure=true замеряет время планирования обычного и подготовленного запроса
+    (с параметрами последнего выполнения) и оценивает сэкономленное время
+    """
+    if measure and PREPARED.enabled:
+        for name, query in PREPARED.queries.items():
+            if query.last_params is None and query.params:
+                continue
+            try:
+                PREPARED.measure_planning(db, name)
+            except Exception as e:
+                db.rollback()
+                logger.warning("Не удалось замерить планирование %s: %s", name, e)
+    return PREPARED.stats()
+
+@app.get("/metrics/encodings")
+def get_encoding_metrics():
+    """Средний размер ответа по форматам (JSON, Arrow, MessagePack) и алгоритмам сжатия, время кодирования"""
+    return negotiation.stats()
+
+@app.get("/metrics/startup")
+def get_startup_profile():
+    """Этапы запуска процесса, время до готовности, тяжелые модули и RSS воркеров"""
+    return startup_profile.report()
+
+startup_profile.mark("routes")
+
+@app.on_event("startup")
+def startup_complete():
+    # Регистрируется последним: отметка готовности после остальных startup-обработчиков
+    startup_profile.mark_ready()
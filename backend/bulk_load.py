@@ -0,0 +1,136 @@
+"""
+Массовая загрузка сотрудников без построчных триггеров.
+
+Обычный импорт (/batch/import-employees) вставляет строки по одной, и каждая проходит
+все триггеры employees. Здесь строки сначала копируются (COPY) во временную таблицу
+и проверяются запросами по всему набору: обязательные поля и формат email, уникальность
+email, существование отдела, должности и руководителя, бюджет отдела. Ошибочные строки
+возвращаются с причиной, как в обычном импорте, а остальные вставляются одним
+INSERT ... SELECT в массовом режиме (21_employees_bulk_mode.sql): триггеры отключены,
+а employees_bulk_finish() затем один раз выполняет проверки и записи триггеров
+(аудит, реестр, периоды окладов, уведомления). Все это - одна транзакция.
+"""
+import csv
+import io
+import time
+
+from sqlalchemy import text
+
+from database import engine
+
+IMPORT_COLUMNS = ("first_name", "last_name", "email", "hire_date", "salary",
+                  "department_id", "position_id", "manager_id")
+
+_CREATE_STAGING = """
+    CREATE TEMP TABLE employees_import (
+        row_number INT PRIMARY KEY,
+        first_name VARCHAR(100),
+        last_name VARCHAR(100),
+        email VARCHAR(255),
+        hire_date DATE,
+        salary DECIMAL(12, 2),
+        department_id INT,
+        position_id INT,
+        manager_id INT,
+        error TEXT
+    ) ON COMMIT DROP
+"""
+
+# Проверки по порядку; каждая отмечает еще не отклоненные строки.
+# Бюджет проверяется нарастающим итогом в порядке файла, как при построчной вставке
+# (строгая оценка: отклоненная по бюджету строка учитывается в итоге следующих)
+_VALIDATIONS = (
+    """UPDATE employees_import SET error = 'Отсутствуют обязательные поля'
+       WHERE error IS NULL AND (first_name IS NULL OR last_name IS NULL OR email IS NULL
+                                OR salary IS NULL OR department_id IS NULL OR position_id IS NULL)""",
+    """UPDATE employees_import SET error = 'Неверный формат email'
+       WHERE error IS NULL AND email !~* '^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\\.[A-Za-z]{2,}$'""",
+    """UPDATE employees_import SET error = 'Зарплата не может быть отрицательной'
+       WHERE error IS NULL AND salary < 0""",
+    """UPDATE employees_import SET error = 'Дата найма не может быть в будущем'
+       WHERE error IS NULL AND hire_date > CURRENT_DATE""",
+    """UPDATE employees_import s SET error = 'Email ' || s.email || ' уже существует'
+       WHERE s.error IS NULL
+         AND (EXISTS (SELECT 1 FROM employees e WHERE e.email = s.email)
+              OR EXISTS (SELECT 1 FROM employees_import d
+                         WHERE d.email = s.email AND d.row_number < s.row_number AND d.error IS NULL))""",
+    """UPDATE employees_import s SET error = 'Отдел ' || s.department_id || ' не существует'
+       WHERE s.error IS NULL AND NOT EXISTS (SELECT 1 FROM departments d WHERE d.department_id = s.department_id)""",
+    """UPDATE employees_import s SET error = 'Должность ' || s.position_id || ' не существует'
+       WHERE s.error IS NULL AND NOT EXISTS (SELECT 1 FROM positions p WHERE p.position_id = s.position_id)""",
+    """UPDATE employees_import s SET error = 'Руководитель ' || s.manager_id || ' не существует'
+       WHERE s.error IS NULL AND s.manager_id IS NOT NULL
+         AND NOT EXISTS (SELECT 1 FROM employees e WHERE e.employee_id = s.manager_id)""",
+    """UPDATE employees_import s SET error = 'Превышен бюджет отдела ' || s.department_id
+       FROM (
+           SELECT i.row_number,
+                  COALESCE(f.salary_sum, 0)
+                      + SUM(i.salary) OVER (PARTITION BY i.department_id ORDER BY i.row_number) AS salary_sum,
+                  d.budget
+           FROM employees_import i
+           JOIN departments d ON d.department_id = i.department_id
+           LEFT JOIN (
+               SELECT department_id, SUM(salary) AS salary_sum
+               FROM employees
+               WHERE is_active = TRUE
+               GROUP BY department_id
+           ) f ON f.department_id = i.department_id
+           WHERE i.error IS NULL
+       ) running
+       WHERE running.row_number = s.row_number AND running.salary_sum > running.budget * 0.7""",
+)
+
+_INSERT_VALID = f"""
+    INSERT INTO employees ({", ".join(IMPORT_COLUMNS)})
+    SELECT {", ".join(IMPORT_COLUMNS)}
+    FROM employees_import
+    WHERE error IS NULL
+    ORDER BY row_number
+"""
+
+
+def _copy_rows(connection, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_number, record in records:
+        writer.writerow([row_number] + [record.get(column) for column in IMPORT_COLUMNS])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY employees_import (row_number, {', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def import_employees(records):
+    """
+    Загрузка записей [(номер строки, {столбец: значение})] в массовом режиме.
+    Возвращает номера и причины отклоненных строк и число вставленных.
+    """
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        try:
+            connection.execute(text(_CREATE_STAGING))
+            _copy_rows(connection, records)
+            for statement in _VALIDATIONS:
+                connection.execute(text(statement))
+            rejected = connection.execute(
+                text("SELECT row_number, error FROM employees_import WHERE error IS NOT NULL ORDER BY row_number")
+            ).all()
+
+            connection.execute(text("SELECT employees_bulk_begin()"))
+            connection.execute(text(_INSERT_VALID))
+            finished = connection.execute(text("SELECT * FROM employees_bulk_finish()")).first()
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+    return {
+        "inserted": finished.inserted,
+        "rejected": [(row.row_number, row.error) for row in rejected],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
@@ -0,0 +1,329 @@
+"""
+Лента изменений audit_log для внешних систем (Server-Sent Events).
+
+Вместо опроса /audit/logs со смещением подписчик держит одно соединение
+GET /audit/changes. Каждая запись аудита публикуется триггером в канал
+audit_changes (14_audit_change_feed.sql); один слушатель на процесс принимает
+уведомления в цикле asyncio (сокет psycopg2 через loop.add_reader) и раздает
+их очередям подписчиков.
+
+Токен возобновления (поле id в SSE, заголовок Last-Event-ID при переподключении) -
+"log_id:время": наибольший доставленный log_id и граница открытых транзакций.
+log_id выдается последовательностью, а не в порядке фиксации: запись с меньшим log_id
+может зафиксироваться после уже доставленной с большим. Такие записи получают
+changed_at не раньше начала своей транзакции, поэтому при возобновлении, кроме
+log_id > токена (по первичному ключу), повторно читается окно changed_at >= границы.
+Доставка при переподключении - "хотя бы один раз": события окна могут повториться,
+клиент отбрасывает повторы по log_id.
+Тот же догоняющий запрос выполняется, если очередь подписчика переполнилась
+(медленный клиент) или слушатель переподключался к базе.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANGE_FEED_ENABLED = os.getenv("CHANGE_FEED_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+CHANGE_FEED_CHANNEL = "audit_changes"
+# Событий в очереди одного подписчика; при переполнении - догоняющий запрос из таблицы
+CHANGE_FEED_QUEUE_SIZE = int(os.getenv("CHANGE_FEED_QUEUE_SIZE", "1000"))
+# Комментарий-пульс, чтобы прокси не закрывали простаивающее соединение
+CHANGE_FEED_HEARTBEAT_SECONDS = 15
+CHANGE_FEED_CATCHUP_BATCH = 1000
+CHANGE_FEED_RECONNECT_SECONDS = 5
+# Как часто обновлять границу открытых транзакций для токенов возобновления
+CHANGE_FEED_HORIZON_SECONDS = 5
+
+EVENTS = metrics.REGISTRY.counter(
+    "change_feed_events_total",
+    "События ленты изменений, отправленные подписчикам",
+    ("source",),
+)
+RESYNCS = metrics.REGISTRY.counter(
+    "change_feed_catchups_total",
+    "Догоняющие запросы к audit_log (возобновление, переполнение очереди, переподключение слушателя)",
+)
+
+_CATCHUP_SQL = text("""
+    SELECT log_id, audit_change_payload(audit_log) AS payload
+    FROM audit_log
+    WHERE log_id > :after
+      AND (CAST(:table_name AS VARCHAR) IS NULL OR table_name = :table_name)
+    ORDER BY log_id
+    LIMIT :limit
+""")
+
+# Окно повторного чтения: записи не выше токена, чьи транзакции могли быть открыты
+# при его выдаче (индекс по changed_at)
+_REPLAY_SQL = text("""
+    SELECT log_id, audit_change_payload(audit_log) AS payload
+    FROM audit_log
+    WHERE changed_at >= :since
+      AND log_id > :after AND log_id <= :upto
+      AND (CAST(:table_name AS VARCHAR) IS NULL OR table_name = :table_name)
+    ORDER BY log_id
+    LIMIT :limit
+""")
+
+# Начало самой старой открытой транзакции (ее записи аудита получат changed_at не раньше)
+# или текущий момент - во времени сеанса, как CURRENT_TIMESTAMP в audit_log.changed_at
+_HORIZON_SQL = text("""
+    SELECT LEAST(now(), min(xact_start))::TIMESTAMP
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL
+""")
+
+
+def parse_token(value):
+    """Токен "log_id:время" (или просто log_id) -> (log_id, время или None); ошибка - ValueError"""
+    log_id, _, since = value.partition(":")
+    return int(log_id), datetime.fromisoformat(since) if since else None
+
+
+class Subscriber:
+    """Очередь событий одного клиента и его позиция в журнале"""
+
+    def __init__(self, table_name=None, after=None, since=None):
+        self.table_name = table_name
+        self.last_id = after
+        # Окно повторного чтения из токена возобновления
+        self.replay_since = since
+        self.queue = asyncio.Queue(maxsize=CHANGE_FEED_QUEUE_SIZE)
+        self.resync = False
+
+    def offer(self, event):
+        if self.table_name is not None and event["table"] != self.table_name:
+            return
+        if self.resync:
+            return  # событие придет из догоняющего запроса
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.resync = True
+
+    def wake(self):
+        # Пустое событие будит ожидающий генератор (переподключение слушателя)
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+class ChangeFeed:
+    """Слушатель канала audit_changes и раздача событий подписчикам"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.notifications = 0
+        self.last_log_id = None
+        self.listening = False
+        # Граница открытых транзакций для токенов; устаревшая безопасна (окно только шире)
+        self.horizon = None
+        self._engine = None
+        self._dsn = None
+        self._tasks = []
+
+    def start(self, engine, dsn):
+        """Запуск слушателя и обновления границы в текущем цикле событий"""
+        self._engine = engine
+        self._dsn = dsn
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._listen_forever()), loop.create_task(self._track_horizon())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def current_horizon(self):
+        with self._engine.connect() as connection:
+            return connection.execute(_HORIZON_SQL).scalar()
+
+    async def _track_horizon(self):
+        while True:
+            try:
+                self.horizon = await run_in_threadpool(self.current_horizon)
+            except Exception as e:
+                logger.warning("Граница ленты изменений: %s", e)
+            await asyncio.sleep(CHANGE_FEED_HORIZON_SECONDS)
+
+    # ----- слушатель LISTEN/NOTIFY -----
+
+    async def _listen_forever(self):
+        import psycopg2  # драйвер нужен только для LISTEN, движок SQLAlchemy его не выдает
+
+        loop = asyncio.get_running_loop()
+        while True:
+            connection = None
+            try:
+                connection = await loop.run_in_executor(None, psycopg2.connect, self._dsn)
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {CHANGE_FEED_CHANNEL}")
+                self.listening = True
+                # Пока слушателя не было, уведомления терялись - подписчики догоняют из таблицы
+                for subscriber in list(self.subscribers):
+                    subscriber.resync = True
+                    subscriber.wake()
+                await self._consume(loop, connection)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Слушатель ленты изменений: %s", e)
+            finally:
+                self.listening = False
+                if connection is not None:
+                    connection.close()
+            await asyncio.sleep(CHANGE_FEED_RECONNECT_SECONDS)
+
+    async def _consume(self, loop, connection):
+        lost = loop.create_future()
+
+        def on_readable():
+            try:
+                connection.poll()
+            except Exception as e:
+                if not lost.done():
+                    lost.set_exception(e)
+                return
+            while connection.notifies:
+                self._dispatch(connection.notifies.pop(0).payload)
+
+        loop.add_reader(connection.fileno(), on_readable)
+        try:
+            await lost
+        finally:
+            loop.remove_reader(connection.fileno())
+
+    def _dispatch(self, payload):
+        self.notifications += 1
+        event = json.loads(payload)
+        self.last_log_id = max(self.last_log_id or 0, event["log_id"])
+        for subscriber in list(self.subscribers):
+            subscriber.offer(event)
+
+    # ----- подписчики -----
+
+    def subscribe(self, table_name=None, after=None, since=None):
+        subscriber = Subscriber(table_name, after, since)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def current_log_id(self):
+        with self._engine.connect() as connection:
+            return connection.execute(text("SELECT COALESCE(max(log_id), 0) FROM audit_log")).scalar()
+
+    def fetch_since(self, after, table_name=None, limit=CHANGE_FEED_CATCHUP_BATCH):
+        """События после log_id = after из таблицы (догоняющий запрос по первичному ключу)"""
+        with self._engine.connect() as connection:
+            rows = connection.execute(_CATCHUP_SQL, {"after": after, "table_name": table_name, "limit": limit})
+            return [(row.log_id, row.payload) for row in rows]
+
+    def fetch_replay(self, since, after, upto, table_name=None, limit=CHANGE_FEED_CATCHUP_BATCH):
+        """Записи с log_id в (after, upto] и changed_at >= since (окно повторного чтения)"""
+        with self._engine.connect() as connection:
+            rows = connection.execute(_REPLAY_SQL, {
+                "since": since, "after": after, "upto": upto, "table_name": table_name, "limit": limit
+            })
+            return [(row.log_id, row.payload) for row in rows]
+
+    async def events(self, subscriber, request):
+        """Генератор сообщений SSE для StreamingResponse"""
+        try:
+            if subscriber.last_id is None:
+                # Новый подписчик без токена получает только будущие изменения
+                subscriber.last_id = await run_in_threadpool(self.current_log_id)
+            else:
+                subscriber.resync = True
+            caught_up = set()
+            while not await request.is_disconnected():
+                if subscriber.resync:
+                    caught_up = set()
+                    async for message in self._catch_up(subscriber, caught_up):
+                        yield message
+                    continue
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), CHANGE_FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None or event["log_id"] in caught_up:
+                    continue
+                yield self._message(subscriber, event, "live")
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def _catch_up(self, subscriber, caught_up):
+        # Флаг снимается до запроса: все, что зафиксировано после, попадет в очередь.
+        # Очередь очищается - ее события есть в таблице и вернутся запросом
+        subscriber.resync = False
+        horizon = self.last_log_id or 0
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        RESYNCS.inc()
+        if subscriber.replay_since is not None:
+            since, subscriber.replay_since = subscriber.replay_since, None
+            upto, cursor = subscriber.last_id, 0
+            while True:
+                rows = await run_in_threadpool(
+                    self.fetch_replay, since, cursor, upto, subscriber.table_name, CHANGE_FEED_CATCHUP_BATCH
+                )
+                for log_id, payload in rows:
+                    # Зафиксированное после запроса придет и из очереди
+                    caught_up.add(log_id)
+                    cursor = log_id
+                    yield self._message(subscriber, payload, "catchup")
+                if len(rows) < CHANGE_FEED_CATCHUP_BATCH:
+                    break
+        while True:
+            rows = await run_in_threadpool(
+                self.fetch_since, subscriber.last_id, subscriber.table_name, CHANGE_FEED_CATCHUP_BATCH
+            )
+            for log_id, payload in rows:
+                # Запомнить нужно только новые события - лишь они могут прийти еще и из очереди
+                if log_id > horizon:
+                    caught_up.add(log_id)
+                yield self._message(subscriber, payload, "catchup")
+            if len(rows) < CHANGE_FEED_CATCHUP_BATCH:
+                break
+
+    def _message(self, subscriber, event, source):
+        subscriber.last_id = max(subscriber.last_id or 0, event["log_id"])
+        EVENTS.inc(source=source)
+        data = json.dumps(event, ensure_ascii=False, default=str)
+        token = str(subscriber.last_id)
+        if self.horizon is not None:
+            token = f"{token}:{self.horizon.isoformat()}"
+        return f"id: {token}\nevent: change\ndata: {data}\n\n"
+
+    def stats(self):
+        return {
+            "enabled": CHANGE_FEED_ENABLED,
+            "listening": self.listening,
+            "subscribers": len(self.subscribers),
+            "notifications": self.notifications,
+            "last_log_id": self.last_log_id,
+            "horizon": self.horizon.isoformat() if self.horizon else None,
+            "lagging_subscribers": sum(1 for subscriber in self.subscribers if subscriber.resync),
+        }
+
+
+CHANGE_FEED = ChangeFeed()
+
+metrics.REGISTRY.gauge("change_feed_subscribers", "Подключенных подписчиков ленты изменений").set_function(
+    lambda: len(CHANGE_FEED.subscribers)
+)
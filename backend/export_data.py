@@ -0,0 +1,99 @@
+"""
+Ночная выгрузка таблиц в файлы для хранилища данных (CSV, Parquet, Arrow).
+
+Использует те же выгрузки, что и эндпоинт /export/{dataset} (exports.py), но
+пишет прямо в файлы. Водяные знаки хранятся в JSON-файле состояния и
+обновляются только после успешной выгрузки, поэтому повторный запуск после
+сбоя выгрузит тот же интервал заново.
+
+Примеры:
+    python export_data.py --out-dir /data/export --format parquet
+    python export_data.py employees audit_log --format csv --state /data/export/state.json
+    python export_data.py salary_history --full
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import exports
+
+
+def load_state(path):
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as state_file:
+            return json.load(state_file)
+    return {}
+
+
+def save_state(path, state):
+    # Запись через временный файл: состояние не повреждается при сбое посреди записи
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file, ensure_ascii=False, indent=2)
+    os.replace(temporary, path)
+
+
+def export_one(name, file_format, out_dir, since):
+    spec = exports.EXPORTS[name]
+    export = exports.Export(spec, exports.parse_watermark(spec, since))
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(out_dir, f"{name}_{stamp}.{exports.EXTENSIONS[file_format]}")
+    start = time.perf_counter()
+    try:
+        with open(path, "wb") as file:
+            export.write(file, file_format)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    finally:
+        export.close()
+    return {
+        "file": path,
+        "rows": export.rows,
+        "bytes": os.path.getsize(path),
+        "seconds": round(time.perf_counter() - start, 2),
+        "since": since,
+        "watermark": export.watermark,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Инкрементальная выгрузка таблиц HRM для хранилища данных")
+    parser.add_argument("datasets", nargs="*",
+                        help=f"Наборы ({', '.join(sorted(exports.EXPORTS))}); по умолчанию все")
+    parser.add_argument("--format", choices=sorted(exports.FORMATS), default="parquet")
+    parser.add_argument("--out-dir", default=".", help="Каталог для файлов выгрузки")
+    parser.add_argument("--state", default=None, help="Файл водяных знаков (по умолчанию <out-dir>/export_state.json)")
+    parser.add_argument("--full", action="store_true", help="Полная выгрузка без учета водяных знаков")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    datasets = args.datasets or sorted(exports.EXPORTS)
+    unknown = [name for name in datasets if name not in exports.EXPORTS]
+    if unknown:
+        print(f"Неизвестные наборы: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    state_path = args.state or os.path.join(args.out_dir, "export_state.json")
+    state = load_state(state_path)
+
+    for name in datasets:
+        since = None if args.full else state.get(name)
+        result = export_one(name, args.format, args.out_dir, since)
+        rate = result["rows"] / result["seconds"] if result["seconds"] else 0
+        print(f"{name}: {result['rows']} строк, {result['bytes'] / 2 ** 20:.1f} МБ за {result['seconds']} с "
+              f"({rate:.0f} строк/с), водяной знак {result['since']} -> {result['watermark']}")
+        if result["watermark"] is not None:
+            state[name] = result["watermark"]
+            save_state(state_path, state)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+"""
+Массовая выгрузка таблиц для хранилища данных.
+
+Данные не проходят через ORM и JSON: CSV отдается потоком напрямую из
+COPY (SELECT ...) TO STDOUT, Parquet и Arrow IPC собираются из серверного
+курсора пачками фиксированного размера, поэтому память процесса не зависит
+от объема выгрузки.
+
+Инкрементальная выгрузка - по водяному знаку (watermark): столбцу, который
+растет при каждом изменении строки (employees.updated_at, audit_log.changed_at,
+salary_history.salary_change_id). Верхняя граница фиксируется в начале выгрузки
+в той же транзакции REPEATABLE READ, что и сами данные, и возвращается клиенту;
+следующая выгрузка передает ее как since и получает только строки после нее.
+
+Значения водяных знаков не упорядочены по фиксации: время - начало транзакции
+(CURRENT_TIMESTAMP), номер - из последовательности. Строка транзакции, еще открытой
+в момент выгрузки, получает значение ниже границы и фиксируется позже, поэтому граница
+ставится ниже всего, что могут записать незавершенные транзакции (_TIMESTAMP_HORIZON,
+_ID_HORIZON). Долгая открытая транзакция задерживает границу, но строки не теряются;
+если пишущие транзакции не завершились за EXPORT_WRITER_WAIT_MS, выгрузка не начинается
+(ExportNotReadyError), а не отдает пустой результат со старой границей.
+
+Удаления и перенос в архив (employees_archive) не выгружаются: удаленных строк в таблице
+нет, их видно в audit_log.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import date, datetime
+
+from database import engine
+
+# Строк в пачке Parquet/Arrow, число блоков в очереди потока и размер блока
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "50000"))
+EXPORT_QUEUE_CHUNKS = 16
+EXPORT_CHUNK_BYTES = 256 * 1024
+# Сколько ждать завершения транзакций, пишущих в таблицу с числовым водяным знаком
+EXPORT_WRITER_WAIT_MS = int(os.getenv("EXPORT_WRITER_WAIT_MS", "5000"))
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "csv": "text/csv",  # charset=utf-8 добавляет Starlette
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+EXTENSIONS = {"csv": "csv", "parquet": "parquet", "arrow": "arrows"}
+
+
+def arrow_available():
+    """pyarrow нужен только для Parquet/Arrow и не импортируется при старте"""
+    import importlib.util
+
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class ExportSpec:
+    """Выгружаемый набор (name - имя таблицы): SELECT без WHERE и столбец водяного знака"""
+
+    def __init__(self, name, select_sql, watermark_column, watermark_type):
+        self.name = name
+        self.select_sql = select_sql
+        self.watermark_column = watermark_column
+        self.watermark_type = watermark_type  # timestamp | int
+
+
+EXPORTS = {
+    "employees": ExportSpec(
+        "employees",
+        """SELECT employee_id, first_name, last_name, email, phone, hire_date, salary,
+                  department_id, position_id, manager_id, address, birth_date, is_active,
+                  created_at, updated_at
+           FROM employees""",
+        "updated_at", "timestamp",
+    ),
+    "salary_history": ExportSpec(
+        "salary_history",
+        """SELECT salary_change_id, employee_id, old_salary, new_salary, change_date,
+                  change_reason, changed_by, notes
+           FROM salary_history""",
+        "salary_change_id", "int",
+    ),
+    "audit_log": ExportSpec(
+        "audit_log",
+        """SELECT log_id, table_name, record_id, operation_type, old_values, new_values,
+                  changed_by, changed_at
+           FROM audit_log""",
+        "changed_at", "timestamp",
+    ),
+}
+
+
+def parse_watermark(spec, value):
+    """Значение since из запроса: целое число или момент времени ISO 8601"""
+    if value is None or value == "":
+        return None
+    if spec.watermark_type == "int":
+        return int(value)
+    return datetime.fromisoformat(value)
+
+
+# Граница по времени: начало самой старой открытой транзакции базы (ее строки получат
+# CURRENT_TIMESTAMP не раньше этого момента) или текущий момент. Запрашивается до снимка
+# данных: транзакции, начатые после запроса, пишут время позже границы
+_TIMESTAMP_HORIZON = """
+    SELECT LEAST(now(), min(xact_start))
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL
+"""
+
+# Граница по номеру: последнее значение последовательности. Номер выдается внутри INSERT,
+# который держит RowExclusiveLock таблицы до конца транзакции, поэтому все номера до границы
+# зафиксированы (или отменены), когда завершатся транзакции, державшие блокировку в момент
+# запроса. Их ждут, не блокируя запись (как CREATE INDEX CONCURRENTLY); порядок xid для
+# этого не годится - транзакция с меньшим xid может получить номер позже.
+# Последовательность читается до списка блокировок. pg_sequence_last_value() возвращает NULL
+# после setval(..., false) (так заканчивает генератор данных), поэтому значение берется из
+# самой последовательности: last_value еще не выдан, граница - на единицу меньше
+_SERIAL_SEQUENCE = "SELECT pg_get_serial_sequence(%(table)s, %(column)s)"
+
+_ID_WRITERS = """
+    SELECT ARRAY(SELECT l.virtualtransaction
+                 FROM pg_locks l
+                 WHERE l.relation = %(table)s::REGCLASS AND l.mode = 'RowExclusiveLock'
+                   AND l.granted AND l.pid <> pg_backend_pid())
+"""
+
+_WRITERS_RUNNING = """
+    SELECT COUNT(*) FROM pg_locks WHERE locktype = 'virtualxid' AND virtualxid = ANY(%s)
+"""
+
+
+class ExportNotReadyError(Exception):
+    """Граница водяного знака пока неизвестна: выгрузку нужно повторить позже"""
+
+
+def _format_watermark(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return None if value is None else str(value)
+
+
+class Export:
+    """
+    Одна выгрузка: отдельное соединение из пула и транзакция REPEATABLE READ READ ONLY,
+    в которой определяется верхняя граница водяного знака и читаются данные
+    """
+
+    def __init__(self, spec, since=None):
+        self.spec = spec
+        self.since = since
+        self.connection = engine.raw_connection()
+        self.rows = 0
+        self.schema = None
+        try:
+            cursor = self.connection.cursor()
+            # Граница определяется до снимка данных, в отдельной транзакции
+            horizon = self._horizon(cursor)
+            self.connection.commit()
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            self.upper = self._upper(cursor, horizon)
+            # Граница не опускается ниже уже выгруженного
+            if since is not None and (self.upper is None or self.upper < since):
+                self.upper = since
+            self.query = self._bounded_query(cursor)
+            cursor.close()
+        except Exception:
+            self.close()
+            raise
+
+    def _horizon(self, cursor):
+        """Значения водяного знака ниже этой границы уже не появятся"""
+        if self.spec.watermark_type == "timestamp":
+            cursor.execute(_TIMESTAMP_HORIZON)
+            return cursor.fetchone()[0]
+
+        params = {"table": self.spec.name, "column": self.spec.watermark_column}
+        cursor.execute(_SERIAL_SEQUENCE, params)
+        sequence = cursor.fetchone()[0]
+        if sequence is not None:
+            # Имя из каталога, уже с кавычками и схемой
+            cursor.execute(f"SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM {sequence}")
+        else:
+            cursor.execute(f"SELECT max({self.spec.watermark_column}) FROM {self.spec.name}")
+        last_id = cursor.fetchone()[0]
+        cursor.execute(_ID_WRITERS, params)
+        writers = cursor.fetchone()[0]
+        deadline = time.monotonic() + EXPORT_WRITER_WAIT_MS / 1000
+        while writers:
+            cursor.execute(_WRITERS_RUNNING, (writers,))
+            if cursor.fetchone()[0] == 0:
+                break
+            if time.monotonic() > deadline:
+                logger.warning("Выгрузка %s: транзакции записи не завершились за %s мс",
+                               self.spec.name, EXPORT_WRITER_WAIT_MS)
+                raise ExportNotReadyError(
+                    f"Транзакции записи в {self.spec.name} не завершились за {EXPORT_WRITER_WAIT_MS} мс"
+                )
+            time.sleep(0.05)
+        return last_id
+
+    def _upper(self, cursor, horizon):
+        if horizon is None:
+            # Таблица без строк и без выданных номеров
+            return None
+        column = self.spec.watermark_column
+        # Время: строго раньше начала открытых транзакций; номер: не больше выданного до ожидания
+        operator = "<" if self.spec.watermark_type == "timestamp" else "<="
+        cursor.execute(
+            f"SELECT max({column}) FROM ({self.spec.select_sql}) AS source WHERE {column} {operator} %s",
+            (horizon,),
+        )
+        return cursor.fetchone()[0]
+
+    @property
+    def watermark(self):
+        """Новый водяной знак: since для следующей выгрузки"""
+        return _format_watermark(self.upper if self.upper is not None else self.since)
+
+    def _bounded_query(self, cursor):
+        column = self.spec.watermark_column
+        conditions, params = [], []
+        if self.since is not None:
+            conditions.append(f"{column} > %s")
+            params.append(self.since)
+        if self.upper is not None:
+            conditions.append(f"{column} <= %s")
+            params.append(self.upper)
+        else:
+            # До границы нет ни одной строки (первая выгрузка пустой таблицы)
+            conditions.append("FALSE")
+        sql = f"SELECT * FROM ({self.spec.select_sql}) AS source WHERE {' AND '.join(conditions)} ORDER BY {column}"
+        return cursor.mogrify(sql, params).decode()
+
+    def close(self):
+        try:
+            self.connection.rollback()
+        finally:
+            self.connection.close()
+
+    # ----- CSV через COPY -----
+
+    def write_csv(self, file):
+        """COPY ... TO STDOUT в файловый объект (write вызывается блоками по мере чтения)"""
+        cursor = self.connection.cursor()
+        cursor.copy_expert(f"COPY ({self.query}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
+        self.rows = cursor.rowcount
+        cursor.close()
+
+    # ----- Parquet / Arrow пачками -----
+
+    def record_batches(self, pa, batch_size=EXPORT_BATCH_SIZE):
+        """Пачки pyarrow.RecordBatch из серверного курсора"""
+        cursor = self.connection.cursor(name=f"export_{self.spec.name}")
+        cursor.itersize = batch_size
+        cursor.execute(self.query)
+        rows = cursor.fetchmany(batch_size)
+        schema = self.schema = arrow_schema(pa, cursor.description)
+        json_columns = [
+            index for index, field in enumerate(schema)
+            if field.metadata and field.metadata.get(b"pg_type") == b"json"
+        ]
+        while rows:
+            if json_columns:
+                rows = [_dump_json_columns(row, json_columns) for row in rows]
+            columns = list(zip(*rows))
+            yield schema, pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            )
+            self.rows += len(rows)
+            rows = cursor.fetchmany(batch_size)
+        cursor.close()
+
+    def write_arrow(self, file, file_format, batch_size=EXPORT_BATCH_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Для выгрузки в Parquet/Arrow нужен пакет pyarrow")
+
+        writer = None
+        try:
+            for schema, batch in self.record_batches(pa, batch_size):
+                if writer is None:
+                    writer = _open_writer(pa, pq, file, file_format, schema)
+                writer.write_batch(batch)
+            if writer is None:
+                # Пустая выгрузка - файл со схемой и без строк
+                writer = _open_writer(pa, pq, file, file_format, self.schema)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def write(self, file, file_format):
+        if file_format == "csv":
+            self.write_csv(file)
+        else:
+            self.write_arrow(file, file_format)
+
+
+def _open_writer(pa, pq, file, file_format, schema):
+    if file_format == "parquet":
+        return pq.ParquetWriter(file, schema, compression="zstd")
+    return pa.ipc.new_stream(file, schema)
+
+
+def _dump_json_columns(row, json_columns):
+    row = list(row)
+    for index in json_columns:
+        if row[index] is not None:
+            row[index] = json.dumps(row[index], ensure_ascii=False)
+    return row
+
+
+# OID типов PostgreSQL -> типы Arrow
+_ARROW_TYPES = {
+    16: "bool_", 20: "int64", 21: "int16", 23: "int32", 700: "float32", 701: "float64",
+    25: "string", 1043: "string", 1042: "string", 1082: "date32",
+}
+
+
+def arrow_schema(pa, description):
+    fields = []
+    for column in description:
+        type_code = column.type_code
+        metadata = None
+        if type_code == 1700:
+            precision = column.precision if column.precision and column.precision > 0 else 38
+            scale = column.scale if column.scale and column.scale >= 0 else 10
+            arrow_type = pa.decimal128(precision, scale)
+        elif type_code == 1114:
+            arrow_type = pa.timestamp("us")
+        elif type_code == 1184:
+            arrow_type = pa.timestamp("us", tz="UTC")
+        elif type_code in (114, 3802):
+            arrow_type = pa.string()
+            metadata = {"pg_type": "json"}
+        elif type_code in _ARROW_TYPES:
+            arrow_type = getattr(pa, _ARROW_TYPES[type_code])()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, metadata=metadata))
+    return pa.schema(fields)
+
+
+class _QueueWriter:
+    """
+    Файловый объект для потока: блоки копятся до EXPORT_CHUNK_BYTES и кладутся
+    в ограниченную очередь (COPY вызывает write на каждую строку)
+    """
+
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        if self.cancelled.is_set():
+            raise RuntimeError("Выгрузка прервана клиентом")
+        if isinstance(data, str):
+            data = data.encode()
+        self.buffer += data
+        self.position += len(data)
+        if len(self.buffer) >= EXPORT_CHUNK_BYTES:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.chunks.put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def tell(self):
+        return self.position
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+
+_DONE = object()
+
+
+def stream(export, file_format):
+    """
+    Генератор блоков выгрузки для StreamingResponse. Запись идет в отдельном потоке,
+    очередь ограничена - если клиент читает медленно, чтение из базы приостанавливается
+    """
+    chunks = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    errors = []
+
+    def produce():
+        writer = _QueueWriter(chunks, cancelled)
+        try:
+            export.write(writer, file_format)
+            writer.flush()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            export.close()
+            chunks.put(_DONE)
+
+    thread = threading.Thread(target=produce, name=f"export-{export.spec.name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        if errors:
+            raise errors[0]
+    finally:
+        # Клиент отключился: поток записи остановится на следующем блоке
+        cancelled.set()
+        while thread.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
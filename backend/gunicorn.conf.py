@@ -0,0 +1,43 @@
+"""
+Конфигурация gunicorn для боевого режима: несколько воркеров uvicorn.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Число воркеров задается WEB_CONCURRENCY (по умолчанию - число ядер). Та же
+переменная используется в database.py, чтобы разделить DB_CONNECTION_BUDGET
+между пулами воркеров.
+"""
+import multiprocessing
+import os
+
+# database.py читает WEB_CONCURRENCY при импорте (preload_app - в мастер-процессе)
+workers = int(os.environ.setdefault("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# Приложение импортируется один раз в мастере: воркеры стартуют быстрее
+# и делят неизменяемые страницы памяти (copy-on-write)
+preload_app = True
+
+# Плавная остановка: воркер дорабатывает текущие запросы и выполняет shutdown-обработчики
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Периодический перезапуск воркеров ограничивает рост памяти; разброс - чтобы не все сразу
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.getenv("ACCESS_LOG") or None
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    # Соединения, открытые в мастере при импорте, не должны делиться между процессами
+    from database import reset_pool_after_fork
+
+    reset_pool_after_fork()
+
+
+def worker_exit(server, worker):
+    server.log.info("Воркер %s остановлен", worker.pid)
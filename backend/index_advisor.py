@@ -0,0 +1,342 @@
+"""
+Советник по индексам.
+
+Каждый индекс таблицы обновляется при каждой вставке и при каждом изменении строки,
+которое не удалось выполнить как HOT (без новых записей в индексы), поэтому лишний
+индекс замедляет запись, а на чтении полезен, только если его выбирает планировщик.
+Отчет сводит:
+  * каталог индексов (22_index_advisor.sql): дубликаты и индексы-префиксы других;
+  * pg_stat_user_indexes: индексы без сканирований за время сбора статистики;
+  * известные запросы эндпоинтов (ACCESS_PATTERNS) и внешние ключи: какие индексы
+    нужны и каких не хватает;
+  * pg_stat_user_tables и pg_stat_statements: объем записи и последовательные чтения
+    таблиц, самые дорогие запросы к ним.
+
+Для индекса-кандидата на удаление оценивается экономия записи: сколько записей в индекс
+в сутки (вставки и не-HOT изменения таблицы) уйдет и какая это доля обслуживания индексов
+таблицы. Оценка снизу: без индекса часть изменений его столбцов станет HOT.
+Частичный индекс (WHERE ...) обновляют только строки, подходящие под условие, поэтому
+для него это оценка сверху (estimate = upper_bound); predicate_row_share - доля строк
+таблицы в индексе по pg_class.reltuples, для записи она может быть и другой (в
+idx_audit_recent_dates попадает каждая новая строка, хотя доля таблицы мала).
+Отчет ничего не меняет - DROP/CREATE INDEX CONCURRENTLY выполняются вручную.
+
+Пример:
+    python index_advisor.py --sql > index_changes.sql
+"""
+import argparse
+import json
+import os
+import sys
+
+from sqlalchemy import text
+
+from database import engine
+
+# Индекс без сканирований считается неиспользуемым, только если статистика собиралась
+# не меньше этого числа дней (иначе редкие отчеты выглядят как неиспользуемые)
+INDEX_UNUSED_MIN_DAYS = float(os.getenv("INDEX_UNUSED_MIN_DAYS", "7"))
+# Таблица читается последовательно "много", если в среднем за проход читается больше строк
+SEQ_SCAN_MIN_ROWS = 10000
+STATEMENTS_PER_TABLE = 5
+
+# Запросы эндпоинтов и нужный им доступ:
+# имя: (таблица, столбцы условий равенства, столбец сортировки или None, откуда запрос)
+ACCESS_PATTERNS = {
+    "employees_by_department": ("employees", ("department_id",), "employee_id",
+                                "GET /employees/?department_id=, GET /reports/department/{id}/employees"),
+    "employee_by_email": ("employees", ("email",), None, "POST /employees/, POST /batch/import-employees"),
+    "subordinates": ("employees", ("manager_id",), None,
+                     "GET /employees/{id}/subordinates, проверка иерархии подчинения"),
+    "employees_changed_since": ("employees", (), "updated_at", "GET /export/employees (водяной знак)"),
+    "audit_record_history": ("audit_log", ("table_name", "record_id"), "changed_at",
+                             "GET /audit/records/{table_name}/{record_id}"),
+    "audit_changed_since": ("audit_log", (), "changed_at", "GET /export/audit_log (водяной знак)"),
+    "employee_vacations": ("vacations", ("employee_id",), "start_date",
+                           "GET /vacations/conflicts, GET /vacations/balances"),
+    "project_members": ("employee_projects", ("project_id",), None, "GET /projects/portfolio"),
+    "skill_holders": ("employee_skills", ("skill_id",), None, "GET /staffing/search"),
+}
+
+_STATS_WINDOW = """
+    SELECT COALESCE(stats_reset, pg_postmaster_start_time()) AS observed_since,
+           EXTRACT(EPOCH FROM now() - COALESCE(stats_reset, pg_postmaster_start_time())) / 86400 AS observed_days
+    FROM pg_stat_database
+    WHERE datname = current_database()
+"""
+
+_TABLE_WRITES = """
+    SELECT relname AS table_name, n_tup_ins, n_tup_upd, n_tup_hot_upd, n_tup_del,
+           seq_scan, seq_tup_read, COALESCE(idx_scan, 0) AS idx_scan, n_live_tup
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'public'
+"""
+
+# Доля строк таблицы в частичном индексе по оценкам ANALYZE/VACUUM (reltuples < 0 - не собирались)
+_PREDICATE_ROW_SHARE = """
+    SELECT CASE WHEN t.reltuples > 0 AND c.reltuples >= 0
+                THEN round(LEAST(c.reltuples / t.reltuples, 1)::NUMERIC, 3) END AS row_share
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_class t ON t.oid = i.indrelid
+    WHERE i.indexrelid = :indexrelid
+"""
+
+_STATEMENTS_AVAILABLE = """
+    SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements')
+       AND 'pg_stat_statements' = ANY(string_to_array(replace(current_setting('shared_preload_libraries'), ' ', ''), ','))
+"""
+
+# Запросы к таблице: запись (INSERT/UPDATE/DELETE в нее) или любые упоминания
+_TABLE_STATEMENTS = """
+    SELECT left(regexp_replace(query, '\\s+', ' ', 'g'), 300) AS query,
+           calls,
+           round(total_exec_time::NUMERIC, 1) AS total_ms,
+           round(mean_exec_time::NUMERIC, 3) AS mean_ms,
+           rows
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+      AND query ~* :pattern
+    ORDER BY total_exec_time DESC
+    LIMIT :limit
+"""
+
+
+def _rows(connection, sql, params=None):
+    return [dict(row._mapping) for row in connection.execute(text(sql), params or {})]
+
+
+def _leading_columns(index, count):
+    return set(index["key_columns"][:count])
+
+
+def serves_pattern(index, equality, order_by):
+    """B-tree индекс без условия, ключ которого начинается со столбцов равенства (в любом порядке) и сортировки"""
+    if index["method"] != "btree" or index["predicate"] or not index["is_valid"]:
+        return False
+    count = len(equality)
+    if _leading_columns(index, count) != set(equality):
+        return False
+    if order_by is None:
+        return True
+    return len(index["key_columns"]) > count and index["key_columns"][count] == order_by
+
+
+def _supports_foreign_key(index, columns):
+    return index["is_valid"] and not index["predicate"] and _leading_columns(index, len(columns)) == set(columns)
+
+
+def _drop_statement(index_name):
+    return f"DROP INDEX CONCURRENTLY IF EXISTS {index_name};"
+
+
+def _create_statement(table_name, columns):
+    return (f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_{table_name}_{'_'.join(columns)} "
+            f"ON {table_name} ({', '.join(columns)});")
+
+
+def _per_day(value, days):
+    return round(value / days, 1) if days else None
+
+
+def _table_statements(connection, table_name, writes_only):
+    if writes_only:
+        pattern = f"^\\s*(INSERT\\s+INTO|UPDATE|DELETE\\s+FROM)\\s+{table_name}\\M"
+    else:
+        pattern = f"\\m{table_name}\\M"
+    rows = _rows(connection, _TABLE_STATEMENTS, {"pattern": pattern, "limit": STATEMENTS_PER_TABLE})
+    for row in rows:
+        row["total_ms"] = float(row["total_ms"])
+        row["mean_ms"] = float(row["mean_ms"])
+    return rows
+
+
+def advise(connection, min_days=None):
+    """Отчет: кандидаты на удаление, недостающие индексы и запись по таблицам"""
+    min_days = INDEX_UNUSED_MIN_DAYS if min_days is None else min_days
+    window = connection.execute(text(_STATS_WINDOW)).first()
+    observed_days = float(window.observed_days or 0)
+    indexes = _rows(connection, "SELECT * FROM index_catalog ORDER BY table_name, index_name")
+    redundancy = {row["index_name"]: row for row in _rows(connection, "SELECT * FROM index_redundancy")}
+    foreign_keys = _rows(connection, "SELECT * FROM foreign_key_indexes ORDER BY table_name, constraint_name")
+    tables = {row["table_name"]: row for row in _rows(connection, _TABLE_WRITES)}
+    statements_available = bool(connection.execute(text(_STATEMENTS_AVAILABLE)).scalar())
+
+    by_table = {}
+    for index in indexes:
+        if index["is_valid"]:
+            by_table.setdefault(index["table_name"], []).append(index)
+
+    # Известные запросы: каким индексом обслуживаются (предпочтительно самым коротким ключом)
+    patterns = []
+    needed = set()
+    for name, (table_name, equality, order_by, source) in ACCESS_PATTERNS.items():
+        serving = sorted(
+            (index for index in by_table.get(table_name, []) if serves_pattern(index, equality, order_by)),
+            key=lambda index: (index["index_name"] in redundancy, len(index["key_columns"]), index["size_bytes"]),
+        )
+        needed.update(index["index_name"] for index in serving)
+        patterns.append({
+            "name": name,
+            "table_name": table_name,
+            "columns": list(equality) + ([order_by] if order_by else []),
+            "source": source,
+            "served_by": serving[0]["index_name"] if serving else None,
+        })
+
+    # Индексы, без которых внешний ключ остался бы без индекса
+    for key in foreign_keys:
+        supporting = [index for index in by_table.get(key["table_name"], [])
+                      if _supports_foreign_key(index, key["columns"]) and index["index_name"] not in redundancy]
+        if len(supporting) == 1:
+            needed.add(supporting[0]["index_name"])
+
+    unused_window = observed_days >= min_days
+    drop = []
+    for index in indexes:
+        reason = covered_by = None
+        if index["index_name"] in redundancy:
+            reason = redundancy[index["index_name"]]["reason"]
+            covered_by = redundancy[index["index_name"]]["covered_by"]
+        elif (unused_window and index["is_valid"] and index["idx_scan"] == 0 and index["constraint_name"] is None
+              and not index["is_unique"] and index["index_name"] not in needed):
+            reason = "unused"
+        if reason is None:
+            continue
+
+        table = tables.get(index["table_name"], {})
+        index_writes = table.get("n_tup_ins", 0) + table.get("n_tup_upd", 0) - table.get("n_tup_hot_upd", 0)
+        row_share = None
+        if index["predicate"]:
+            row_share = connection.execute(text(_PREDICATE_ROW_SHARE), {"indexrelid": index["indexrelid"]}).scalar()
+        drop.append({
+            "table_name": index["table_name"],
+            "index_name": index["index_name"],
+            "reason": reason,
+            "covered_by": covered_by,
+            "definition": index["definition"],
+            "predicate": index["predicate"],
+            "predicate_row_share": float(row_share) if row_share is not None else None,
+            "estimate": "upper_bound" if index["predicate"] else "lower_bound",
+            "idx_scan": index["idx_scan"],
+            "size_bytes": index["size_bytes"],
+            "index_writes": index_writes,
+            "index_writes_per_day": _per_day(index_writes, observed_days),
+            "share_of_table_index_writes": round(1 / len(by_table[index["table_name"]]), 3),
+            "statement": _drop_statement(index["index_name"]),
+        })
+
+    missing = []
+    for pattern in patterns:
+        if pattern["served_by"] is None:
+            missing.append({
+                "table_name": pattern["table_name"],
+                "columns": pattern["columns"],
+                "reason": "pattern",
+                "source": f"{pattern['name']}: {pattern['source']}",
+                "statement": _create_statement(pattern["table_name"], pattern["columns"]),
+            })
+    for key in (key for key in foreign_keys if not key["indexed"]):
+        missing.append({
+            "table_name": key["table_name"],
+            "columns": key["columns"],
+            "reason": "foreign_key",
+            "source": f"{key['constraint_name']} -> {key['referenced_table']}",
+            "statement": _create_statement(key["table_name"], key["columns"]),
+        })
+
+    dropped_by_table = {}
+    for candidate in drop:
+        dropped_by_table[candidate["table_name"]] = dropped_by_table.get(candidate["table_name"], 0) + 1
+
+    table_report = []
+    for table_name, table in tables.items():
+        index_count = len(by_table.get(table_name, []))
+        index_writes = table["n_tup_ins"] + table["n_tup_upd"] - table["n_tup_hot_upd"]
+        entry = {
+            "table_name": table_name,
+            "live_rows": table["n_live_tup"],
+            "indexes": index_count,
+            "indexes_after": index_count - dropped_by_table.get(table_name, 0),
+            "inserts": table["n_tup_ins"],
+            "updates": table["n_tup_upd"],
+            "hot_updates": table["n_tup_hot_upd"],
+            "index_writes_per_day": _per_day(index_writes * index_count, observed_days),
+            "index_writes_per_day_after": _per_day(
+                index_writes * (index_count - dropped_by_table.get(table_name, 0)), observed_days
+            ),
+            "seq_scan": table["seq_scan"],
+            "avg_seq_rows": round(table["seq_tup_read"] / table["seq_scan"]) if table["seq_scan"] else 0,
+        }
+        if statements_available:
+            if table_name in dropped_by_table:
+                entry["write_statements"] = _table_statements(connection, table_name, True)
+            if entry["avg_seq_rows"] >= SEQ_SCAN_MIN_ROWS:
+                entry["top_statements"] = _table_statements(connection, table_name, False)
+        table_report.append(entry)
+    table_report.sort(key=lambda entry: entry["index_writes_per_day"] or 0, reverse=True)
+
+    notes = []
+    if not unused_window:
+        notes.append(f"Статистика собирается {observed_days:.1f} дн. (< {min_days}): "
+                     "неиспользуемые индексы не предлагаются")
+    partial = [candidate["index_name"] for candidate in drop if candidate["predicate"]]
+    if partial:
+        notes.append(f"Частичные индексы ({', '.join(partial)}): запись в индекс и доля обслуживания - "
+                     "оценка сверху, их обновляют только строки, подходящие под условие")
+    if not statements_available:
+        notes.append("pg_stat_statements не загружено (shared_preload_libraries): запросы по таблицам не показаны")
+
+    return {
+        "observed_since": window.observed_since.isoformat() if window.observed_since else None,
+        "observed_days": round(observed_days, 2),
+        "pg_stat_statements": statements_available,
+        "summary": {
+            "indexes": len(indexes),
+            "drop_candidates": len(drop),
+            "drop_bytes": sum(candidate["size_bytes"] for candidate in drop),
+            "index_writes_per_day_saved": _per_day(
+                sum(candidate["index_writes"] for candidate in drop), observed_days
+            ),
+            "missing": len(missing),
+        },
+        "drop": drop,
+        "missing": missing,
+        "patterns": patterns,
+        "tables": table_report,
+        "notes": notes,
+    }
+
+
+def render_sql(report):
+    """Скрипт изменений из отчета: удаление кандидатов и создание недостающих индексов"""
+    lines = ["-- Советник по индексам: проверьте перед выполнением (CONCURRENTLY - вне транзакции)"]
+    for candidate in report["drop"]:
+        detail = f" -> {candidate['covered_by']}" if candidate["covered_by"] else ""
+        bound = " (не больше, частичный индекс)" if candidate["predicate"] else ""
+        lines.append(f"-- {candidate['reason']}{detail}, записей в индекс в сутки: "
+                     f"{candidate['index_writes_per_day']}{bound}")
+        lines.append(candidate["statement"])
+    for suggestion in report["missing"]:
+        lines.append(f"-- {suggestion['reason']}: {suggestion['source']}")
+        lines.append(suggestion["statement"])
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Советник по индексам")
+    parser.add_argument("--min-days", type=float, default=None,
+                        help="Минимальный срок статистики для неиспользуемых индексов, дней")
+    parser.add_argument("--sql", action="store_true", help="Вывести скрипт DROP/CREATE INDEX вместо JSON")
+    args = parser.parse_args(argv)
+
+    with engine.connect() as connection:
+        report = advise(connection, args.min_days)
+    if args.sql:
+        sys.stdout.write(render_sql(report))
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
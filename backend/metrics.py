@@ -0,0 +1,400 @@
+"""
+Метрики производительности API в формате Prometheus.
+
+Модуль содержит минимальный реестр метрик (счетчики, гистограммы, датчики),
+хуки SQLAlchemy для замера времени SQL-запросов и журнал медленных запросов
+с планом выполнения (EXPLAIN).
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Порог медленного запроса и размер журнала (настраиваются через окружение)
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Максимальное число различных SQL-отпечатков (защита от взрыва кардинальности)
+MAX_STATEMENTS = 1000
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Базовый класс метрики с набором меток"""
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._render_samples())
+        return "\n".join(lines)
+
+    def _render_samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Мгновенное значение; может вычисляться функцией в момент выгрузки"""
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """Функция возвращает число (без меток) или словарь {кортеж меток: значение}"""
+        self._function = function
+
+    def _render_samples(self):
+        if self._function is not None:
+            result = self._function()
+            items = result.items() if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами"""
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self):
+        """Копия накопленных значений: {кортеж меток: {"sum", "count", "counts"}}"""
+        with self._lock:
+            return {
+                key: {"sum": series["sum"], "count": series["count"], "counts": list(series["counts"])}
+                for key, series in self._series.items()
+            }
+
+    def _render_samples(self):
+        lines = []
+        for key, series in self.snapshot().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик приложения"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса по эндпоинтам",
+    ("method", "route", "status"),
+)
+DB_QUERY_DURATION = REGISTRY.histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL-запроса по отпечаткам",
+    ("statement",),
+)
+DB_QUERY_ROWS = REGISTRY.histogram(
+    "db_query_rows",
+    "Количество строк, возвращенных или затронутых SQL-запросом",
+    ("statement",),
+    buckets=ROW_BUCKETS,
+)
+DB_QUERY_ERRORS = REGISTRY.counter(
+    "db_query_errors_total",
+    "Количество SQL-запросов, завершившихся ошибкой",
+    ("statement",),
+)
+DB_POOL_CHECKOUT_WAIT = REGISTRY.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Время ожидания соединения из пула",
+)
+DB_SLOW_QUERIES = REGISTRY.counter(
+    "db_slow_queries_total",
+    "Количество запросов дольше порога SLOW_QUERY_THRESHOLD_MS",
+    ("statement",),
+)
+
+
+# ========== ОТПЕЧАТКИ SQL-ЗАПРОСОВ ==========
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+
+_statements = {}
+_statements_lock = threading.Lock()
+
+
+def normalize_statement(statement):
+    """Приводит SQL к каноническому виду: без комментариев, литералов и лишних пробелов"""
+    normalized = _COMMENT_RE.sub(" ", statement)
+    normalized = _STRING_RE.sub("?", normalized)
+    normalized = _NUMBER_RE.sub("?", normalized)
+    return _SPACE_RE.sub(" ", normalized).strip()
+
+
+def statement_fingerprint(statement):
+    """Короткий отпечаток запроса, используемый как метка метрик"""
+    normalized = normalize_statement(statement)
+    fingerprint = hashlib.md5(normalized.encode("utf-8")).hexdigest()[:12]
+    with _statements_lock:
+        if fingerprint not in _statements:
+            if len(_statements) >= MAX_STATEMENTS:
+                return "other"
+            _statements[fingerprint] = normalized[:1000]
+    return fingerprint
+
+
+def get_statements():
+    """Статистика по отпечаткам: текст запроса, число вызовов, суммарное время, строки"""
+    durations = DB_QUERY_DURATION.snapshot()
+    rows = DB_QUERY_ROWS.snapshot()
+    with _statements_lock:
+        statements = dict(_statements)
+    result = []
+    for (fingerprint,), series in durations.items():
+        row_series = rows.get((fingerprint,), {"sum": 0})
+        result.append({
+            "fingerprint": fingerprint,
+            "statement": statements.get(fingerprint),
+            "calls": series["count"],
+            "total_time_ms": round(series["sum"] * 1000, 3),
+            "avg_time_ms": round(series["sum"] * 1000 / series["count"], 3) if series["count"] else 0,
+            "rows": row_series["sum"],
+        })
+    return sorted(result, key=lambda item: item["total_time_ms"], reverse=True)
+
+
+# ========== ЖУРНАЛ МЕДЛЕННЫХ ЗАПРОСОВ ==========
+
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def _safe_parameters(parameters):
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: repr(value)[:200] for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [repr(value)[:200] for value in parameters]
+    return repr(parameters)[:200]
+
+
+def _explain(engine, entry, statement, parameters):
+    """
+    Получение плана медленного запроса в отдельном соединении.
+    EXPLAIN без ANALYZE не выполняет запрос, поэтому безопасен и для DML.
+    """
+    try:
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+            entry["plan"] = cursor.fetchone()[0]
+            cursor.close()
+        finally:
+            raw.rollback()
+            raw.close()
+    except Exception as e:
+        entry["plan_error"] = str(e)
+
+
+def _record_slow_query(engine, statement, parameters, elapsed, rows, fingerprint):
+    entry = {
+        "timestamp": datetime.now().isoformat(),
+        "duration_ms": round(elapsed * 1000, 3),
+        "fingerprint": fingerprint,
+        "statement": statement,
+        "parameters": _safe_parameters(parameters),
+        "rows": rows,
+        "plan": None,
+    }
+    _slow_queries.append(entry)
+    DB_SLOW_QUERIES.inc(statement=fingerprint)
+    logger.warning(f"Медленный запрос ({entry['duration_ms']} мс, {fingerprint}): {normalize_statement(statement)[:500]}")
+
+    if SLOW_QUERY_EXPLAIN and statement.lstrip().upper().startswith(_EXPLAINABLE):
+        _explain_executor.submit(_explain, engine, entry, statement, parameters)
+
+
+def get_slow_queries():
+    """Записи журнала медленных запросов, от новых к старым"""
+    return list(reversed(_slow_queries))
+
+
+# ========== ХУКИ SQLALCHEMY И HTTP ==========
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append((statement, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()[1]
+    rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else 0
+    fingerprint = statement_fingerprint(statement)
+
+    DB_QUERY_DURATION.observe(elapsed, statement=fingerprint)
+    DB_QUERY_ROWS.observe(rows, statement=fingerprint)
+
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS and not executemany:
+        _record_slow_query(conn.engine, statement, parameters, elapsed, rows, fingerprint)
+
+
+def _handle_error(exception_context):
+    """
+    Запрос с ошибкой: after_cursor_execute не вызывается, поэтому время снимается здесь,
+    иначе отметка начала осталась бы в соединении пула навсегда
+    """
+    conn = exception_context.connection
+    statement = exception_context.statement
+    if conn is None or statement is None:
+        return
+    start_times = conn.info.get("query_start_time")
+    # Ошибка при чтении результата - запрос уже снят в after_cursor_execute
+    if not start_times or start_times[-1][0] != statement:
+        return
+    elapsed = time.perf_counter() - start_times.pop()[1]
+    fingerprint = statement_fingerprint(statement)
+    DB_QUERY_DURATION.observe(elapsed, statement=fingerprint)
+    DB_QUERY_ERRORS.inc(statement=fingerprint)
+
+
+def instrument_engine(engine):
+    """Подключение замеров SQL-запросов к движку SQLAlchemy"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def observe_request(method, route, status, elapsed):
+    """Запись длительности HTTP-запроса (вызывается из middleware)"""
+    HTTP_REQUEST_DURATION.observe(elapsed, method=method, route=route, status=str(status))
+
+
+def render_metrics():
+    return REGISTRY.render()
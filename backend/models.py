@@ -1,9 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, Text, Boolean, DateTime, ForeignKey, DECIMAL, Date, JSON, CheckConstraint, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, DECIMAL, Date, JSON, CheckConstraint, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
-from sqlalchemy.ext.declarative import declared_attr
 from database import Base
-from datetime import datetime
 
 class Employee(Base):
     __tablename__ = "employees"
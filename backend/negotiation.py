@@ -0,0 +1,267 @@
+"""
+Согласование формата и сжатия ответов.
+
+Отчеты и представления (/reports/*, /views/*) отдают табличные данные в формате
+из заголовка Accept:
+    application/json                      - по умолчанию, сериализация orjson
+    application/vnd.apache.arrow.stream   - Arrow IPC (pyarrow, типы столбцов сохраняются)
+    application/msgpack                   - MessagePack
+
+Ответы любых эндпоинтов больше COMPRESSION_MIN_BYTES сжимаются алгоритмом из
+Accept-Encoding (zstd, br, gzip - в порядке COMPRESSION_ENCODINGS). Потоковые
+ответы (выгрузки, лента SSE) не буферизуются и не сжимаются.
+
+Размер ответа по форматам и алгоритмам сжатия и время кодирования пишутся в
+метрики; GET /metrics/encodings сводит их, чтобы выбрать форматы по умолчанию.
+"""
+import gzip
+import importlib.util
+import os
+import time
+from decimal import Decimal
+from datetime import date, datetime
+
+import orjson
+from fastapi import Response
+from fastapi.encoders import decimal_encoder
+
+from metrics import REGISTRY
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_ENCODINGS = [
+    name.strip() for name in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",") if name.strip()
+]
+# Уровни выбраны в пользу скорости: ответ сжимается на каждый запрос
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "msgpack": "application/msgpack",
+}
+_FORMAT_BY_MEDIA_TYPE = {
+    "application/json": "json",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+}
+# Сжимаются только эти типы: Parquet и изображения уже сжаты
+COMPRESSIBLE_TYPES = ("application/json", "application/vnd.apache.arrow.stream", "application/msgpack",
+                      "text/", "application/problem+json")
+
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+RATIO_BUCKETS = (0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.7, 1.0)
+
+RESPONSE_BYTES = REGISTRY.histogram(
+    "api_response_bytes",
+    "Размер тела ответа по формату и сжатию (identity - до сжатия)",
+    ("format", "encoding"),
+    buckets=BYTE_BUCKETS,
+)
+RESPONSE_COMPRESSION_RATIO = REGISTRY.histogram(
+    "api_response_compression_ratio",
+    "Отношение размера сжатого ответа к исходному",
+    ("format", "encoding"),
+    buckets=RATIO_BUCKETS,
+)
+RESPONSE_ENCODE_DURATION = REGISTRY.histogram(
+    "api_response_encode_seconds",
+    "Время сериализации табличного ответа по формату",
+    ("format",),
+)
+RESPONSE_COMPRESS_DURATION = REGISTRY.histogram(
+    "api_response_compress_seconds",
+    "Время сжатия ответа по алгоритму",
+    ("encoding",),
+)
+
+
+def _module_available(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def available_formats():
+    formats = ["json"]
+    if _module_available("pyarrow"):
+        formats.append("arrow")
+    if _module_available("msgpack"):
+        formats.append("msgpack")
+    return formats
+
+
+def available_encodings():
+    modules = {"zstd": "zstandard", "br": "brotli", "gzip": None}
+    return [
+        name for name in COMPRESSION_ENCODINGS
+        if name in modules and (modules[name] is None or _module_available(modules[name]))
+    ]
+
+
+def _parse_header(value):
+    """Значения заголовка Accept / Accept-Encoding с q: [(значение, q)]"""
+    items = []
+    for part in (value or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        items.append((token, quality))
+    return items
+
+
+def choose_format(accept):
+    """Формат по Accept; если ни один из предложенных не подходит - JSON"""
+    formats = available_formats()
+    best, best_quality = "json", 0.0
+    for media_type, quality in _parse_header(accept):
+        name = _FORMAT_BY_MEDIA_TYPE.get(media_type)
+        if name in formats and quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def choose_encoding(accept_encoding):
+    """Алгоритм сжатия по Accept-Encoding: наибольший q, при равенстве - порядок COMPRESSION_ENCODINGS"""
+    accepted = dict(_parse_header(accept_encoding))
+    wildcard = accepted.get("*", 0.0)
+    candidates = [
+        (accepted.get(name, wildcard), index, name)
+        for index, name in enumerate(available_encodings())
+    ]
+    candidates = [candidate for candidate in candidates if candidate[0] > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda candidate: (candidate[0], -candidate[1]))[2]
+
+
+def compress(body, encoding):
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    raise ValueError(f"Неизвестный алгоритм сжатия: {encoding}")
+
+
+def should_compress(content_type, content_length):
+    if content_length is None or int(content_length) < COMPRESSION_MIN_BYTES:
+        return False
+    return (content_type or "").startswith(COMPRESSIBLE_TYPES)
+
+
+def compress_body(body, encoding, response_format):
+    start = time.perf_counter()
+    compressed = compress(body, encoding)
+    RESPONSE_COMPRESS_DURATION.observe(time.perf_counter() - start, encoding=encoding)
+    RESPONSE_BYTES.observe(len(compressed), format=response_format, encoding=encoding)
+    RESPONSE_COMPRESSION_RATIO.observe(len(compressed) / len(body), format=response_format, encoding=encoding)
+    return compressed
+
+
+def format_of(content_type):
+    return _FORMAT_BY_MEDIA_TYPE.get((content_type or "").split(";")[0].strip(), "other")
+
+
+def _default(value):
+    # Decimal - числом, как в ответах FastAPI по умолчанию (jsonable_encoder)
+    if isinstance(value, Decimal):
+        return decimal_encoder(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def _msgpack_default(value):
+    if isinstance(value, Decimal):
+        return decimal_encoder(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в MessagePack")
+
+
+def _encode_arrow(rows, columns):
+    import pyarrow as pa
+
+    if rows:
+        table = pa.Table.from_pylist(rows)
+    else:
+        table = pa.table({name: pa.array([], type=pa.null()) for name in columns})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(rows, response_format, columns=()):
+    if response_format == "arrow":
+        return _encode_arrow(rows, columns)
+    if response_format == "msgpack":
+        import msgpack
+
+        return msgpack.packb(rows, default=_msgpack_default)
+    return orjson.dumps(rows, default=_default)
+
+
+def rows_response(request, rows, columns=None):
+    """
+    Табличный ответ (список словарей или строки SQLAlchemy) в формате из Accept.
+    columns - имена столбцов для пустого ответа Arrow (по умолчанию - из первой строки)
+    """
+    rows = [row if isinstance(row, dict) else dict(row._mapping) for row in rows]
+    response_format = choose_format(request.headers.get("accept"))
+    start = time.perf_counter()
+    body = encode(rows, response_format, columns or ())
+    RESPONSE_ENCODE_DURATION.observe(time.perf_counter() - start, format=response_format)
+    return Response(content=body, media_type=MEDIA_TYPES[response_format], headers={"Vary": "Accept"})
+
+
+def stats():
+    """Средний размер ответа и время кодирования/сжатия по форматам и алгоритмам"""
+    sizes = RESPONSE_BYTES.snapshot()
+    ratios = RESPONSE_COMPRESSION_RATIO.snapshot()
+    encode_times = RESPONSE_ENCODE_DURATION.snapshot()
+    compress_times = RESPONSE_COMPRESS_DURATION.snapshot()
+
+    formats = {}
+    for (response_format, encoding), series in sizes.items():
+        entry = formats.setdefault(response_format, {"responses": 0, "avg_bytes": None, "encodings": {}})
+        avg_bytes = series["sum"] / series["count"] if series["count"] else 0
+        if encoding == "identity":
+            entry["responses"] = series["count"]
+            entry["avg_bytes"] = round(avg_bytes)
+        else:
+            entry["encodings"][encoding] = {"responses": series["count"], "avg_bytes": round(avg_bytes)}
+    for (response_format,), series in encode_times.items():
+        entry = formats.setdefault(response_format, {"responses": 0, "avg_bytes": None, "encodings": {}})
+        entry["avg_encode_ms"] = round(series["sum"] / series["count"] * 1000, 3) if series["count"] else None
+    for (response_format, encoding), series in ratios.items():
+        compressed = formats.get(response_format, {}).get("encodings", {}).get(encoding)
+        if compressed is not None and series["count"]:
+            compressed["avg_ratio"] = round(series["sum"] / series["count"], 3)
+
+    return {
+        "formats": formats,
+        "compression": {
+            encoding: {
+                "responses": series["count"],
+                "avg_compress_ms": round(series["sum"] / series["count"] * 1000, 3) if series["count"] else None,
+            }
+            for (encoding,), series in compress_times.items()
+        },
+        "available_formats": available_formats(),
+        "available_encodings": available_encodings(),
+        "min_bytes": COMPRESSION_MIN_BYTES,
+    }
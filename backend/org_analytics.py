@@ -0,0 +1,187 @@
+"""
+Аналитика оргструктуры по всей компании за один проход.
+
+Метрики считаются по массивам снимка оргструктуры (org_chart.OrgSnapshot) без
+запросов к базе на каждого руководителя:
+  - норма управляемости: руководители с числом прямых подчиненных выше порога
+    и распределение сотрудников по числу прямых подчиненных;
+  - глубина иерархии и численность по отделам;
+  - сотрудники, руководитель которых работает в другом отделе;
+  - согласованность departments.manager_id: руководитель не назначен, не найден,
+    числится в другом отделе или часть сотрудников отдела находится вне его поддерева.
+
+Результат кэшируется до изменения иерархии (версия снимка и руководителей отделов).
+"""
+import threading
+import time
+
+# Границы корзин распределения по числу прямых подчиненных
+SPAN_BUCKETS = ((0, 0), (1, 3), (4, 7), (8, 10), (11, 15), (16, 25), (26, None))
+
+
+def _bucket_label(low, high):
+    if high is None:
+        return f"{low}+"
+    return str(low) if low == high else f"{low}-{high}"
+
+
+def compute_org_analytics(snapshot, department_managers, span_threshold=10, limit=50):
+    """Все метрики за один проход по узлам снимка"""
+    start = time.perf_counter()
+    ids, parent, department = snapshot.ids, snapshot.parent, snapshot.department
+    child_start, depth, tin, size = snapshot.child_start, snapshot.depth, snapshot.tin, snapshot.size
+
+    # Интервал обхода поддерева руководителя каждого отдела
+    manager_ranges = {}
+    for department_id, manager_id in department_managers.items():
+        index = snapshot._find(manager_id) if manager_id else -1
+        if index >= 0:
+            manager_ranges[department_id] = (index, tin[index], tin[index] + size[index])
+
+    span_counts = [0] * len(SPAN_BUCKETS)
+    wide_managers = []
+    managers_total = 0
+    cross_department = []
+    cross_total = 0
+    departments = {}
+
+    for index in range(len(ids)):
+        span = child_start[index + 1] - child_start[index]
+        if span:
+            managers_total += 1
+            if span > span_threshold:
+                wide_managers.append((span, index))
+        for bucket, (low, high) in enumerate(SPAN_BUCKETS):
+            if high is None or span <= high:
+                span_counts[bucket] += 1
+                break
+
+        department_id = department[index]
+        stats = departments.get(department_id)
+        if stats is None:
+            stats = departments[department_id] = {
+                "headcount": 0, "min_depth": depth[index], "max_depth": depth[index],
+                "managers": 0, "max_span": 0, "cross_department_managers": 0,
+                "outside_manager_subtree": 0,
+            }
+        stats["headcount"] += 1
+        stats["min_depth"] = min(stats["min_depth"], depth[index])
+        stats["max_depth"] = max(stats["max_depth"], depth[index])
+        if span:
+            stats["managers"] += 1
+            stats["max_span"] = max(stats["max_span"], span)
+
+        manager_index = parent[index]
+        if manager_index >= 0 and department_id and department[manager_index] and department[manager_index] != department_id:
+            cross_total += 1
+            stats["cross_department_managers"] += 1
+            if len(cross_department) < limit:
+                cross_department.append({
+                    "employee_id": ids[index],
+                    "department_id": department_id,
+                    "manager_id": ids[manager_index],
+                    "manager_department_id": department[manager_index],
+                })
+
+        manager_range = manager_ranges.get(department_id)
+        if manager_range is not None:
+            head, low, high = manager_range
+            if index != head and not low <= tin[index] < high:
+                stats["outside_manager_subtree"] += 1
+
+    wide_managers.sort(key=lambda item: (-item[0], ids[item[1]]))
+
+    # Проверки согласованности руководителей отделов
+    issues = []
+    for department_id in sorted(set(department_managers) | {d for d in departments if d}):
+        stats = departments.get(department_id)
+        manager_id = department_managers.get(department_id)
+        if department_id not in department_managers:
+            issues.append({"department_id": department_id, "issue": "unknown_department",
+                           "employees": stats["headcount"]})
+            continue
+        if manager_id is None:
+            if stats:
+                issues.append({"department_id": department_id, "issue": "no_manager"})
+            continue
+        if department_id not in manager_ranges:
+            issues.append({"department_id": department_id, "issue": "manager_not_found", "manager_id": manager_id})
+            continue
+        manager_department = department[manager_ranges[department_id][0]]
+        if manager_department != department_id:
+            issues.append({"department_id": department_id, "issue": "manager_in_other_department",
+                           "manager_id": manager_id, "manager_department_id": manager_department or None})
+        if stats and stats["outside_manager_subtree"]:
+            issues.append({"department_id": department_id, "issue": "employees_outside_manager_subtree",
+                           "manager_id": manager_id, "employees": stats["outside_manager_subtree"]})
+
+    return {
+        "hierarchy_version": snapshot.version,
+        "employees": len(ids),
+        "roots": snapshot.roots,
+        "max_depth": snapshot.max_depth,
+        "managers": managers_total,
+        "span_threshold": span_threshold,
+        "span_distribution": {
+            _bucket_label(low, high): count for (low, high), count in zip(SPAN_BUCKETS, span_counts)
+        },
+        "wide_span_managers": {
+            "total": len(wide_managers),
+            "items": [
+                {"employee_id": ids[index], "department_id": department[index] or None,
+                 "direct_reports": span, "subtree_size": size[index] - 1}
+                for span, index in wide_managers[:limit]
+            ]
+        },
+        "cross_department_reporting": {
+            "total": cross_total,
+            "items": cross_department
+        },
+        "departments": [
+            {
+                "department_id": department_id or None,
+                "manager_id": department_managers.get(department_id),
+                "headcount": stats["headcount"],
+                "max_depth": stats["max_depth"],
+                "levels": stats["max_depth"] - stats["min_depth"] + 1,
+                "managers": stats["managers"],
+                "max_span": stats["max_span"],
+                "cross_department_managers": stats["cross_department_managers"],
+            }
+            for department_id, stats in sorted(departments.items())
+        ],
+        "department_manager_issues": issues,
+        "computed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+class OrgAnalyticsCache:
+    """Результаты аналитики для текущей версии иерархии"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, service, span_threshold, limit):
+        version = service.version
+        key = (span_threshold, limit)
+        with self._lock:
+            if version == self._version and key in self._results:
+                self.hits += 1
+                return self._results[key]
+        # Версия прочитана до данных: при гонке с обновлением результат просто пересчитается
+        snapshot, department_managers = service.snapshot, service.department_managers
+        result = compute_org_analytics(snapshot, department_managers, span_threshold, limit)
+        with self._lock:
+            self.misses += 1
+            if version != self._version:
+                self._version = version
+                self._results = {}
+            self._results[key] = result
+        return result
+
+
+ORG_ANALYTICS = OrgAnalyticsCache()
@@ -0,0 +1,405 @@
+"""
+Снимок оргструктуры в памяти процесса.
+
+Дерево подчинения хранится компактными массивами (модуль array):
+  ids          - employee_id по возрастанию (поиск узла - bisect)
+  parent       - индекс руководителя (-1 для корня)
+  child_start  - смещения списков подчиненных (CSR), child_index - сами списки
+  order        - обход в глубину (pre-order): поддерево узла v - это
+                 отрезок order[tin[v] : tin[v] + size[v]] (интервалы эйлерова обхода)
+  depth, size  - глубина и размер поддерева
+  department   - отдел сотрудника (0 - не указан)
+
+Снимок неизменяемый: обновление строит новый снимок и атомарно подменяет ссылку,
+поэтому чтение не требует блокировок. Изменения приходят через LISTEN/NOTIFY
+(канал org_chart, триггеры на employees и departments) и применяются к массивам
+руководителей и отделов без обращения к базе; производные массивы пересобираются в памяти.
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import text
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ORG_CHART_ENABLED = os.getenv("ORG_CHART_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+ORG_CHART_CHANNEL = "org_chart"
+# Изменения копятся, пока поток уведомлений не затихнет на это время (массовые переназначения)
+ORG_CHART_DEBOUNCE_SECONDS = float(os.getenv("ORG_CHART_DEBOUNCE_MS", "200")) / 1000
+# Пауза перед переподключением слушателя после ошибки
+ORG_CHART_RECONNECT_SECONDS = 5
+
+DELETED = object()
+
+
+class OrgSnapshot:
+    """Неизменяемое дерево подчинения на массивах"""
+
+    def __init__(self, ids, manager_ids, departments=None, version=0):
+        n = len(ids)
+        self.ids = ids
+        self.department = departments if departments is not None else array("i", [0]) * n
+        self.version = version
+
+        position = {employee_id: index for index, employee_id in enumerate(ids)}
+        parent = array("i", [-1]) * n
+        child_count = array("i", [0]) * (n + 1)
+        for index, manager_id in enumerate(manager_ids):
+            manager_index = position.get(manager_id, -1) if manager_id else -1
+            if manager_index != index:
+                parent[index] = manager_index
+            if parent[index] >= 0:
+                child_count[parent[index]] += 1
+        del position
+
+        # Списки подчиненных в формате CSR
+        child_start = array("i", [0]) * (n + 1)
+        total = 0
+        for index in range(n):
+            child_start[index] = total
+            total += child_count[index]
+        child_start[n] = total
+        fill = array("i", child_start)
+        child_index = array("i", [0]) * total
+        for index in range(n):
+            manager_index = parent[index]
+            if manager_index >= 0:
+                child_index[fill[manager_index]] = index
+                fill[manager_index] += 1
+
+        # Обход в глубину от корней; узлы, недостижимые из корней (цикл), становятся корнями
+        order = array("i")
+        tin = array("i", [-1]) * n
+        depth = array("i", [0]) * n
+        roots = [index for index in range(n) if parent[index] < 0]
+        for start in roots + list(range(n)):
+            if tin[start] >= 0:
+                continue
+            if parent[start] >= 0:
+                parent[start] = -1
+                roots.append(start)
+            stack = [start]
+            while stack:
+                node = stack.pop()
+                tin[node] = len(order)
+                order.append(node)
+                node_depth = depth[node] + 1
+                for k in range(child_start[node + 1] - 1, child_start[node] - 1, -1):
+                    child = child_index[k]
+                    if tin[child] < 0:
+                        depth[child] = node_depth
+                        stack.append(child)
+
+        size = array("i", [1]) * n
+        for k in range(n - 1, -1, -1):
+            node = order[k]
+            if parent[node] >= 0:
+                size[parent[node]] += size[node]
+
+        self.parent = parent
+        self.child_start = child_start
+        self.child_index = child_index
+        self.order = order
+        self.tin = tin
+        self.depth = depth
+        self.size = size
+        self.roots = len(roots)
+        self.max_depth = max(depth) if n else 0
+
+    # ----- поиск -----
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, employee_id):
+        return self._find(employee_id) >= 0
+
+    def _find(self, employee_id):
+        index = bisect_left(self.ids, employee_id)
+        if index < len(self.ids) and self.ids[index] == employee_id:
+            return index
+        return -1
+
+    def index_of(self, employee_id):
+        index = self._find(employee_id)
+        if index < 0:
+            raise KeyError(employee_id)
+        return index
+
+    # ----- запросы -----
+
+    def manager_of(self, employee_id):
+        parent = self.parent[self.index_of(employee_id)]
+        return self.ids[parent] if parent >= 0 else None
+
+    def depth_of(self, employee_id):
+        return self.depth[self.index_of(employee_id)]
+
+    def subtree_size(self, employee_id):
+        """Число всех подчиненных (прямых и косвенных)"""
+        return self.size[self.index_of(employee_id)] - 1
+
+    def span_of_control(self, employee_id):
+        """Число прямых подчиненных"""
+        index = self.index_of(employee_id)
+        return self.child_start[index + 1] - self.child_start[index]
+
+    def direct_reports(self, employee_id):
+        index = self.index_of(employee_id)
+        return [self.ids[child] for child in self.child_index[self.child_start[index]:self.child_start[index + 1]]]
+
+    def reporting_path(self, employee_id):
+        """Цепочка руководителей от вершины до сотрудника включительно"""
+        index = self.index_of(employee_id)
+        path = []
+        while index >= 0:
+            path.append(self.ids[index])
+            index = self.parent[index]
+        path.reverse()
+        return path
+
+    def is_subordinate(self, employee_id, manager_id):
+        """Входит ли сотрудник в поддерево руководителя (проверка по интервалам обхода)"""
+        node, manager = self.index_of(employee_id), self.index_of(manager_id)
+        return node != manager and self.tin[manager] <= self.tin[node] < self.tin[manager] + self.size[manager]
+
+    def subordinates(self, employee_id, skip=0, limit=None):
+        """Подчиненные в порядке обхода в глубину: (employee_id, уровень относительно руководителя)"""
+        index = self.index_of(employee_id)
+        start = self.tin[index] + 1 + skip
+        end = self.tin[index] + self.size[index]
+        if limit is not None:
+            end = min(end, start + limit)
+        base_depth = self.depth[index]
+        return [(self.ids[node], self.depth[node] - base_depth) for node in self.order[start:end]]
+
+    def describe(self, employee_id):
+        return {
+            "employee_id": employee_id,
+            "manager_id": self.manager_of(employee_id),
+            "depth": self.depth_of(employee_id),
+            "span_of_control": self.span_of_control(employee_id),
+            "subtree_size": self.subtree_size(employee_id),
+            "reporting_path": self.reporting_path(employee_id),
+        }
+
+    # ----- изменения -----
+
+    def manager_ids(self):
+        return array("i", (self.ids[parent] if parent >= 0 else 0 for parent in self.parent))
+
+    def apply(self, changes):
+        """Новый снимок с изменениями {employee_id: (manager_id, department_id) | DELETED}"""
+        managers = self.manager_ids()
+        departments = array("i", self.department)
+        if all(employee_id in self and value is not DELETED for employee_id, value in changes.items()):
+            # Только переназначения: набор узлов не меняется
+            for employee_id, (manager_id, department_id) in changes.items():
+                index = self.index_of(employee_id)
+                managers[index] = manager_id or 0
+                departments[index] = department_id or 0
+            return OrgSnapshot(self.ids, managers, departments, self.version + 1)
+
+        merged = {
+            employee_id: (manager_id, department_id)
+            for employee_id, manager_id, department_id in zip(self.ids, managers, departments)
+        }
+        for employee_id, value in changes.items():
+            if value is DELETED:
+                merged.pop(employee_id, None)
+            else:
+                merged[employee_id] = (value[0] or 0, value[1] or 0)
+        ids = array("i", sorted(merged))
+        return OrgSnapshot(
+            ids,
+            array("i", (merged[employee_id][0] for employee_id in ids)),
+            array("i", (merged[employee_id][1] for employee_id in ids)),
+            self.version + 1,
+        )
+
+    def memory_bytes(self):
+        """Объем массивов снимка в байтах"""
+        return sum(
+            len(values) * values.itemsize
+            for values in (self.ids, self.parent, self.child_start, self.child_index,
+                           self.order, self.tin, self.depth, self.size, self.department)
+        )
+
+
+def load_hierarchy(connection, version=0):
+    """Снимок дерева и руководители отделов {department_id: manager_id} одним чтением из базы"""
+    ids, managers, departments = array("i"), array("i"), array("i")
+    result = connection.execute(text(
+        "SELECT employee_id, COALESCE(manager_id, 0), COALESCE(department_id, 0) "
+        "FROM employees ORDER BY employee_id"
+    ))
+    for employee_id, manager_id, department_id in result:
+        ids.append(employee_id)
+        managers.append(manager_id)
+        departments.append(department_id)
+    department_managers = dict(connection.execute(text(
+        "SELECT department_id, manager_id FROM departments"
+    )).all())
+    return OrgSnapshot(ids, managers, departments, version), department_managers
+
+
+class OrgChartService:
+    """Загрузка снимка при старте и обновление по уведомлениям PostgreSQL"""
+
+    def __init__(self):
+        self.snapshot = None
+        # Руководители отделов {department_id: manager_id} и счетчик их изменений
+        self.department_managers = {}
+        self.departments_version = 0
+        self.loaded_at = None
+        self.last_build_ms = 0
+        self.notifications = 0
+        self.full_reloads = 0
+        self.listening = False
+        self._engine = None
+        self._dsn = None
+        self._stop = threading.Event()
+        self._first_attempt = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.snapshot is not None
+
+    @property
+    def version(self):
+        """Версия иерархии: меняется при любом изменении сотрудников или руководителей отделов"""
+        return (self.snapshot.version if self.snapshot else -1, self.departments_version)
+
+    def reload(self):
+        """Полная загрузка дерева из базы"""
+        start = time.perf_counter()
+        with self._engine.connect() as connection:
+            snapshot, department_managers = load_hierarchy(
+                connection, self.snapshot.version + 1 if self.snapshot else 0
+            )
+        self.snapshot = snapshot
+        self.department_managers = department_managers
+        self.departments_version += 1
+        self.last_build_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.loaded_at = time.time()
+        self.full_reloads += 1
+        logger.info("Снимок оргструктуры загружен: %d сотрудников за %s мс", len(snapshot), self.last_build_ms)
+
+    def start(self, engine, dsn):
+        """
+        Запуск слушателя уведомлений. Снимок загружает слушатель после LISTEN, иначе
+        изменения между загрузкой и LISTEN потерялись бы; старт ждет первой попытки
+        """
+        self._engine = engine
+        self._dsn = dsn
+        self._stop.clear()
+        self._first_attempt.clear()
+        self._thread = threading.Thread(target=self._listen_forever, name="org-chart-listener", daemon=True)
+        self._thread.start()
+        self._first_attempt.wait()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=ORG_CHART_RECONNECT_SECONDS)
+
+    def apply_changes(self, changes):
+        start = time.perf_counter()
+        self.snapshot = self.snapshot.apply(changes)
+        self.last_build_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    # ----- слушатель LISTEN/NOTIFY -----
+
+    def _listen_forever(self):
+        import psycopg2  # драйвер нужен только для LISTEN, движок SQLAlchemy его не выдает
+
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(self._dsn)
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {ORG_CHART_CHANNEL}")
+                self.listening = True
+                # Уведомления, пришедшие до LISTEN, потеряны - дерево читается после него
+                self.reload()
+                self._first_attempt.set()
+                self._consume(connection)
+            except Exception as e:
+                logger.warning("Слушатель оргструктуры: %s", e)
+            finally:
+                self._first_attempt.set()
+                self.listening = False
+                if connection is not None:
+                    connection.close()
+            self._stop.wait(ORG_CHART_RECONNECT_SECONDS)
+
+    def _consume(self, connection):
+        changes = {}
+        while not self._stop.is_set():
+            timeout = ORG_CHART_DEBOUNCE_SECONDS if changes else 1.0
+            if select.select([connection], [], [], timeout) == ([], [], []):
+                if changes:
+                    self.apply_changes(changes)
+                    changes = {}
+                continue
+            connection.poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                self.notifications += 1
+                payload = json.loads(notify.payload)
+                if payload["op"] == "DEPARTMENT":
+                    self._apply_department(payload)
+                elif payload["op"] == "DELETE":
+                    changes[payload["employee_id"]] = DELETED
+                else:
+                    changes[payload["employee_id"]] = (payload.get("manager_id"), payload.get("department_id"))
+
+    def _apply_department(self, payload):
+        department_managers = dict(self.department_managers)
+        if payload.get("deleted"):
+            department_managers.pop(payload["department_id"], None)
+        else:
+            department_managers[payload["department_id"]] = payload.get("manager_id")
+        self.department_managers = department_managers
+        self.departments_version += 1
+
+    # ----- отчет -----
+
+    def stats(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"ready": False, "enabled": ORG_CHART_ENABLED, "listening": self.listening}
+        return {
+            "ready": True,
+            "enabled": ORG_CHART_ENABLED,
+            "listening": self.listening,
+            "version": snapshot.version,
+            "employees": len(snapshot),
+            "roots": snapshot.roots,
+            "max_depth": snapshot.max_depth,
+            "memory_bytes": snapshot.memory_bytes(),
+            "bytes_per_employee": round(snapshot.memory_bytes() / len(snapshot), 1) if len(snapshot) else 0,
+            "last_build_ms": self.last_build_ms,
+            "loaded_at": self.loaded_at,
+            "notifications": self.notifications,
+            "full_reloads": self.full_reloads,
+        }
+
+
+ORG_CHART = OrgChartService()
+
+metrics.REGISTRY.gauge("org_chart_employees", "Сотрудников в снимке оргструктуры").set_function(
+    lambda: len(ORG_CHART.snapshot) if ORG_CHART.snapshot is not None else 0
+)
+metrics.REGISTRY.gauge("org_chart_memory_bytes", "Объем массивов снимка оргструктуры").set_function(
+    lambda: ORG_CHART.snapshot.memory_bytes() if ORG_CHART.snapshot is not None else 0
+)
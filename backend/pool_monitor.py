@@ -0,0 +1,251 @@
+"""
+Телеметрия пула соединений с базой данных.
+
+Собирает живую статистику пула (занятые соединения, overflow, очередь ожидания,
+время выдачи соединения, возраст соединений, инвалидации) и на основе наблюдаемой
+конкурентности рассчитывает рекомендуемый размер пула.
+"""
+import math
+import threading
+import time
+import weakref
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+import metrics
+
+# Сколько последних наблюдений хранить для расчета перцентилей
+SAMPLE_SIZE = 10000
+
+DB_POOL_PRE_PING = metrics.REGISTRY.histogram(
+    "db_pool_pre_ping_seconds",
+    "Время проверки соединения (pre-ping и checkout-обработчики) при выдаче из пула",
+)
+DB_POOL_INVALIDATIONS = metrics.REGISTRY.counter(
+    "db_pool_invalidations_total",
+    "Количество инвалидаций соединений пула",
+    ("kind",),
+)
+DB_POOL_CONNECTS = metrics.REGISTRY.counter(
+    "db_pool_connects_total",
+    "Количество открытых физических соединений",
+)
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class PoolMonitor:
+    """Сборщик статистики пула, подключаемый к движку через события SQLAlchemy"""
+
+    def __init__(self):
+        self.engine = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._records = weakref.WeakSet()
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self._wait_samples = deque(maxlen=SAMPLE_SIZE)
+        self._concurrency_samples = deque(maxlen=SAMPLE_SIZE)
+
+    # ----- вызовы из InstrumentedQueuePool -----
+
+    def wait_started(self, blocking):
+        if not blocking:
+            return
+        with self._lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+    def wait_finished(self, blocking, elapsed):
+        with self._lock:
+            if blocking:
+                self.waiting -= 1
+            self._wait_samples.append(elapsed)
+        self._local.got_connection_at = time.perf_counter()
+        metrics.DB_POOL_CHECKOUT_WAIT.observe(elapsed)
+
+    def reset_observations(self):
+        """Сброс пиков и выборок (после прогрева пула: одновременные выдачи не нагрузка)"""
+        with self._lock:
+            self.peak_waiting = self.waiting
+            self.peak_checked_out = self.engine.pool.checkedout() if self.engine is not None else 0
+            self._wait_samples.clear()
+            self._concurrency_samples.clear()
+
+    # ----- обработчики событий пула -----
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self._records.add(connection_record)
+        DB_POOL_CONNECTS.inc()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        # Разница между получением соединения из очереди и событием checkout -
+        # это стоимость pre-ping (и других checkout-обработчиков)
+        got_at = getattr(self._local, "got_connection_at", None)
+        if got_at is not None:
+            DB_POOL_PRE_PING.observe(time.perf_counter() - got_at)
+            self._local.got_connection_at = None
+
+        checked_out = self.engine.pool.checkedout() if self.engine is not None else 0
+        with self._lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            self._concurrency_samples.append(checked_out)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        DB_POOL_INVALIDATIONS.inc(kind="hard")
+
+    def _on_soft_invalidate(self, dbapi_connection, connection_record, exception):
+        DB_POOL_INVALIDATIONS.inc(kind="soft")
+
+    def install(self, engine):
+        """Подписка на события пула движка и регистрация датчиков метрик"""
+        self.engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "soft_invalidate", self._on_soft_invalidate)
+
+        for name, documentation, key in (
+            ("db_pool_size", "Настроенный размер пула", "pool_size"),
+            ("db_pool_checked_out", "Соединений выдано из пула", "checked_out"),
+            ("db_pool_overflow", "Соединений сверх pool_size", "overflow"),
+            ("db_pool_waiting", "Потоков в очереди ожидания соединения", "waiting"),
+            ("db_pool_connections", "Открытых физических соединений", "open_connections"),
+            ("db_pool_connection_age_max_seconds", "Возраст самого старого соединения", "max_age_seconds"),
+        ):
+            gauge = metrics.REGISTRY.gauge(name, documentation)
+            gauge.set_function(lambda key=key: self._current()[key])
+
+    # ----- отчеты -----
+
+    def _connection_ages(self):
+        now = time.time()
+        return [
+            now - record.starttime
+            for record in list(self._records)
+            if record.dbapi_connection is not None
+        ]
+
+    def _current(self):
+        pool = self.engine.pool
+        ages = self._connection_ages()
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "waiting": self.waiting,
+            "open_connections": len(ages),
+            "max_age_seconds": round(max(ages), 1) if ages else 0,
+        }
+
+    def stats(self):
+        """Живая статистика пула"""
+        ages = self._connection_ages()
+        with self._lock:
+            waits = list(self._wait_samples)
+            concurrency = list(self._concurrency_samples)
+            peak_waiting = self.peak_waiting
+            peak_checked_out = self.peak_checked_out
+            checkouts = self.checkouts
+
+        return {
+            "current": self._current(),
+            "checkouts": checkouts,
+            "peak_checked_out": peak_checked_out,
+            "peak_waiting": peak_waiting,
+            "checkout_wait_ms": {
+                "p50": round(_percentile(waits, 50) * 1000, 3),
+                "p95": round(_percentile(waits, 95) * 1000, 3),
+                "p99": round(_percentile(waits, 99) * 1000, 3),
+                "max": round(max(waits) * 1000, 3) if waits else 0,
+            },
+            "concurrency": {
+                "p50": _percentile(concurrency, 50),
+                "p95": _percentile(concurrency, 95),
+                "p99": _percentile(concurrency, 99),
+            },
+            "connection_age_seconds": {
+                "min": round(min(ages), 1) if ages else 0,
+                "avg": round(sum(ages) / len(ages), 1) if ages else 0,
+                "max": round(max(ages), 1) if ages else 0,
+            },
+            "invalidations": {
+                "hard": DB_POOL_INVALIDATIONS.value(kind="hard"),
+                "soft": DB_POOL_INVALIDATIONS.value(kind="soft"),
+            },
+            "connects": DB_POOL_CONNECTS.value(),
+        }
+
+    def recommendation(self, pool_size, max_overflow):
+        """
+        Рекомендуемые размеры пула по наблюдаемой конкурентности:
+        постоянная часть покрывает p95 одновременно занятых соединений с запасом 25%,
+        overflow - пиковые всплески сверх нее.
+        """
+        with self._lock:
+            concurrency = list(self._concurrency_samples)
+            waits = list(self._wait_samples)
+            peak_checked_out = self.peak_checked_out
+            peak_waiting = self.peak_waiting
+
+        if not concurrency:
+            return {
+                "pool_size": pool_size,
+                "max_overflow": max_overflow,
+                "reason": "Недостаточно наблюдений: пул еще не использовался",
+            }
+
+        recommended_size = max(1, math.ceil(_percentile(concurrency, 95) * 1.25))
+        recommended_overflow = max(0, peak_checked_out + peak_waiting - recommended_size)
+        saturated = peak_waiting > 0 or peak_checked_out >= pool_size + max_overflow
+
+        if saturated:
+            reason = "Пул насыщался: запросы ждали свободного соединения"
+        elif recommended_size < pool_size:
+            reason = "Пул избыточен: большая часть соединений простаивает"
+        else:
+            reason = "Размер пула соответствует нагрузке"
+
+        return {
+            "pool_size": recommended_size,
+            "max_overflow": recommended_overflow,
+            "saturated": saturated,
+            "observed_p95_concurrency": _percentile(concurrency, 95),
+            "observed_peak_concurrency": peak_checked_out,
+            "observed_p95_wait_ms": round(_percentile(waits, 95) * 1000, 3),
+            "samples": len(concurrency),
+            "reason": reason,
+        }
+
+
+MONITOR = PoolMonitor()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool, замеряющий время ожидания свободного соединения.
+    Время включает ожидание в очереди и открытие нового соединения сверх пула.
+    """
+
+    def _do_get(self):
+        # Поток встает в очередь, только если нет свободных соединений
+        # и лимит overflow исчерпан
+        blocking = self.checkedin() == 0 and self._max_overflow > -1 and self.overflow() >= self._max_overflow
+        MONITOR.wait_started(blocking)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            MONITOR.wait_finished(blocking, time.perf_counter() - start)
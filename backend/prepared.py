@@ -0,0 +1,192 @@
+"""
+Реестр именованных подготовленных запросов (server-side prepared statements).
+
+Отчетные эндпоинты выполняют одни и те же запросы (в том числе рекурсивные CTE),
+и PostgreSQL каждый раз заново разбирает и планирует их. Запрос из реестра
+подготавливается командой PREPARE один раз на физическое соединение пула
+(множество подготовленных имен хранится в Connection.info, которое живет вместе
+с DBAPI-соединением), а дальше выполняется через EXECUTE. После пяти выполнений
+PostgreSQL переходит на общий (generic) план, если он не хуже частных, и
+планирование не выполняется вовсе.
+
+Драйвер psycopg2 не поддерживает подготовку на уровне протокола, поэтому
+используются SQL-команды PREPARE/EXECUTE. При работе через pgbouncer в режиме
+transaction pooling реестр нужно выключить (PREPARED_STATEMENTS=false).
+"""
+import json
+import logging
+import os
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PREPARED_STATEMENTS_ENABLED = os.getenv("PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes", "on")
+
+# Именованный параметр :name (но не приведение типа ::int)
+_PARAMETER = re.compile(r"(?<![:\w]):(\w+)")
+
+# Подготовленного запроса нет на соединении (DISCARD ALL, пул без reset) или
+# изменилась структура таблиц и кэшированный план не может вернуть прежние столбцы
+_REPREPARE_CODES = ("26000", "0A000")
+
+PREPARES = metrics.REGISTRY.counter(
+    "db_prepared_statement_prepares_total",
+    "Количество выполненных PREPARE (подготовка запроса на соединении)",
+    ("query",),
+)
+EXECUTIONS = metrics.REGISTRY.counter(
+    "db_prepared_statement_executions_total",
+    "Количество выполнений запросов из реестра подготовленных запросов",
+    ("query",),
+)
+REPREPARES = metrics.REGISTRY.counter(
+    "db_prepared_statement_reprepares_total",
+    "Повторные подготовки после ошибки устаревшего подготовленного запроса",
+    ("query",),
+)
+
+
+class PreparedQuery:
+    """Запрос реестра: исходный SQL с :параметрами и команды PREPARE/EXECUTE"""
+
+    def __init__(self, name, sql, param_types=None):
+        self.name = name
+        self.sql = sql
+        self.params = []
+
+        def placeholder(match):
+            if match.group(1) not in self.params:
+                self.params.append(match.group(1))
+            return f"${self.params.index(match.group(1)) + 1}"
+
+        prepared_sql = _PARAMETER.sub(placeholder, sql)
+        param_types = param_types or {}
+        types = ", ".join(param_types.get(param, "unknown") for param in self.params)
+        self.prepare_sql = f"PREPARE {name}" + (f" ({types})" if self.params else "") + f" AS {prepared_sql}"
+        arguments = ", ".join(f":{param}" for param in self.params)
+        self.execute_sql = f"EXECUTE {name}" + (f"({arguments})" if self.params else "")
+        self.plain_statement = text(sql)
+        self.execute_statement = text(self.execute_sql)
+
+        self.last_params = None
+        self.planning = None
+
+
+class PreparedStatementRegistry:
+    """Именованные запросы и их выполнение через PREPARE/EXECUTE"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.queries = {}
+
+    def register(self, name, sql, param_types=None):
+        query = PreparedQuery(name, sql, param_types)
+        self.queries[name] = query
+        return query
+
+    @staticmethod
+    def _prepared_names(connection):
+        return connection.info.setdefault("prepared_statements", set())
+
+    def _ensure_prepared(self, connection, query):
+        prepared = self._prepared_names(connection)
+        if query.name not in prepared:
+            connection.exec_driver_sql(query.prepare_sql)
+            prepared.add(query.name)
+            PREPARES.inc(query=query.name)
+
+    def execute(self, db, name, params=None):
+        """Выполнение запроса реестра в сессии db; без реестра - обычный text()"""
+        query = self.queries[name]
+        params = params or {}
+        query.last_params = params
+        if not self.enabled:
+            return db.execute(query.plain_statement, params)
+
+        connection = db.connection()
+        self._ensure_prepared(connection, query)
+        EXECUTIONS.inc(query=name)
+        try:
+            return connection.execute(query.execute_statement, params)
+        except DBAPIError as e:
+            if getattr(e.orig, "pgcode", None) not in _REPREPARE_CODES:
+                raise
+            # Ошибка прервала транзакцию: откат, подготовка заново и один повтор
+            logger.warning("Подготовленный запрос %s устарел, подготавливается заново: %s", name, e.orig)
+            db.rollback()
+            connection = db.connection()
+            connection.exec_driver_sql("DEALLOCATE ALL")
+            self._prepared_names(connection).clear()
+            REPREPARES.inc(query=name)
+            self._ensure_prepared(connection, query)
+            return connection.execute(query.execute_statement, params)
+
+    # ----- замер экономии планирования -----
+
+    @staticmethod
+    def _planning_ms(connection, sql, params):
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON, SUMMARY) {sql}"), params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Planning Time"]
+
+    def measure_planning(self, db, name, params=None, repeat=7):
+        """
+        Время планирования обычного запроса и EXECUTE подготовленного (минимум из repeat
+        замеров; после пяти выполнений PostgreSQL может перейти на общий план)
+        """
+        query = self.queries[name]
+        params = params if params is not None else (query.last_params or {})
+        connection = db.connection()
+        self._ensure_prepared(connection, query)
+        plain = min(self._planning_ms(connection, query.sql, params) for _ in range(repeat))
+        prepared = min(self._planning_ms(connection, query.execute_sql, params) for _ in range(repeat))
+
+        plans = None
+        try:
+            row = connection.execute(
+                text("SELECT generic_plans, custom_plans FROM pg_prepared_statements WHERE name = :name"),
+                {"name": name}
+            ).first()
+            if row is not None:
+                plans = {"generic": row.generic_plans, "custom": row.custom_plans}
+        except DBAPIError:
+            # Столбцы generic_plans/custom_plans появились в PostgreSQL 14
+            db.rollback()
+
+        query.planning = {
+            "plain_ms": round(plain, 3),
+            "prepared_ms": round(prepared, 3),
+            "plans_on_connection": plans,
+        }
+        return query.planning
+
+    def stats(self):
+        """Подготовки, выполнения, попадания в кэш подготовленных запросов и экономия планирования"""
+        result = {}
+        for name, query in self.queries.items():
+            executions = EXECUTIONS.value(query=name)
+            prepares = PREPARES.value(query=name)
+            hits = max(0, executions - prepares)
+            entry = {
+                "params": query.params,
+                "executions": executions,
+                "prepares": prepares,
+                "reprepares": REPREPARES.value(query=name),
+                "cache_hits": hits,
+                "cache_hit_ratio": round(hits / executions, 4) if executions else None,
+                "planning": query.planning,
+            }
+            if query.planning:
+                saved = query.planning["plain_ms"] - query.planning["prepared_ms"]
+                entry["estimated_planning_saved_ms"] = round(max(0.0, saved) * executions, 1)
+            result[name] = entry
+        return {"enabled": self.enabled, "queries": result}
+
+
+REGISTRY = PreparedStatementRegistry(PREPARED_STATEMENTS_ENABLED)
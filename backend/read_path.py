@@ -0,0 +1,215 @@
+"""
+Быстрый путь чтения для списочных эндпоинтов.
+
+Обычный путь загружает ORM-объекты (identity map, отслеживание изменений), после
+чего FastAPI заново валидирует каждое поле через response_model (EmailStr,
+валидаторы hire_date/salary) для данных, которые уже прошли проверки при записи.
+
+Здесь выбираются только нужные столбцы строками SQLAlchemy Core, модели ответа
+собираются через model_construct (без валидации) и сериализуются в JSON одним
+вызовом pydantic-core. Формат ответа совпадает с обычным путем (фонд зарплат отдела
+суммируется во float, как в ORM-свойстве; в последнем знаке суммы возможны расхождения
+из-за порядка сложения).
+
+?fields= сужает и SELECT, и модель ответа до перечисленных полей (для списков в
+интерфейсе - имя, отдел, должность), а ?include= добавляет названия связанных
+отдела и должности JOIN-ом вместо отдельных запросов клиента.
+"""
+import os
+from decimal import Decimal
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter, create_model
+from sqlalchemy import Column, Float, MetaData, Table, func, select, type_coerce, union_all
+from sqlalchemy.types import TypeDecorator
+
+import models
+
+# Выключение возвращает эндпоинты на ORM и валидацию response_model (для сравнения)
+FAST_READ_PATH = os.getenv("FAST_READ_PATH", "true").lower() in ("1", "true", "yes", "on")
+
+_employees = models.Employee.__table__
+_departments = models.Department.__table__
+_positions = models.Position.__table__
+
+# Архив уволенных сотрудников (17_employee_archive.sql) - те же столбцы, что у employees
+_employees_archive = Table(
+    "employees_archive", MetaData(),
+    *(Column(column.name, column.type) for column in _employees.columns),
+)
+
+
+def _employee_columns(table):
+    c = table.c
+    return (
+        c.employee_id, c.first_name, c.last_name,
+        c.email, c.phone, c.hire_date, c.birth_date,
+        c.salary, c.department_id, c.position_id,
+        c.manager_id, c.address, c.city, c.country,
+        c.postal_code, c.employment_type, c.is_active,
+        c.created_at, c.updated_at,
+        (c.first_name + " " + c.last_name).label("full_name"),
+    )
+
+
+EMPLOYEE_COLUMNS = _employee_columns(_employees)
+ARCHIVED_EMPLOYEE_COLUMNS = _employee_columns(_employees_archive)
+
+POSITION_COLUMNS = (
+    _positions.c.position_id, _positions.c.position_title, _positions.c.position_code,
+    _positions.c.description, _positions.c.min_salary, _positions.c.max_salary,
+    _positions.c.grade_level, _positions.c.is_active, _positions.c.created_at,
+)
+
+class _OrmSalaryTotal(TypeDecorator):
+    """
+    Фонд зарплат в представлении ORM-свойства Department.total_salary_budget: сумма float
+    (0 - целым, если суммировать нечего), которую response_model приводит к Decimal через str.
+    Без этого NUMERIC-сумма сериализуется как "150000.00" вместо "150000.0"
+    """
+    impl = Float
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        if not value:
+            return Decimal(0)
+        return Decimal(str(float(value)))
+
+
+# Фонд зарплат и численность активных сотрудников коррелированными подзапросами:
+# считаются только для отделов страницы по индексу employees(department_id)
+# (ORM-свойства Department загружают всех сотрудников каждого отдела)
+_active_in_department = (
+    (_employees.c.department_id == _departments.c.department_id) & _employees.c.is_active.is_(True)
+)
+
+DEPARTMENT_COLUMNS = (
+    _departments.c.department_id, _departments.c.department_name, _departments.c.department_code,
+    _departments.c.budget, _departments.c.manager_id, _departments.c.location,
+    _departments.c.description, _departments.c.established_date, _departments.c.is_active,
+    _departments.c.created_at,
+    # Сумма во float, как в ORM-свойстве
+    type_coerce(
+        select(func.coalesce(func.sum(_employees.c.salary.cast(Float)), 0)).where(_active_in_department)
+        .scalar_subquery(),
+        _OrmSalaryTotal(),
+    ).label("total_salary_budget"),
+    select(func.count()).where(_active_in_department)
+    .scalar_subquery().label("employee_count"),
+)
+
+
+# Поля для ?fields= (в порядке полного ответа) и связанные названия для ?include=
+EMPLOYEE_FIELDS = tuple(column.name for column in EMPLOYEE_COLUMNS)
+DEPARTMENT_FIELDS = tuple(column.name for column in DEPARTMENT_COLUMNS)
+EMPLOYEE_INCLUDES = {
+    "department": (_departments, _departments.c.department_name, "department_id"),
+    "position": (_positions, _positions.c.position_title, "position_id"),
+}
+
+
+def parse_fields(value, allowed, key=None):
+    """
+    Список полей из строки "a,b,c" в порядке allowed; ключ key выбирается всегда
+    (по нему сортируется объединение с архивом и строятся ссылки на запись).
+    None - все поля. Неизвестное поле - ValueError.
+    """
+    if value is None:
+        return None
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}. Доступны: {', '.join(allowed)}")
+    if key:
+        requested.add(key)
+    return tuple(name for name in allowed if name in requested)
+
+
+def parse_includes(value):
+    return parse_fields(value, tuple(EMPLOYEE_INCLUDES)) or ()
+
+
+def _employee_select(table, fields, includes):
+    columns = {column.name: column for column in _employee_columns(table)}
+    query = select(*(columns[name] for name in (fields or EMPLOYEE_FIELDS)))
+    source = table
+    for name in includes:
+        related, title, foreign_key = EMPLOYEE_INCLUDES[name]
+        primary_key = related.c[foreign_key]
+        source = source.outerjoin(related, table.c[foreign_key] == primary_key)
+        query = query.add_columns(title)
+    return query.select_from(source)
+
+
+def employees_query(department_id=None, include_archived=False, fields=None, includes=()):
+    """
+    Сотрудники из employees; с include_archived - вместе с архивом, по employee_id.
+    fields - выбираемые столбцы (None - все), includes - связанные названия (EMPLOYEE_INCLUDES)
+    """
+    query = _employee_select(_employees, fields, includes)
+    if department_id:
+        query = query.where(_employees.c.department_id == department_id)
+    if not include_archived:
+        return query
+    archived = _employee_select(_employees_archive, fields, includes)
+    if department_id:
+        archived = archived.where(_employees_archive.c.department_id == department_id)
+    combined = union_all(query, archived).subquery()
+    return select(combined).order_by(combined.c.employee_id)
+
+
+def archived_employee_query(employee_id):
+    return select(*ARCHIVED_EMPLOYEE_COLUMNS).where(_employees_archive.c.employee_id == employee_id)
+
+
+def departments_query(fields=None):
+    """Отделы; без total_salary_budget и employee_count в fields подзапросы по сотрудникам не выполняются"""
+    if fields is None:
+        return select(*DEPARTMENT_COLUMNS)
+    columns = {column.name: column for column in DEPARTMENT_COLUMNS}
+    return select(*(columns[name] for name in fields))
+
+
+def positions_query():
+    return select(*POSITION_COLUMNS)
+
+
+_adapters = {}
+
+
+def _list_adapter(model):
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(list[model])
+    return adapter
+
+
+@lru_cache(maxsize=256)
+def sparse_model(model, fields, includes=()):
+    """
+    Модель ответа только с выбранными полями model и названиями из includes.
+    Поля необязательные: ответ собирается через model_construct, а типы нужны
+    для сериализации (Decimal, даты) так же, как в полной модели
+    """
+    definitions = {name: (Optional[model.model_fields[name].annotation], None) for name in fields}
+    for name in includes:
+        definitions[EMPLOYEE_INCLUDES[name][1].name] = (Optional[str], None)
+    return create_model(f"{model.__name__}Fields", **definitions)
+
+
+def warm_up(models_to_warm):
+    """Сборка сериализаторов при старте воркера, а не на первом запросе"""
+    for model in models_to_warm:
+        _list_adapter(model)
+
+
+def serialize_rows(model, rows):
+    """JSON-массив моделей ответа из строк Core без повторной валидации"""
+    items = [model.model_construct(**row._mapping) for row in rows]
+    return _list_adapter(model).dump_json(items)
+
+
+def json_rows_response(model, rows):
+    return Response(content=serialize_rows(model, rows), media_type="application/json")
@@ -0,0 +1,179 @@
+"""
+Порционное повышение зарплаты отделу.
+
+Порции выполняет SQL-функция salary_raise_batch (18_salary_raise_runs.sql), а здесь
+каждая порция фиксируется отдельной транзакцией, так что строки сотрудников
+заблокированы только на время своей порции. Параллельные запуски по одному отделу
+исключает advisory-блокировка сессии (снимается и при обрыве соединения, после чего
+запуск можно продолжить).
+
+Перед фиксацией каждой порции замеряется, кого она задерживает: сессии, ожидающие
+блокировок нашего процесса (pg_blocking_pids), и сколько они уже ждут. Вместе со
+временем удержания блокировок это сохраняется в salary_raise_runs.
+"""
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# Класс advisory-блокировки (второй ключ - department_id)
+SALARY_RAISE_LOCK_CLASS = 4601
+# Пауза и число попыток, пока отложенные строки остаются заблокированными
+SALARY_RAISE_RETRY_SECONDS = float(os.getenv("SALARY_RAISE_RETRY_MS", "200")) / 1000
+SALARY_RAISE_MAX_IDLE_ROUNDS = 50
+
+# Сессии, ожидающие блокировок текущей транзакции, и их ожидание на момент замера
+_BLOCKED_SQL = text("""
+    SELECT COUNT(*) AS sessions,
+           COALESCE(MAX(EXTRACT(EPOCH FROM clock_timestamp() - query_start) * 1000), 0) AS wait_ms
+    FROM pg_stat_activity
+    WHERE pg_backend_pid() = ANY (pg_blocking_pids(pid))
+""")
+
+_RECORD_LOCKS_SQL = text("""
+    UPDATE salary_raise_runs
+    SET lock_hold_ms_total = lock_hold_ms_total + :hold_ms,
+        lock_hold_ms_max = GREATEST(lock_hold_ms_max, :hold_ms),
+        blocked_sessions = blocked_sessions + :sessions,
+        blocked_wait_ms_max = GREATEST(blocked_wait_ms_max, :wait_ms)
+    WHERE run_id = :run_id
+""")
+
+
+class SalaryRaiseError(Exception):
+    """Запуск нельзя создать или продолжить"""
+
+
+def blocked_by_current_transaction(connection):
+    row = connection.execute(_BLOCKED_SQL).first()
+    return row.sessions, float(row.wait_ms)
+
+
+def start_run(db, department_id, percent, batch_size):
+    """Новый запуск; незавершенный запуск по отделу нужно продолжить или отменить"""
+    existing = db.execute(
+        text("SELECT run_id FROM salary_raise_runs WHERE department_id = :department_id AND status IN ('running', 'failed')"),
+        {"department_id": department_id}
+    ).scalar()
+    if existing is not None:
+        raise SalaryRaiseError(f"По отделу {department_id} есть незавершенный запуск {existing}")
+    run_id = db.execute(
+        text("""
+            INSERT INTO salary_raise_runs (department_id, increase_percentage, batch_size)
+            VALUES (:department_id, :percent, :batch_size)
+            RETURNING run_id
+        """),
+        {"department_id": department_id, "percent": percent, "batch_size": batch_size}
+    ).scalar()
+    db.commit()
+    return run_id
+
+
+def get_run(connection, run_id):
+    row = connection.execute(text("SELECT * FROM salary_raise_runs WHERE run_id = :run_id"), {"run_id": run_id}).first()
+    return dict(row._mapping) if row is not None else None
+
+
+def run(run_id):
+    """Выполнение (или продолжение) запуска до конца; возвращает итоговую запись запуска"""
+    with engine.connect() as connection:
+        raise_run = get_run(connection, run_id)
+        if raise_run is None:
+            raise SalaryRaiseError(f"Запуск {run_id} не найден")
+        if raise_run["status"] in ("completed", "cancelled"):
+            return raise_run
+
+        locked = connection.execute(
+            text("SELECT pg_try_advisory_lock(:lock_class, :department_id)"),
+            {"lock_class": SALARY_RAISE_LOCK_CLASS, "department_id": raise_run["department_id"]}
+        ).scalar()
+        if not locked:
+            connection.rollback()
+            raise SalaryRaiseError(f"Запуск по отделу {raise_run['department_id']} уже выполняется")
+        # Запуск могли отменить между чтением и блокировкой - тогда не возобновляем
+        resumed = connection.execute(
+            text("UPDATE salary_raise_runs SET status = 'running', error = NULL "
+                 "WHERE run_id = :run_id AND status IN ('running', 'failed')"),
+            {"run_id": run_id}
+        ).rowcount
+        connection.commit()
+        if not resumed:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:lock_class, :department_id)"),
+                {"lock_class": SALARY_RAISE_LOCK_CLASS, "department_id": raise_run["department_id"]}
+            )
+            connection.commit()
+            return get_run(connection, run_id)
+
+        try:
+            idle_rounds = 0
+            while True:
+                start = time.perf_counter()
+                batch = connection.execute(text("SELECT * FROM salary_raise_batch(:run_id)"), {"run_id": run_id}).first()
+                sessions, wait_ms = blocked_by_current_transaction(connection)
+                connection.execute(_RECORD_LOCKS_SQL, {
+                    "run_id": run_id,
+                    "hold_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "sessions": sessions,
+                    "wait_ms": round(wait_ms, 1),
+                })
+                connection.commit()
+
+                if batch.finished:
+                    break
+                if batch.processed == 0:
+                    # Остались только отложенные строки, и они все еще заняты
+                    idle_rounds += 1
+                    if idle_rounds >= SALARY_RAISE_MAX_IDLE_ROUNDS:
+                        logger.warning("Запуск %s: %d сотрудников заблокированы, запуск можно продолжить позже",
+                                       run_id, batch.deferred)
+                        break
+                    time.sleep(SALARY_RAISE_RETRY_SECONDS)
+                else:
+                    idle_rounds = 0
+        except Exception as e:
+            connection.rollback()
+            # Отмененный во время порции запуск остается cancelled: иначе 'failed'
+            # снова заблокировал бы отдел (idx_salary_raise_runs_active_department)
+            failed = connection.execute(
+                text("UPDATE salary_raise_runs SET status = 'failed', error = :error, updated_at = CURRENT_TIMESTAMP "
+                     "WHERE run_id = :run_id AND status = 'running'"),
+                {"run_id": run_id, "error": str(e)}
+            ).rowcount
+            connection.commit()
+            if failed:
+                raise
+            logger.info("Запуск %s отменен во время выполнения: %s", run_id, e)
+        finally:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:lock_class, :department_id)"),
+                {"lock_class": SALARY_RAISE_LOCK_CLASS, "department_id": raise_run["department_id"]}
+            )
+            connection.commit()
+
+        return get_run(connection, run_id)
+
+
+def run_in_background(run_id):
+    try:
+        run(run_id)
+    except Exception as e:
+        logger.warning("Запуск повышения %s прерван: %s", run_id, e)
+
+
+def cancel_run(db, run_id):
+    cancelled = db.execute(
+        text("""
+            UPDATE salary_raise_runs
+            SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE run_id = :run_id AND status IN ('running', 'failed')
+        """),
+        {"run_id": run_id}
+    ).rowcount
+    db.commit()
+    return cancelled > 0
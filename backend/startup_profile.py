@@ -0,0 +1,135 @@
+"""
+Профиль запуска процесса API и потребление памяти воркерами.
+
+Модуль импортируется первым в app.py и отмечает этапы запуска (импорт сторонних
+библиотек, локальных модулей, регистрация маршрутов, startup-обработчики).
+Время отсчитывается от старта процесса (/proc/self/stat), чтобы учитывался и
+запуск интерпретатора. Подробная разбивка по модулям (-X importtime) и проверка
+бюджета холодного старта - test_data/startup_check.py.
+"""
+import os
+import resource
+import sys
+import time
+
+# Отметка ставится до импорта остальных модулей проекта (metrics тянет SQLAlchemy)
+_IMPORTED_AT = time.perf_counter()
+_IMPORTED_WALL = time.time()
+
+import metrics
+
+# Тяжелые зависимости, которые должны загружаться только эндпоинтами, которым они нужны
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow")
+
+
+def _process_started_wall():
+    """Время старта процесса по /proc (Linux); иначе - момент импорта модуля"""
+    try:
+        with open("/proc/self/stat") as stat_file:
+            # Имя процесса может содержать пробелы - поля считаются после закрывающей скобки
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        with open("/proc/uptime") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return _IMPORTED_WALL
+
+
+PROCESS_STARTED = _process_started_wall()
+
+_phases = [("process_start", round((_IMPORTED_WALL - PROCESS_STARTED) * 1000, 1))]
+_last_mark = _IMPORTED_AT
+ready_seconds = None
+
+
+def mark(phase):
+    """Завершение этапа запуска: длительность от предыдущей отметки"""
+    global _last_mark
+    now = time.perf_counter()
+    _phases.append((phase, round((now - _last_mark) * 1000, 1)))
+    _last_mark = now
+
+
+def mark_ready():
+    """Процесс готов принимать запросы (вызывается последним startup-обработчиком)"""
+    global ready_seconds
+    mark("startup_events")
+    ready_seconds = round(time.time() - PROCESS_STARTED, 3)
+    STARTUP_SECONDS.set(ready_seconds)
+
+
+def _status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_bytes(pid="self"):
+    """Текущий RSS процесса; без /proc - пиковый RSS из getrusage"""
+    kilobytes = _status_kb(pid, "VmRSS")
+    if kilobytes is None and pid == "self":
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss: килобайты в Linux, байты в macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    return kilobytes * 1024 if kilobytes is not None else None
+
+
+def _cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as cmdline_file:
+            return cmdline_file.read()
+    except OSError:
+        return None
+
+
+def worker_processes():
+    """
+    Процессы-воркеры того же сервера: дочерние процессы родителя с той же командной
+    строкой (uvicorn --workers, gunicorn). Для одиночного процесса - только он сам.
+    """
+    own_pid, parent_pid = os.getpid(), os.getppid()
+    own_cmdline = _cmdline(own_pid)
+    pids = [own_pid]
+    try:
+        with open(f"/proc/{parent_pid}/task/{parent_pid}/children") as children_file:
+            siblings = [int(pid) for pid in children_file.read().split()]
+        pids = sorted(pid for pid in siblings if pid == own_pid or _cmdline(pid) == own_cmdline) or pids
+    except (OSError, ValueError):
+        pass
+    return [
+        {"pid": pid, "current": pid == own_pid, "rss_mb": round((rss_bytes(pid) or 0) / 2 ** 20, 1)}
+        for pid in pids
+    ]
+
+
+def report():
+    """Этапы запуска, время до готовности, загруженные тяжелые модули и память воркеров"""
+    workers = worker_processes()
+    peak_kb = _status_kb("self", "VmHWM")
+    return {
+        "pid": os.getpid(),
+        "ready_seconds": ready_seconds,
+        "phases_ms": dict(_phases),
+        "modules_loaded": len(sys.modules),
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        "rss_mb": round((rss_bytes() or 0) / 2 ** 20, 1),
+        "peak_rss_mb": round(peak_kb / 1024, 1) if peak_kb is not None else None,
+        "workers": workers,
+        "workers_total_rss_mb": round(sum(worker["rss_mb"] for worker in workers), 1),
+    }
+
+
+STARTUP_SECONDS = metrics.REGISTRY.gauge(
+    "process_startup_seconds",
+    "Время от старта процесса до готовности принимать запросы",
+)
+metrics.REGISTRY.gauge(
+    "process_resident_memory_bytes",
+    "Резидентная память процесса (RSS)",
+).set_function(lambda: rss_bytes() or 0)
@@ -0,0 +1,108 @@
+"""
+Профилирование триггеров employees на типовых нагрузках.
+
+Нагрузка (UPDATE или INSERT на выборке сотрудников) выполняется в транзакции,
+которая всегда откатывается, а вызовы и время функций триггеров берутся из
+trigger_profile(TRUE) - статистики текущей транзакции (20_trigger_profiling.sql,
+нужен track_functions = pl). PostgreSQL считает вызовы по функции, поэтому отчет -
+по функциям триггеров со списком их триггеров; рядом с временем каждой функции - ее
+доля во времени оператора, так что видно, что определяет задержку записи.
+
+Нагрузка выполняется внутри SAVEPOINT: если триггер отклонит изменение, статистика
+уже выполненных вызовов сохраняется и возвращается вместе с ошибкой.
+"""
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from database import engine
+
+# Выборка сотрудников для нагрузки: первые :rows активных по employee_id
+_SAMPLE = "SELECT employee_id FROM employees WHERE is_active = TRUE ORDER BY employee_id LIMIT :rows"
+
+WORKLOADS = {
+    "touch": (
+        "Изменение поля без триггерных условий (телефон): updated_at, аудит, пересчет проектов",
+        f"UPDATE employees SET phone = phone WHERE employee_id IN ({_SAMPLE})",
+    ),
+    "salary": (
+        "Изменение оклада: проверка бюджета, история зарплат, периоды окладов, статистика отдела",
+        f"UPDATE employees SET salary = salary + 1 WHERE employee_id IN ({_SAMPLE})",
+    ),
+    "manager": (
+        "Переназначение руководителя (тем же значением): проверка иерархии подчинения",
+        f"UPDATE employees SET manager_id = manager_id WHERE employee_id IN ({_SAMPLE})",
+    ),
+    "insert": (
+        "Прием сотрудников (копии выборки с новыми email): все триггеры INSERT",
+        f"""INSERT INTO employees (first_name, last_name, email, phone, hire_date, salary,
+                                  department_id, position_id, manager_id)
+            SELECT first_name, last_name, 'profile.' || employee_id || '@example.com', NULL, hire_date, salary,
+                   department_id, position_id, manager_id
+            FROM employees
+            WHERE employee_id IN ({_SAMPLE})""",
+    ),
+}
+
+
+class TriggerProfileError(Exception):
+    """Профилирование недоступно (например, выключен track_functions)"""
+
+
+def _trigger_rows(connection, current_transaction):
+    rows = connection.execute(
+        text("SELECT * FROM trigger_profile(:current_transaction)"),
+        {"current_transaction": current_transaction},
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+def cumulative(connection, table_name=None):
+    """Накопленная статистика триггеров с последнего сброса статистики"""
+    rows = _trigger_rows(connection, False)
+    if table_name:
+        rows = [row for row in rows if table_name in row["table_names"]]
+    return rows
+
+
+def profile(name, rows):
+    """Выполнение нагрузки name на rows сотрудниках с откатом и статистика ее триггеров"""
+    description, statement = WORKLOADS[name]
+    with engine.connect() as connection:
+        try:
+            track_functions = connection.execute(text("SHOW track_functions")).scalar()
+            if track_functions not in ("pl", "all"):
+                raise TriggerProfileError(
+                    f"track_functions = {track_functions}: время функций не собирается (нужно pl или all)"
+                )
+
+            error = None
+            connection.execute(text("SAVEPOINT trigger_profile"))
+            start = time.perf_counter()
+            try:
+                affected = connection.execute(text(statement), {"rows": rows}).rowcount
+            except DBAPIError as e:
+                affected = 0
+                error = str(e.orig).strip()
+                connection.execute(text("ROLLBACK TO SAVEPOINT trigger_profile"))
+            statement_ms = (time.perf_counter() - start) * 1000
+
+            functions = [row for row in _trigger_rows(connection, True) if row["calls"] > 0]
+        finally:
+            connection.rollback()
+
+    for row in functions:
+        row["avg_us"] = round(row["total_ms"] * 1000 / row["calls"], 1)
+        row["share_of_statement"] = round(row["self_ms"] / statement_ms, 3) if statement_ms else None
+    trigger_self_ms = sum(row["self_ms"] for row in functions)
+    return {
+        "workload": name,
+        "description": description,
+        "rows": affected,
+        "statement_ms": round(statement_ms, 2),
+        "trigger_ms": round(trigger_self_ms, 2),
+        "trigger_share": round(trigger_self_ms / statement_ms, 3) if statement_ms else None,
+        "error": error,
+        "functions": functions,
+    }
@@ -5,4 +5,19 @@
 \i /docker-entrypoint-initdb.d/04_views.sql
 \i /docker-entrypoint-initdb.d/05_functions.sql
 \i /docker-entrypoint-initdb.d/06_load_generated.sql
-\i /docker-entrypoint-initdb.d/07_seed_basic.sql
\ No newline at end of file
+\i /docker-entrypoint-initdb.d/07_seed_basic.sql
+\i /docker-entrypoint-initdb.d/08_vacation_ranges.sql
+\i /docker-entrypoint-initdb.d/09_vacation_balances.sql
+\i /docker-entrypoint-initdb.d/10_project_portfolio.sql
+\i /docker-entrypoint-initdb.d/11_skill_search.sql
+\i /docker-entrypoint-initdb.d/12_org_chart_notify.sql
+\i /docker-entrypoint-initdb.d/13_export_watermarks.sql
+\i /docker-entrypoint-initdb.d/14_audit_change_feed.sql
+\i /docker-entrypoint-initdb.d/15_salary_periods.sql
+\i /docker-entrypoint-initdb.d/16_audit_search.sql
+\i /docker-entrypoint-initdb.d/17_employee_archive.sql
+\i /docker-entrypoint-initdb.d/18_salary_raise_runs.sql
+\i /docker-entrypoint-initdb.d/19_list_projection.sql
+\i /docker-entrypoint-initdb.d/20_trigger_profiling.sql
+\i /docker-entrypoint-initdb.d/21_employees_bulk_mode.sql
+\i /docker-entrypoint-initdb.d/22_index_advisor.sql
\ No newline at end of file
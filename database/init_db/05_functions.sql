@@ -404,7 +404,6 @@ BEGIN
             -- Уже использованные дни (взят отпуск)
             SUM(CASE 
                 WHEN v.status = 'taken' 
-                AND EXTRACT(YEAR FROM v.start_date) = year_filter 
                 THEN v.days_count 
                 ELSE 0 
             END) as taken_days,
@@ -412,7 +411,6 @@ BEGIN
             SUM(CASE 
                 WHEN v.status = 'approved' 
                 AND v.start_date > CURRENT_DATE
-                AND EXTRACT(YEAR FROM v.start_date) = year_filter 
                 THEN v.days_count 
                 ELSE 0 
             END) as planned_days,
@@ -421,6 +419,9 @@ BEGIN
         FROM vacations v
         WHERE v.employee_id = employee_id_param
           AND v.status IN ('taken', 'approved')
+          -- Границы года диапазоном дат, а не EXTRACT: индекс по start_date применим
+          AND v.start_date >= make_date(year_filter, 1, 1)
+          AND v.start_date < make_date(year_filter + 1, 1, 1)
         GROUP BY v.vacation_type
     )
     SELECT 
@@ -0,0 +1,36 @@
+-- Диапазоны дат отпусков: GiST-индексы и запрет пересечений
+
+-- btree_gist нужен для ограничения исключения по (employee_id WITH =, period WITH &&)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Период отпуска как daterange (границы включительно), вычисляется из start_date/end_date
+ALTER TABLE vacations
+    ADD COLUMN IF NOT EXISTS period DATERANGE
+    GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED;
+
+-- Запрет пересекающихся утвержденных отпусков одного сотрудника.
+-- Индекс ограничения также обслуживает поиск отпусков сотрудника за период
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'excl_vacations_no_overlap'
+    ) THEN
+        ALTER TABLE vacations
+            ADD CONSTRAINT excl_vacations_no_overlap
+            EXCLUDE USING gist (employee_id WITH =, period WITH &&)
+            WHERE (status IN ('approved', 'taken'));
+    END IF;
+END $$;
+
+-- Поиск отпусков, пересекающихся с периодом, независимо от сотрудника и размера отдела
+CREATE INDEX IF NOT EXISTS idx_vacations_period ON vacations USING gist (period);
+
+COMMENT ON COLUMN vacations.period IS 'Период отпуска [start_date, end_date] для запросов на пересечение';
+COMMENT ON INDEX idx_vacations_period IS 'GiST-индекс для запросов "кто отсутствует в период" (оператор &&)';
+COMMENT ON CONSTRAINT excl_vacations_no_overlap ON vacations IS 'Утвержденные отпуска сотрудника не пересекаются';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Отпуска: столбец period (daterange), GiST-индекс idx_vacations_period';
+    RAISE NOTICE 'Ограничение excl_vacations_no_overlap запрещает пересечение утвержденных отпусков';
+END $$;
@@ -0,0 +1,180 @@
+-- Пакетный расчет остатков отпуска с кэшем по сотруднику и году
+
+-- 1. КЭШ ОСТАТКОВ
+-- Строки по типам отпуска плюс строка 'total' (признак того, что год сотрудника рассчитан)
+CREATE TABLE IF NOT EXISTS vacation_balance_cache (
+    employee_id INT NOT NULL,
+    year INT NOT NULL,
+    vacation_type VARCHAR(50) NOT NULL,
+    days_taken INT NOT NULL DEFAULT 0,
+    days_planned INT NOT NULL DEFAULT 0,
+    total_entitled INT NOT NULL DEFAULT 28,
+    -- "Запланированные" дни зависят от текущей даты, поэтому кэш действителен один день
+    computed_on DATE NOT NULL DEFAULT CURRENT_DATE,
+
+    PRIMARY KEY (employee_id, year, vacation_type),
+    FOREIGN KEY (employee_id) REFERENCES employees(employee_id) ON DELETE CASCADE
+);
+
+-- Отпуска сотрудника за год по диапазону дат начала (без EXTRACT, индекс применим)
+CREATE INDEX IF NOT EXISTS idx_vacations_employee_start ON vacations(employee_id, start_date)
+WHERE status IN ('taken', 'approved');
+
+-- 2. РАСЧЕТ ОСТАТКОВ ЗА ОДИН ПРОХОД
+-- Тот же расчет, что calculate_employee_vacation_days, но для множества сотрудников:
+-- конкретного списка, отдела или всей компании (оба фильтра NULL)
+CREATE OR REPLACE FUNCTION calculate_vacation_balances(
+    employee_ids INT[] DEFAULT NULL,
+    department_filter INT DEFAULT NULL,
+    year_filter INT DEFAULT EXTRACT(YEAR FROM CURRENT_DATE)
+)
+RETURNS TABLE(
+    employee_id INT,
+    vacation_type VARCHAR(50),
+    days_taken INT,
+    days_planned INT,
+    days_remaining INT,
+    total_entitled INT
+) AS $$
+    WITH targets AS (
+        SELECT e.employee_id
+        FROM employees e
+        WHERE (employee_ids IS NULL OR e.employee_id = ANY(employee_ids))
+          AND (department_filter IS NULL OR e.department_id = department_filter)
+    ),
+    per_type AS (
+        SELECT
+            v.employee_id,
+            v.vacation_type,
+            COALESCE(SUM(v.days_count) FILTER (WHERE v.status = 'taken'), 0)::INT as taken_days,
+            COALESCE(SUM(v.days_count) FILTER (
+                WHERE v.status = 'approved' AND v.start_date > CURRENT_DATE
+            ), 0)::INT as planned_days
+        FROM vacations v
+        JOIN targets t ON t.employee_id = v.employee_id
+        WHERE v.status IN ('taken', 'approved')
+          AND v.start_date >= make_date(year_filter, 1, 1)
+          AND v.start_date < make_date(year_filter + 1, 1, 1)
+        GROUP BY v.employee_id, v.vacation_type
+    )
+    SELECT
+        p.employee_id,
+        p.vacation_type,
+        p.taken_days,
+        p.planned_days,
+        28 - p.taken_days - p.planned_days,
+        28
+    FROM per_type p
+    UNION ALL
+    SELECT
+        t.employee_id,
+        'total'::VARCHAR(50),
+        COALESCE(SUM(p.taken_days), 0)::INT,
+        COALESCE(SUM(p.planned_days), 0)::INT,
+        (28 - COALESCE(SUM(p.taken_days + p.planned_days), 0))::INT,
+        28
+    FROM targets t
+    LEFT JOIN per_type p ON p.employee_id = t.employee_id
+    GROUP BY t.employee_id;
+$$ LANGUAGE sql STABLE;
+
+-- 3. ОСТАТКИ С КЭШИРОВАНИЕМ
+-- Пересчитываются только сотрудники, которых нет в кэше за этот год (одним вызовом
+-- calculate_vacation_balances), остальные читаются из кэша
+CREATE OR REPLACE FUNCTION get_vacation_balances(
+    employee_ids INT[] DEFAULT NULL,
+    department_filter INT DEFAULT NULL,
+    year_filter INT DEFAULT EXTRACT(YEAR FROM CURRENT_DATE)
+)
+RETURNS TABLE(
+    employee_id INT,
+    vacation_type VARCHAR(50),
+    days_taken INT,
+    days_planned INT,
+    days_remaining INT,
+    total_entitled INT
+) AS $$
+#variable_conflict use_column
+DECLARE
+    missing_ids INT[];
+BEGIN
+    SELECT array_agg(e.employee_id)
+    INTO missing_ids
+    FROM employees e
+    WHERE (employee_ids IS NULL OR e.employee_id = ANY(employee_ids))
+      AND (department_filter IS NULL OR e.department_id = department_filter)
+      AND NOT EXISTS (
+          SELECT 1 FROM vacation_balance_cache c
+          WHERE c.employee_id = e.employee_id
+            AND c.year = year_filter
+            AND c.vacation_type = 'total'
+            AND c.computed_on = CURRENT_DATE
+      );
+
+    IF missing_ids IS NOT NULL THEN
+        DELETE FROM vacation_balance_cache c
+        WHERE c.employee_id = ANY(missing_ids) AND c.year = year_filter;
+
+        INSERT INTO vacation_balance_cache (employee_id, year, vacation_type, days_taken, days_planned, total_entitled)
+        SELECT b.employee_id, year_filter, b.vacation_type, b.days_taken, b.days_planned, b.total_entitled
+        FROM calculate_vacation_balances(missing_ids, NULL, year_filter) b
+        ON CONFLICT (employee_id, year, vacation_type) DO UPDATE
+        SET days_taken = EXCLUDED.days_taken,
+            days_planned = EXCLUDED.days_planned,
+            total_entitled = EXCLUDED.total_entitled,
+            computed_on = CURRENT_DATE;
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        c.employee_id,
+        c.vacation_type,
+        c.days_taken,
+        c.days_planned,
+        c.total_entitled - c.days_taken - c.days_planned,
+        c.total_entitled
+    FROM vacation_balance_cache c
+    JOIN employees e ON e.employee_id = c.employee_id
+    WHERE c.year = year_filter
+      AND (employee_ids IS NULL OR c.employee_id = ANY(employee_ids))
+      AND (department_filter IS NULL OR e.department_id = department_filter)
+    ORDER BY c.employee_id, c.vacation_type = 'total', c.vacation_type;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. ИНВАЛИДАЦИЯ КЭША
+-- Сбрасываются только годы того сотрудника, чьи отпуска изменились
+CREATE OR REPLACE FUNCTION invalidate_vacation_balance_cache()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM vacation_balance_cache
+        WHERE employee_id = OLD.employee_id
+          AND year = EXTRACT(YEAR FROM OLD.start_date)::INT;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        DELETE FROM vacation_balance_cache
+        WHERE employee_id = NEW.employee_id
+          AND year = EXTRACT(YEAR FROM NEW.start_date)::INT;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS invalidate_vacation_balances ON vacations;
+CREATE TRIGGER invalidate_vacation_balances
+    AFTER INSERT OR UPDATE OR DELETE ON vacations
+    FOR EACH ROW
+    EXECUTE FUNCTION invalidate_vacation_balance_cache();
+
+COMMENT ON TABLE vacation_balance_cache IS 'Кэш остатков отпуска по сотруднику и году, сбрасывается триггером при изменении отпусков';
+COMMENT ON FUNCTION calculate_vacation_balances(INT[], INT, INT) IS 'Остатки отпуска для списка сотрудников, отдела или компании за один проход';
+COMMENT ON FUNCTION get_vacation_balances(INT[], INT, INT) IS 'Остатки отпуска с кэшированием по сотруднику и году';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Остатки отпусков: calculate_vacation_balances, get_vacation_balances';
+    RAISE NOTICE 'Кэш vacation_balance_cache сбрасывается триггером invalidate_vacation_balances';
+END $$;
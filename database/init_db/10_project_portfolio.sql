@@ -0,0 +1,188 @@
+-- Стоимость портфеля проектов и перегрузка сотрудников
+
+-- 1. РАСЧЕТ ЗА ОДИН ПРОХОД
+-- Для каждого проекта: участники, месячная стоимость человеческих ресурсов
+-- (по той же формуле, что calculate_project_cost) и число перегруженных участников -
+-- сотрудников, у которых сумма participation_percentage по активным проектам больше 100.
+-- Суммарная загрузка считается оконной функцией в том же проходе по назначениям.
+-- project_ids = NULL - весь портфель; иначе только указанные проекты
+-- (назначения читаются для всех их участников, чтобы загрузка была полной)
+CREATE OR REPLACE FUNCTION calculate_portfolio_costs(project_ids INT[] DEFAULT NULL)
+RETURNS TABLE(
+    project_id INT,
+    team_members INT,
+    monthly_hr_cost DECIMAL(15,2),
+    overallocated_members INT
+) AS $$
+    WITH active_allocations AS (
+        SELECT
+            ep.project_id,
+            ep.employee_id,
+            CASE
+                WHEN ep.hourly_rate IS NOT NULL THEN
+                    ep.hourly_rate * 160 * ep.participation_percentage / 100
+                ELSE
+                    e.salary / 12 * ep.participation_percentage / 100
+            END as monthly_cost,
+            SUM(ep.participation_percentage) OVER (PARTITION BY ep.employee_id) as employee_allocation
+        FROM employee_projects ep
+        JOIN employees e ON ep.employee_id = e.employee_id
+        WHERE (ep.end_date IS NULL OR ep.end_date >= CURRENT_DATE)
+          AND e.is_active = TRUE
+          AND (project_ids IS NULL OR ep.employee_id IN (
+              SELECT m.employee_id FROM employee_projects m WHERE m.project_id = ANY(project_ids)
+          ))
+    )
+    SELECT
+        p.project_id,
+        COUNT(DISTINCT a.employee_id)::INT,
+        COALESCE(SUM(a.monthly_cost), 0)::DECIMAL(15,2),
+        (COUNT(DISTINCT a.employee_id) FILTER (WHERE a.employee_allocation > 100))::INT
+    FROM projects p
+    LEFT JOIN active_allocations a ON a.project_id = p.project_id
+    WHERE project_ids IS NULL OR p.project_id = ANY(project_ids)
+    GROUP BY p.project_id;
+$$ LANGUAGE sql STABLE;
+
+-- 2. СВОДКА ПО ПРОЕКТАМ
+-- Бюджет и статус берутся из projects при чтении, здесь только вычисляемая часть
+CREATE TABLE IF NOT EXISTS project_cost_summary (
+    project_id INT PRIMARY KEY,
+    team_members INT NOT NULL DEFAULT 0,
+    monthly_hr_cost DECIMAL(15,2) NOT NULL DEFAULT 0,
+    overallocated_members INT NOT NULL DEFAULT 0,
+    -- Назначения с end_date истекают со временем: сводка, рассчитанная раньше сегодняшнего дня, устарела
+    refreshed_on DATE NOT NULL DEFAULT CURRENT_DATE,
+
+    FOREIGN KEY (project_id) REFERENCES projects(project_id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION refresh_project_cost_summary(project_ids INT[] DEFAULT NULL)
+RETURNS INT AS $$
+DECLARE
+    refreshed INT;
+BEGIN
+    IF project_ids IS NOT NULL AND cardinality(project_ids) = 0 THEN
+        RETURN 0;
+    END IF;
+
+    -- Пересчет вызывается из триггеров параллельных транзакций: DELETE + INSERT в двух
+    -- сессиях дал бы ошибку дубликата ключа и откатил бы вызвавшее изменение, поэтому
+    -- строки обновляются на месте (в порядке project_id, чтобы сессии не ждали друг друга
+    -- по кругу), а удаляются только сводки проектов, которых больше нет
+    INSERT INTO project_cost_summary (project_id, team_members, monthly_hr_cost, overallocated_members)
+    SELECT c.project_id, c.team_members, c.monthly_hr_cost, c.overallocated_members
+    FROM calculate_portfolio_costs(project_ids) c
+    ORDER BY c.project_id
+    ON CONFLICT (project_id) DO UPDATE SET
+        team_members = EXCLUDED.team_members,
+        monthly_hr_cost = EXCLUDED.monthly_hr_cost,
+        overallocated_members = EXCLUDED.overallocated_members,
+        refreshed_on = CURRENT_DATE;
+
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+    DELETE FROM project_cost_summary s
+    WHERE (project_ids IS NULL OR s.project_id = ANY(project_ids))
+      AND NOT EXISTS (SELECT 1 FROM projects p WHERE p.project_id = s.project_id);
+
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. ИНКРЕМЕНТАЛЬНЫЙ ПЕРЕСЧЕТ
+-- Триггеры уровня оператора: массовое изменение (например, повышение зарплат отдела)
+-- пересчитывает каждый затронутый проект один раз. Затронуты проекты измененных
+-- назначений и все проекты их сотрудников (у них меняется перегрузка).
+CREATE OR REPLACE FUNCTION refresh_costs_after_allocation_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    affected INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT ep.project_id) INTO affected
+        FROM employee_projects ep
+        WHERE ep.employee_id IN (SELECT employee_id FROM new_rows);
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(DISTINCT x.project_id) INTO affected
+        FROM (
+            SELECT project_id FROM old_rows
+            UNION
+            SELECT ep.project_id
+            FROM employee_projects ep
+            WHERE ep.employee_id IN (SELECT employee_id FROM old_rows UNION SELECT employee_id FROM new_rows)
+        ) x;
+    ELSE
+        SELECT array_agg(DISTINCT x.project_id) INTO affected
+        FROM (
+            SELECT project_id FROM old_rows
+            UNION
+            SELECT ep.project_id
+            FROM employee_projects ep
+            WHERE ep.employee_id IN (SELECT employee_id FROM old_rows)
+        ) x;
+    END IF;
+
+    IF affected IS NOT NULL THEN
+        PERFORM refresh_project_cost_summary(affected);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Смена оклада или увольнение меняют стоимость и загрузку во всех проектах сотрудника
+CREATE OR REPLACE FUNCTION refresh_costs_after_employee_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    affected INT[];
+BEGIN
+    SELECT array_agg(DISTINCT ep.project_id) INTO affected
+    FROM old_rows o
+    JOIN new_rows n ON n.employee_id = o.employee_id
+    JOIN employee_projects ep ON ep.employee_id = n.employee_id
+    WHERE n.salary IS DISTINCT FROM o.salary
+       OR n.is_active IS DISTINCT FROM o.is_active;
+
+    IF affected IS NOT NULL THEN
+        PERFORM refresh_project_cost_summary(affected);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS refresh_costs_on_allocation_insert ON employee_projects;
+CREATE TRIGGER refresh_costs_on_allocation_insert
+    AFTER INSERT ON employee_projects
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION refresh_costs_after_allocation_change();
+
+DROP TRIGGER IF EXISTS refresh_costs_on_allocation_update ON employee_projects;
+CREATE TRIGGER refresh_costs_on_allocation_update
+    AFTER UPDATE ON employee_projects
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION refresh_costs_after_allocation_change();
+
+DROP TRIGGER IF EXISTS refresh_costs_on_allocation_delete ON employee_projects;
+CREATE TRIGGER refresh_costs_on_allocation_delete
+    AFTER DELETE ON employee_projects
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION refresh_costs_after_allocation_change();
+
+DROP TRIGGER IF EXISTS refresh_costs_on_employee_update ON employees;
+CREATE TRIGGER refresh_costs_on_employee_update
+    AFTER UPDATE ON employees
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION refresh_costs_after_employee_change();
+
+COMMENT ON FUNCTION calculate_portfolio_costs(INT[]) IS 'Стоимость и перегрузка по всем (или указанным) проектам за один проход';
+COMMENT ON TABLE project_cost_summary IS 'Сводка стоимости проектов, пересчитывается инкрементально триггерами';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Портфель проектов: calculate_portfolio_costs, refresh_project_cost_summary';
+    RAISE NOTICE 'Сводка project_cost_summary обновляется при изменении назначений и окладов';
+END $$;
@@ -0,0 +1,210 @@
+-- Подбор сотрудников по навыкам: инвертированный индекс профилей навыков
+
+-- 1. ПРОФИЛИ НАВЫКОВ
+-- Навыки сотрудника хранятся одним массивом токенов под GIN-индексом:
+--   skill_id * 10 + 1..4 - уровень владения (уровень L дает токены 1..L,
+--                          поэтому "не ниже advanced" - это один токен skill_id * 10 + 3)
+--   skill_id * 10 + 9    - навык сертифицирован
+-- Тогда "все навыки" - оператор @>, "любой из навыков" - оператор &&
+CREATE TABLE IF NOT EXISTS employee_skill_profiles (
+    employee_id INT PRIMARY KEY,
+    skill_tokens INT[] NOT NULL,
+    skill_count INT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (employee_id) REFERENCES employees(employee_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_skill_profiles_tokens ON employee_skill_profiles USING gin (skill_tokens);
+
+CREATE OR REPLACE FUNCTION skill_proficiency_rank(proficiency_level VARCHAR)
+RETURNS INT AS $$
+    SELECT CASE proficiency_level
+        WHEN 'beginner' THEN 1
+        WHEN 'intermediate' THEN 2
+        WHEN 'advanced' THEN 3
+        WHEN 'expert' THEN 4
+        ELSE 1
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Пересборка профилей: всех (NULL) или указанных сотрудников
+CREATE OR REPLACE FUNCTION rebuild_skill_profiles(employee_ids INT[] DEFAULT NULL)
+RETURNS INT AS $$
+DECLARE
+    rebuilt INT;
+BEGIN
+    -- Профили пересобираются из триггеров параллельных транзакций: строки обновляются
+    -- на месте (ON CONFLICT), а не удаляются и вставляются заново - иначе вторая сессия
+    -- получает ошибку дубликата ключа и откатывает изменение навыков
+    INSERT INTO employee_skill_profiles (employee_id, skill_tokens, skill_count)
+    SELECT
+        es.employee_id,
+        array_agg(t.token ORDER BY t.token),
+        COUNT(DISTINCT es.skill_id)
+    FROM employee_skills es
+    CROSS JOIN LATERAL (
+        SELECT es.skill_id * 10 + lvl as token
+        FROM generate_series(1, skill_proficiency_rank(es.proficiency_level)) lvl
+        UNION ALL
+        SELECT es.skill_id * 10 + 9 WHERE es.certified
+    ) t
+    WHERE employee_ids IS NULL OR es.employee_id = ANY(employee_ids)
+    GROUP BY es.employee_id
+    ORDER BY es.employee_id
+    ON CONFLICT (employee_id) DO UPDATE SET
+        skill_tokens = EXCLUDED.skill_tokens,
+        skill_count = EXCLUDED.skill_count,
+        updated_at = CURRENT_TIMESTAMP;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+
+    -- Сотрудники, у которых не осталось навыков
+    DELETE FROM employee_skill_profiles p
+    WHERE (employee_ids IS NULL OR p.employee_id = ANY(employee_ids))
+      AND NOT EXISTS (SELECT 1 FROM employee_skills es WHERE es.employee_id = p.employee_id);
+
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 2. ОБНОВЛЕНИЕ ПРОФИЛЕЙ ПРИ ИЗМЕНЕНИИ НАВЫКОВ
+CREATE OR REPLACE FUNCTION refresh_skill_profiles_after_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    affected INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT employee_id) INTO affected FROM new_rows;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(DISTINCT x.employee_id) INTO affected
+        FROM (SELECT employee_id FROM old_rows UNION SELECT employee_id FROM new_rows) x;
+    ELSE
+        SELECT array_agg(DISTINCT employee_id) INTO affected FROM old_rows;
+    END IF;
+
+    IF affected IS NOT NULL THEN
+        PERFORM rebuild_skill_profiles(affected);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS refresh_skill_profiles_on_insert ON employee_skills;
+CREATE TRIGGER refresh_skill_profiles_on_insert
+    AFTER INSERT ON employee_skills
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION refresh_skill_profiles_after_change();
+
+DROP TRIGGER IF EXISTS refresh_skill_profiles_on_update ON employee_skills;
+CREATE TRIGGER refresh_skill_profiles_on_update
+    AFTER UPDATE ON employee_skills
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION refresh_skill_profiles_after_change();
+
+DROP TRIGGER IF EXISTS refresh_skill_profiles_on_delete ON employee_skills;
+CREATE TRIGGER refresh_skill_profiles_on_delete
+    AFTER DELETE ON employee_skills
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION refresh_skill_profiles_after_change();
+
+-- 3. ПОИСК КАНДИДАТОВ
+-- skill_ids и min_levels (1..4, по одному на навык; NULL - любой уровень),
+-- match_all: TRUE - нужны все навыки, FALSE - хотя бы один.
+-- Кандидаты отбираются по GIN-индексу, ранжируются по покрытию запроса,
+-- затем по уровню владения и сертификатам запрошенных навыков
+CREATE OR REPLACE FUNCTION search_staffing_candidates(
+    skill_ids INT[],
+    min_levels INT[] DEFAULT NULL,
+    match_all BOOLEAN DEFAULT TRUE,
+    certified_only BOOLEAN DEFAULT FALSE,
+    department_filter INT DEFAULT NULL,
+    result_limit INT DEFAULT 20
+)
+RETURNS TABLE(
+    employee_id INT,
+    full_name TEXT,
+    department_id INT,
+    position_title VARCHAR(255),
+    matched_skills INT,
+    requested_skills INT,
+    coverage NUMERIC,
+    proficiency_score INT,
+    certified_skills INT
+) AS $$
+DECLARE
+    levels INT[];
+    required INT[];
+BEGIN
+    levels := ARRAY(
+        SELECT LEAST(4, GREATEST(1, COALESCE(min_levels[x.ordinal], 1)))
+        FROM unnest(skill_ids) WITH ORDINALITY AS x(skill_id, ordinal)
+        ORDER BY x.ordinal
+    );
+    -- Токен уровня нужен всегда, токен сертификата - дополнительно при certified_only
+    required := ARRAY(
+        SELECT x.skill_id * 10 + x.level
+        FROM unnest(skill_ids, levels) AS x(skill_id, level)
+        UNION ALL
+        SELECT x.skill_id * 10 + 9
+        FROM unnest(skill_ids) AS x(skill_id)
+        WHERE certified_only
+    );
+
+    -- Оператор подставляется в текст запроса, чтобы планировщик видел @> или && и использовал GIN.
+    -- Для "любого из навыков" && лишь отбирает кандидатов: навык считается найденным, только если
+    -- есть и токен уровня, и (при certified_only) токен сертификата
+    RETURN QUERY EXECUTE format($q$
+        WITH candidates AS (
+            SELECT p.employee_id, p.skill_tokens
+            FROM employee_skill_profiles p
+            WHERE p.skill_tokens %s $1
+        ),
+        scored AS (
+            SELECT
+                c.employee_id,
+                (SELECT COUNT(*) FROM unnest($2, $5) r(skill_id, level)
+                 WHERE r.skill_id * 10 + r.level = ANY(c.skill_tokens)
+                   AND (NOT $6 OR r.skill_id * 10 + 9 = ANY(c.skill_tokens)))::INT as matched,
+                (SELECT COUNT(*) FROM unnest(c.skill_tokens) t
+                 WHERE t / 10 = ANY($2) AND t %% 10 BETWEEN 1 AND 4)::INT as proficiency,
+                (SELECT COUNT(*) FROM unnest(c.skill_tokens) t
+                 WHERE t / 10 = ANY($2) AND t %% 10 = 9)::INT as certified
+            FROM candidates c
+        )
+        SELECT
+            e.employee_id,
+            e.first_name || ' ' || e.last_name,
+            e.department_id,
+            pos.position_title,
+            s.matched,
+            cardinality($2),
+            ROUND(s.matched::NUMERIC / NULLIF(cardinality($2), 0), 3),
+            s.proficiency,
+            s.certified
+        FROM scored s
+        JOIN employees e ON e.employee_id = s.employee_id
+        JOIN positions pos ON pos.position_id = e.position_id
+        WHERE e.is_active = TRUE
+          AND s.matched > 0
+          AND ($3 IS NULL OR e.department_id = $3)
+        ORDER BY s.matched DESC, s.proficiency DESC, s.certified DESC, e.employee_id
+        LIMIT $4
+    $q$, CASE WHEN match_all THEN '@>' ELSE '&&' END)
+    USING required, skill_ids, department_filter, result_limit, levels, certified_only;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Начальное заполнение профилей по уже загруженным навыкам
+SELECT rebuild_skill_profiles();
+
+COMMENT ON TABLE employee_skill_profiles IS 'Навыки сотрудника массивом токенов (навык, уровень, сертификат) для GIN-поиска';
+COMMENT ON FUNCTION search_staffing_candidates(INT[], INT[], BOOLEAN, BOOLEAN, INT, INT) IS 'Подбор сотрудников по навыкам с ранжированием по покрытию';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Поиск по навыкам: employee_skill_profiles (GIN), search_staffing_candidates';
+END $$;
@@ -0,0 +1,74 @@
+-- Уведомления об изменениях оргструктуры для снимка в памяти API (backend/org_chart.py)
+
+-- Полезная нагрузка: {"op": "INSERT|UPDATE|DELETE", "employee_id": ..., "manager_id": ..., "department_id": ...}
+CREATE OR REPLACE FUNCTION notify_org_chart_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('org_chart', json_build_object(
+            'op', TG_OP,
+            'employee_id', OLD.employee_id
+        )::text);
+    ELSE
+        PERFORM pg_notify('org_chart', json_build_object(
+            'op', TG_OP,
+            'employee_id', NEW.employee_id,
+            'manager_id', NEW.manager_id,
+            'department_id', NEW.department_id
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_org_chart_insert_delete ON employees;
+CREATE TRIGGER notify_org_chart_insert_delete
+    AFTER INSERT OR DELETE ON employees
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_org_chart_change();
+
+DROP TRIGGER IF EXISTS notify_org_chart_manager_change ON employees;
+CREATE TRIGGER notify_org_chart_manager_change
+    AFTER UPDATE OF manager_id, department_id ON employees
+    FOR EACH ROW
+    WHEN (NEW.manager_id IS DISTINCT FROM OLD.manager_id OR NEW.department_id IS DISTINCT FROM OLD.department_id)
+    EXECUTE FUNCTION notify_org_chart_change();
+
+-- Руководители отделов: {"op": "DEPARTMENT", "department_id": ..., "manager_id": ..., "deleted": ...}
+CREATE OR REPLACE FUNCTION notify_org_chart_department_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('org_chart', json_build_object(
+            'op', 'DEPARTMENT',
+            'department_id', OLD.department_id,
+            'deleted', TRUE
+        )::text);
+    ELSE
+        PERFORM pg_notify('org_chart', json_build_object(
+            'op', 'DEPARTMENT',
+            'department_id', NEW.department_id,
+            'manager_id', NEW.manager_id
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_org_chart_department_insert_delete ON departments;
+CREATE TRIGGER notify_org_chart_department_insert_delete
+    AFTER INSERT OR DELETE ON departments
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_org_chart_department_change();
+
+DROP TRIGGER IF EXISTS notify_org_chart_department_manager ON departments;
+CREATE TRIGGER notify_org_chart_department_manager
+    AFTER UPDATE OF manager_id ON departments
+    FOR EACH ROW
+    WHEN (NEW.manager_id IS DISTINCT FROM OLD.manager_id)
+    EXECUTE FUNCTION notify_org_chart_department_change();
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Изменения иерархии employees и руководителей отделов публикуются в канал org_chart (LISTEN/NOTIFY)';
+END $$;
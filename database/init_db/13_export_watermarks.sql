@@ -0,0 +1,14 @@
+-- Инкрементальная выгрузка для хранилища данных (backend/exports.py)
+
+-- Водяной знак выгрузки employees - updated_at (обновляется триггером при каждом изменении).
+-- Индекс нужен для max(updated_at) и выборки updated_at > since без полного сканирования;
+-- audit_log.changed_at уже проиндексирован (idx_audit_changed_at), salary_history
+-- выгружается по первичному ключу salary_change_id.
+CREATE INDEX IF NOT EXISTS idx_employees_updated_at ON employees(updated_at);
+
+COMMENT ON INDEX idx_employees_updated_at IS 'Водяной знак инкрементальной выгрузки employees (/export/employees?since=)';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Индексы для инкрементальной выгрузки созданы';
+END $$;
@@ -0,0 +1,43 @@
+-- Лента изменений для подписчиков API (backend/change_feed.py)
+
+-- Компактное описание записи аудита: без old_values/new_values (предел pg_notify - 8000 байт),
+-- только список измененных полей. Той же функцией API догоняет пропущенные события из таблицы,
+-- поэтому события из уведомления и из догоняющего запроса совпадают.
+CREATE OR REPLACE FUNCTION audit_change_payload(entry audit_log)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'log_id', entry.log_id,
+        'table', entry.table_name,
+        'op', entry.operation_type,
+        'record_id', entry.record_id,
+        'changed_by', entry.changed_by,
+        'changed_at', entry.changed_at,
+        'fields', CASE WHEN entry.operation_type = 'UPDATE' THEN COALESCE((
+            SELECT jsonb_agg(item.key ORDER BY item.key)
+            FROM jsonb_each(entry.new_values) AS item(key, value)
+            WHERE entry.old_values -> item.key IS DISTINCT FROM item.value
+        ), '[]'::jsonb) ELSE '[]'::jsonb END
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Уведомление отправляется при фиксации транзакции: подписчики не видят откаченные изменения.
+-- Триггер на audit_log покрывает все триггеры аудита (audit_employee_changes и др.);
+-- изменение зарплаты приходит как UPDATE employees с полем salary в fields
+CREATE OR REPLACE FUNCTION notify_audit_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('audit_changes', audit_change_payload(NEW)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_audit_log_insert ON audit_log;
+CREATE TRIGGER notify_audit_log_insert
+    AFTER INSERT ON audit_log
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_audit_change();
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Записи audit_log публикуются в канал audit_changes (LISTEN/NOTIFY)';
+END $$;
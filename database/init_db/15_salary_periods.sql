@@ -0,0 +1,143 @@
+-- Периоды действия окладов: запросы "на дату" по истории зарплат
+
+-- salary_history - журнал событий (старый и новый оклад на дату изменения), и оклад на
+-- прошедшую дату по нему приходится восстанавливать проходом по всей истории.
+-- salary_periods хранит для каждого сотрудника непересекающиеся интервалы
+-- [начало, конец) с окладом и отделом; оклад на дату - одна строка по GiST-индексу.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE TABLE IF NOT EXISTS salary_periods (
+    salary_period_id BIGSERIAL PRIMARY KEY,
+    employee_id INT NOT NULL REFERENCES employees(employee_id) ON DELETE CASCADE,
+    department_id INT,
+    salary DECIMAL(12, 2) NOT NULL,
+    valid_during DATERANGE NOT NULL,
+
+    CONSTRAINT chk_salary_period_not_empty CHECK (NOT isempty(valid_during))
+);
+
+-- Интервалы одного сотрудника не пересекаются; индекс ограничения обслуживает
+-- поиск оклада сотрудника на дату (employee_id = ... AND valid_during @> дата)
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'excl_salary_periods_no_overlap'
+    ) THEN
+        ALTER TABLE salary_periods
+            ADD CONSTRAINT excl_salary_periods_no_overlap
+            EXCLUDE USING gist (employee_id WITH =, valid_during WITH &&);
+    END IF;
+END $$;
+
+-- Срез по всем сотрудникам и по отделу на дату
+CREATE INDEX IF NOT EXISTS idx_salary_periods_valid_during ON salary_periods USING gist (valid_during);
+CREATE INDEX IF NOT EXISTS idx_salary_periods_department ON salary_periods USING gist (department_id, valid_during);
+
+COMMENT ON TABLE salary_periods IS 'Оклад и отдел сотрудника в интервале [начало, конец); открытый интервал - текущий оклад';
+COMMENT ON COLUMN salary_periods.valid_during IS 'Период действия оклада (daterange, верхняя граница не включается)';
+
+-- Пересчет периодов по salary_history и employees (после загрузки с отключенными триггерами).
+-- Периоды между изменениями берут new_salary, до первого изменения - old_salary первой записи,
+-- открытый период - текущий оклад. Отдел в прошлом не восстанавливается (история переводов
+-- не хранится), поэтому берется текущий; дальше отдел отслеживается триггером.
+-- Уволенные (is_active = FALSE) закрываются датой последнего изменения записи.
+CREATE OR REPLACE FUNCTION rebuild_salary_periods()
+RETURNS INT AS $$
+DECLARE
+    inserted INT;
+BEGIN
+    DELETE FROM salary_periods;
+
+    INSERT INTO salary_periods (employee_id, department_id, salary, valid_during)
+    SELECT employee_id, department_id, salary,
+           daterange(period_start, CASE WHEN period_end IS NULL THEN NULL ELSE GREATEST(period_start, period_end) END)
+    FROM (
+        WITH changes AS (
+            SELECT sh.employee_id, sh.change_date, sh.old_salary, sh.new_salary,
+                   row_number() OVER w AS change_number,
+                   lead(sh.change_date) OVER w AS next_change_date
+            FROM salary_history sh
+            WINDOW w AS (PARTITION BY sh.employee_id ORDER BY sh.change_date, sh.salary_change_id)
+        )
+        SELECT e.employee_id, e.department_id, c.old_salary AS salary,
+               e.hire_date AS period_start, c.change_date AS period_end
+        FROM changes c
+        JOIN employees e ON e.employee_id = c.employee_id
+        WHERE c.change_number = 1
+        UNION ALL
+        SELECT e.employee_id, e.department_id,
+               CASE WHEN c.next_change_date IS NULL THEN e.salary ELSE c.new_salary END,
+               c.change_date,
+               COALESCE(c.next_change_date, CASE WHEN e.is_active THEN NULL ELSE e.updated_at::DATE END)
+        FROM changes c
+        JOIN employees e ON e.employee_id = c.employee_id
+        UNION ALL
+        SELECT e.employee_id, e.department_id, e.salary,
+               e.hire_date,
+               CASE WHEN e.is_active THEN NULL ELSE e.updated_at::DATE END
+        FROM employees e
+        WHERE NOT EXISTS (SELECT 1 FROM salary_history sh WHERE sh.employee_id = e.employee_id)
+    ) periods
+    -- Несколько изменений в один день дают пустые интервалы - остается последнее
+    WHERE period_end IS NULL OR period_end > period_start;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    ANALYZE salary_periods;
+    RETURN inserted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Ведение периодов: новый оклад или перевод закрывает текущий период сегодняшним днем
+-- и открывает следующий; повторное изменение в тот же день правит уже открытый период
+CREATE OR REPLACE FUNCTION track_salary_period()
+RETURNS TRIGGER AS $$
+DECLARE
+    period_start DATE := GREATEST(CURRENT_DATE, NEW.hire_date);
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        period_start := NEW.hire_date;
+    ELSE
+        DELETE FROM salary_periods
+        WHERE employee_id = NEW.employee_id
+          AND upper_inf(valid_during)
+          AND lower(valid_during) >= CURRENT_DATE;
+
+        UPDATE salary_periods
+        SET valid_during = daterange(lower(valid_during), CURRENT_DATE)
+        WHERE employee_id = NEW.employee_id
+          AND upper_inf(valid_during);
+    END IF;
+
+    -- Уволенный сотрудник остается с закрытым периодом
+    IF NEW.is_active THEN
+        INSERT INTO salary_periods (employee_id, department_id, salary, valid_during)
+        VALUES (NEW.employee_id, NEW.department_id, NEW.salary, daterange(period_start, NULL));
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS track_salary_period_insert ON employees;
+CREATE TRIGGER track_salary_period_insert
+    AFTER INSERT ON employees
+    FOR EACH ROW
+    EXECUTE FUNCTION track_salary_period();
+
+DROP TRIGGER IF EXISTS track_salary_period_update ON employees;
+CREATE TRIGGER track_salary_period_update
+    AFTER UPDATE OF salary, department_id, is_active ON employees
+    FOR EACH ROW
+    WHEN (NEW.salary IS DISTINCT FROM OLD.salary
+          OR NEW.department_id IS DISTINCT FROM OLD.department_id
+          OR NEW.is_active IS DISTINCT FROM OLD.is_active)
+    EXECUTE FUNCTION track_salary_period();
+
+-- Первичное заполнение (повторный запуск скрипта существующие периоды не трогает)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM salary_periods) THEN
+        RAISE NOTICE 'Периоды окладов: заполнено % строк', rebuild_salary_periods();
+    END IF;
+    RAISE NOTICE 'Оклад на дату: salary_periods (daterange, GiST), пересчет - rebuild_salary_periods()';
+END $$;
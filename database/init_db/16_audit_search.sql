@@ -0,0 +1,27 @@
+-- Поиск по журналу аудита и история отдельной записи (/audit/logs, /audit/records/...)
+
+-- История записи: все изменения (table_name, record_id) в порядке времени одним проходом по индексу
+CREATE INDEX IF NOT EXISTS idx_audit_record_timeline
+    ON audit_log (table_name, record_id, changed_at, log_id);
+
+-- Содержимое значений: @> (contains) и JSONPath-предикаты @? / @@ с условиями равенства.
+-- jsonb_path_ops хранит хэши путей со значениями - индекс меньше и быстрее jsonb_ops,
+-- но не поддерживает проверку наличия ключа (?)
+CREATE INDEX IF NOT EXISTS idx_audit_new_values ON audit_log USING gin (new_values jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS idx_audit_old_values ON audit_log USING gin (old_values jsonb_path_ops);
+
+-- Сравнения (<, >) GIN не обслуживает; для частого расследования "оклад пересек порог"
+-- новое значение оклада проиндексировано отдельно
+CREATE INDEX IF NOT EXISTS idx_audit_employee_new_salary
+    ON audit_log (((new_values ->> 'salary')::NUMERIC))
+    WHERE table_name = 'employees';
+
+COMMENT ON INDEX idx_audit_record_timeline IS 'История записи: WHERE table_name = ... AND record_id = ... ORDER BY changed_at';
+COMMENT ON INDEX idx_audit_new_values IS 'new_values @> ... и JSONPath-равенства (@?, @@)';
+COMMENT ON INDEX idx_audit_old_values IS 'old_values @> ... и JSONPath-равенства (@?, @@)';
+COMMENT ON INDEX idx_audit_employee_new_salary IS 'Поиск изменений, где оклад пересек порог';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Аудит: индексы истории записи, GIN jsonb_path_ops по old_values/new_values';
+END $$;
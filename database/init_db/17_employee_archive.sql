@@ -0,0 +1,203 @@
+-- Архив уволенных сотрудников: горячая таблица employees и холодная employees_archive
+
+-- Уволенные (is_active = FALSE) копятся в employees бесконечно, и каждое сканирование,
+-- представление и индекс по employees растет вместе с возрастом компании.
+-- archive_inactive_employees() переносит давно уволенных в employees_archive, так что
+-- в employees остаются действующие и недавно уволенные сотрудники.
+--
+-- Секционирование employees по is_active не подходит: первичный ключ секционированной
+-- таблицы обязан включать ключ секционирования, и внешние ключи на employee_id стали бы
+-- невозможны. Вместо этого история (зарплаты, отпуска, аудит, проекты, навыки) ссылается
+-- на реестр employee_registry - все когда-либо созданные employee_id, - и при переносе
+-- в архив сохраняется вместе с целостностью ссылок.
+
+CREATE TABLE IF NOT EXISTS employee_registry (
+    employee_id INT PRIMARY KEY,
+    archived_at TIMESTAMP NULL  -- NULL: сотрудник в employees
+);
+
+INSERT INTO employee_registry (employee_id)
+SELECT employee_id FROM employees
+ON CONFLICT (employee_id) DO NOTHING;
+
+-- Те же столбцы, что у employees (без умолчаний, уникальности и внешних ключей), и дата переноса
+CREATE TABLE IF NOT EXISTS employees_archive (LIKE employees);
+ALTER TABLE employees_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'employees_archive_pkey') THEN
+        ALTER TABLE employees_archive ADD CONSTRAINT employees_archive_pkey PRIMARY KEY (employee_id);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'employees_archive_registry_fkey') THEN
+        ALTER TABLE employees_archive ADD CONSTRAINT employees_archive_registry_fkey
+            FOREIGN KEY (employee_id) REFERENCES employee_registry(employee_id) ON DELETE CASCADE;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_employees_archive_department ON employees_archive(department_id);
+CREATE INDEX IF NOT EXISTS idx_employees_archive_archived_at ON employees_archive(archived_at);
+
+-- Ссылки истории переводятся с employees на реестр с прежним действием при удалении.
+-- Ссылки на действующих (руководитель, руководитель проекта) и производные кэши
+-- (vacation_balance_cache, employee_skill_profiles) остаются на employees
+DO $$
+DECLARE
+    target RECORD;
+    fk_name TEXT;
+BEGIN
+    FOR target IN
+        SELECT * FROM (VALUES
+            ('salary_history', 'employee_id', 'CASCADE'),
+            ('salary_history', 'changed_by', 'RESTRICT'),
+            ('vacations', 'employee_id', 'CASCADE'),
+            ('vacations', 'approved_by', 'SET NULL'),
+            ('audit_log', 'changed_by', 'SET NULL'),
+            ('employee_projects', 'employee_id', 'CASCADE'),
+            ('employee_skills', 'employee_id', 'CASCADE'),
+            ('salary_periods', 'employee_id', 'CASCADE')
+        ) AS t(table_name, column_name, on_delete)
+    LOOP
+        SELECT c.conname INTO fk_name
+        FROM pg_constraint c
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+        WHERE c.contype = 'f'
+          AND c.conrelid = target.table_name::REGCLASS
+          AND c.confrelid = 'employees'::REGCLASS
+          AND a.attname = target.column_name;
+
+        IF fk_name IS NOT NULL THEN
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', target.table_name, fk_name);
+            EXECUTE format(
+                'ALTER TABLE %I ADD CONSTRAINT %I FOREIGN KEY (%I) REFERENCES employee_registry(employee_id) ON DELETE %s',
+                target.table_name, target.table_name || '_' || target.column_name || '_registry_fkey',
+                target.column_name, target.on_delete
+            );
+        END IF;
+    END LOOP;
+END $$;
+
+-- Новый сотрудник (или возвращенный из архива) регистрируется до вставки в employees
+CREATE OR REPLACE FUNCTION register_employee()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO employee_registry (employee_id)
+    VALUES (NEW.employee_id)
+    ON CONFLICT (employee_id) DO UPDATE SET archived_at = NULL;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS register_employee_insert ON employees;
+CREATE TRIGGER register_employee_insert
+    BEFORE INSERT ON employees
+    FOR EACH ROW
+    EXECUTE FUNCTION register_employee();
+
+-- Удаление из employees: при переносе в архив реестр помечается, иначе запись реестра
+-- удаляется и история удаляется каскадом, как раньше при ссылках на employees
+CREATE OR REPLACE FUNCTION unregister_employee()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('app.archiving', TRUE) = 'on' THEN
+        UPDATE employee_registry SET archived_at = CURRENT_TIMESTAMP WHERE employee_id = OLD.employee_id;
+    ELSE
+        DELETE FROM employee_registry WHERE employee_id = OLD.employee_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS unregister_employee_delete ON employees;
+CREATE TRIGGER unregister_employee_delete
+    AFTER DELETE ON employees
+    FOR EACH ROW
+    EXECUTE FUNCTION unregister_employee();
+
+-- Перенос в архив уволенных больше min_inactive_days дней назад (updated_at - дата увольнения).
+-- Не переносятся руководители отделов и проектов и участники незавершенных проектов.
+-- Переносятся снизу вверх: руководитель уходит в архив после всех своих подчиненных,
+-- поэтому manager_id в employees никогда не обнуляется
+CREATE OR REPLACE FUNCTION archive_inactive_employees(min_inactive_days INT DEFAULT 365, batch_size INT DEFAULT 1000)
+RETURNS INT AS $$
+DECLARE
+    moved INT;
+    total INT := 0;
+BEGIN
+    PERFORM set_config('app.archiving', 'on', TRUE);
+    LOOP
+        WITH candidates AS (
+            SELECT e.employee_id
+            FROM employees e
+            WHERE e.is_active = FALSE
+              AND e.updated_at < CURRENT_TIMESTAMP - make_interval(days => min_inactive_days)
+              AND NOT EXISTS (SELECT 1 FROM employees s WHERE s.manager_id = e.employee_id)
+              AND NOT EXISTS (SELECT 1 FROM departments d WHERE d.manager_id = e.employee_id)
+              AND NOT EXISTS (SELECT 1 FROM projects p WHERE p.project_manager_id = e.employee_id)
+              AND NOT EXISTS (
+                  SELECT 1 FROM employee_projects ep
+                  WHERE ep.employee_id = e.employee_id
+                    AND (ep.end_date IS NULL OR ep.end_date >= CURRENT_DATE)
+              )
+            ORDER BY e.employee_id
+            LIMIT batch_size - total
+            FOR UPDATE SKIP LOCKED
+        ),
+        removed AS (
+            DELETE FROM employees e
+            USING candidates c
+            WHERE e.employee_id = c.employee_id
+            RETURNING e.*
+        )
+        INSERT INTO employees_archive
+        SELECT removed.*, CURRENT_TIMESTAMP FROM removed;
+
+        GET DIAGNOSTICS moved = ROW_COUNT;
+        total := total + moved;
+        EXIT WHEN moved = 0 OR total >= batch_size;
+    END LOOP;
+    PERFORM set_config('app.archiving', '', TRUE);
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Возврат сотрудника из архива в employees (например, повторный прием на работу)
+CREATE OR REPLACE FUNCTION restore_archived_employee(p_employee_id INT)
+RETURNS BOOLEAN AS $$
+DECLARE
+    columns TEXT;
+    restored INT;
+BEGIN
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columns
+    FROM pg_attribute
+    WHERE attrelid = 'employees'::REGCLASS AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+    EXECUTE format(
+        'WITH removed AS (DELETE FROM employees_archive WHERE employee_id = $1 RETURNING *) '
+        'INSERT INTO employees (%s) SELECT %s FROM removed', columns, columns
+    ) USING p_employee_id;
+    GET DIAGNOSTICS restored = ROW_COUNT;
+
+    IF restored > 0 THEN
+        PERFORM rebuild_skill_profiles(ARRAY[p_employee_id]);
+    END IF;
+    RETURN restored > 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Все сотрудники, включая архив (для отчетов за прошлые годы)
+CREATE OR REPLACE VIEW employees_all AS
+SELECT e.*, NULL::TIMESTAMP AS archived_at FROM employees e
+UNION ALL
+SELECT a.* FROM employees_archive a;
+
+COMMENT ON TABLE employee_registry IS 'Все employee_id (действующие и архивные) - цель внешних ключей истории';
+COMMENT ON TABLE employees_archive IS 'Уволенные сотрудники, перенесенные из employees функцией archive_inactive_employees';
+COMMENT ON VIEW employees_all IS 'employees и employees_archive вместе; archived_at IS NULL - горячая таблица';
+COMMENT ON FUNCTION archive_inactive_employees(INT, INT) IS 'Перенос давно уволенных сотрудников в employees_archive';
+COMMENT ON FUNCTION restore_archived_employee(INT) IS 'Возврат сотрудника из архива в employees';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Архив сотрудников: employees_archive, реестр employee_registry, archive_inactive_employees()';
+END $$;
@@ -0,0 +1,162 @@
+-- Повышение зарплаты отделу порциями (backend/salary_raise.py)
+
+-- increase_department_salaries() обновляет весь отдел одним UPDATE в одной транзакции:
+-- строки заблокированы до конца, и правки сотрудников отдела ждут. Порционный режим
+-- обновляет сотрудников по возрастанию employee_id порциями с фиксацией после каждой;
+-- прогресс хранится в salary_raise_runs и обновляется в той же транзакции, что и порция,
+-- поэтому после сбоя запуск продолжается с места остановки без повторного повышения.
+
+CREATE TABLE IF NOT EXISTS salary_raise_runs (
+    run_id SERIAL PRIMARY KEY,
+    department_id INT NOT NULL REFERENCES departments(department_id) ON DELETE CASCADE,
+    increase_percentage DECIMAL(5, 2) NOT NULL,
+    batch_size INT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    last_employee_id INT NOT NULL DEFAULT 0,   -- основной проход: обработаны все employee_id <= этого
+    processed INT NOT NULL DEFAULT 0,
+    batches INT NOT NULL DEFAULT 0,
+    lock_hold_ms_total NUMERIC(14, 1) NOT NULL DEFAULT 0,
+    lock_hold_ms_max NUMERIC(14, 1) NOT NULL DEFAULT 0,
+    blocked_sessions INT NOT NULL DEFAULT 0,         -- сессии, ждавшие блокировок запуска (по замерам)
+    blocked_wait_ms_max NUMERIC(14, 1) NOT NULL DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+
+    CONSTRAINT chk_salary_raise_status CHECK (status IN ('running', 'completed', 'failed', 'cancelled')),
+    CONSTRAINT chk_salary_raise_percentage CHECK (increase_percentage > 0 AND increase_percentage <= 100),
+    CONSTRAINT chk_salary_raise_batch_size CHECK (batch_size > 0)
+);
+
+-- Один незавершенный запуск на отдел: второй повысил бы зарплаты повторно.
+-- Прерванный запуск нужно продолжить или отменить (cancelled) до нового
+CREATE UNIQUE INDEX IF NOT EXISTS idx_salary_raise_runs_active_department
+    ON salary_raise_runs(department_id) WHERE status IN ('running', 'failed');
+
+-- Сотрудники, пропущенные основным проходом (строка была заблокирована другой транзакцией)
+CREATE TABLE IF NOT EXISTS salary_raise_deferred (
+    run_id INT NOT NULL REFERENCES salary_raise_runs(run_id) ON DELETE CASCADE,
+    employee_id INT NOT NULL,
+    PRIMARY KEY (run_id, employee_id)
+);
+
+-- Одна порция запуска в транзакции вызывающего (фиксирует вызывающий).
+-- Строки блокируются с SKIP LOCKED: занятые другими транзакциями не ждутся, а
+-- откладываются в salary_raise_deferred и обрабатываются после основного прохода.
+-- Запуск, отмененный (cancel) или завершенный между порциями, не ошибка: порция
+-- ничего не делает и возвращает finished, статус запуска не меняется
+CREATE OR REPLACE FUNCTION salary_raise_batch(p_run_id INT)
+RETURNS TABLE(processed INT, deferred INT, finished BOOLEAN) AS $$
+DECLARE
+    raise_run salary_raise_runs%ROWTYPE;
+    batch_ids INT[];
+    batch_upper INT;
+BEGIN
+    SELECT * INTO raise_run FROM salary_raise_runs r WHERE r.run_id = p_run_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Запуск повышения % не найден', p_run_id;
+    END IF;
+    IF raise_run.status <> 'running' THEN
+        processed := 0;
+        deferred := 0;
+        finished := TRUE;
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    PERFORM set_config(
+        'app.salary_change_reason',
+        format('Повышение зарплаты отделу %s на %s%% (запуск %s)',
+               raise_run.department_id, raise_run.increase_percentage, p_run_id),
+        TRUE
+    );
+
+    -- Основной проход по возрастанию ключа
+    SELECT array_agg(locked.employee_id ORDER BY locked.employee_id) INTO batch_ids
+    FROM (
+        SELECT e.employee_id
+        FROM employees e
+        WHERE e.department_id = raise_run.department_id
+          AND e.is_active = TRUE
+          AND e.employee_id > raise_run.last_employee_id
+        ORDER BY e.employee_id
+        LIMIT raise_run.batch_size
+        FOR UPDATE SKIP LOCKED
+    ) locked;
+
+    IF batch_ids IS NOT NULL THEN
+        batch_upper := batch_ids[array_length(batch_ids, 1)];
+    ELSE
+        -- Все оставшиеся строки заняты: откладываются целиком
+        SELECT max(e.employee_id) INTO batch_upper
+        FROM employees e
+        WHERE e.department_id = raise_run.department_id
+          AND e.is_active = TRUE
+          AND e.employee_id > raise_run.last_employee_id;
+    END IF;
+
+    IF batch_upper IS NOT NULL THEN
+        INSERT INTO salary_raise_deferred (run_id, employee_id)
+        SELECT p_run_id, e.employee_id
+        FROM employees e
+        WHERE e.department_id = raise_run.department_id
+          AND e.is_active = TRUE
+          AND e.employee_id > raise_run.last_employee_id
+          AND e.employee_id <= batch_upper
+          AND e.employee_id <> ALL (COALESCE(batch_ids, '{}'))
+        ON CONFLICT DO NOTHING;
+    ELSE
+        -- Основной проход закончен: повторная попытка для отложенных
+        DELETE FROM salary_raise_deferred d
+        WHERE d.run_id = p_run_id
+          AND NOT EXISTS (
+              SELECT 1 FROM employees e
+              WHERE e.employee_id = d.employee_id
+                AND e.department_id = raise_run.department_id
+                AND e.is_active = TRUE
+          );
+
+        SELECT array_agg(locked.employee_id ORDER BY locked.employee_id) INTO batch_ids
+        FROM (
+            SELECT e.employee_id
+            FROM employees e
+            JOIN salary_raise_deferred d ON d.employee_id = e.employee_id AND d.run_id = p_run_id
+            ORDER BY e.employee_id
+            LIMIT raise_run.batch_size
+            FOR UPDATE OF e SKIP LOCKED
+        ) locked;
+
+        DELETE FROM salary_raise_deferred d
+        WHERE d.run_id = p_run_id AND d.employee_id = ANY (COALESCE(batch_ids, '{}'));
+    END IF;
+
+    UPDATE employees e
+    SET salary = ROUND(e.salary * (1 + raise_run.increase_percentage / 100), 2),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE e.employee_id = ANY (COALESCE(batch_ids, '{}'));
+
+    processed := COALESCE(array_length(batch_ids, 1), 0);
+    SELECT COUNT(*) INTO deferred FROM salary_raise_deferred d WHERE d.run_id = p_run_id;
+    finished := batch_upper IS NULL AND deferred = 0;
+
+    UPDATE salary_raise_runs r
+    SET last_employee_id = GREATEST(r.last_employee_id, COALESCE(batch_upper, 0)),
+        processed = r.processed + salary_raise_batch.processed,
+        batches = r.batches + 1,
+        status = CASE WHEN salary_raise_batch.finished THEN 'completed' ELSE r.status END,
+        finished_at = CASE WHEN salary_raise_batch.finished THEN CURRENT_TIMESTAMP END,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE r.run_id = p_run_id;
+
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TABLE salary_raise_runs IS 'Порционные повышения зарплаты отделу: прогресс и вызванные ожидания блокировок';
+COMMENT ON FUNCTION salary_raise_batch(INT) IS 'Одна порция повышения: SKIP LOCKED, прогресс в той же транзакции';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Порционное повышение зарплаты: salary_raise_runs, salary_raise_batch()';
+END $$;
@@ -0,0 +1,16 @@
+-- Узкие списки сотрудников (GET /employees/?fields=...&department_id=...)
+
+-- Список отдела в интерфейсе показывает имя, фамилию и должность. Покрывающий индекс
+-- хранит эти столбцы в листьях, и запрос с ?fields= из них выполняется Index Only Scan
+-- без чтения строк таблицы (при актуальной карте видимости - после autovacuum/VACUUM)
+CREATE INDEX IF NOT EXISTS idx_employees_department_list
+    ON employees (department_id, employee_id)
+    INCLUDE (first_name, last_name, position_id, is_active);
+
+COMMENT ON INDEX idx_employees_department_list IS
+    'Index Only Scan для /employees/?department_id=...&fields=first_name,last_name,position_id';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Узкие списки: покрывающий индекс idx_employees_department_list';
+END $$;
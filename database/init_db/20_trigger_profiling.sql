@@ -0,0 +1,77 @@
+-- Профилирование триггеров: вызовы и время функций триггеров (backend/trigger_profile.py)
+
+-- На employees больше десятка строковых триггеров (03_triggers.sql и следующие файлы),
+-- и по времени запроса не видно, какой из них дорогой. PostgreSQL считает вызовы и
+-- время PL/pgSQL-функций в pg_stat_user_functions (накопленно) и
+-- pg_stat_xact_user_functions (в текущей транзакции), если включен track_functions.
+DO $$
+BEGIN
+    EXECUTE format('ALTER DATABASE %I SET track_functions = %L', current_database(), 'pl');
+END $$;
+
+-- Функции триггеров со статистикой, одна строка на функцию.
+-- current_transaction = TRUE - только вызовы текущей транзакции (замер одной нагрузки).
+-- Статистика ведется по функции, а не по триггеру: у триггеров с общей функцией
+-- (update_updated_at_column, track_salary_period) вызовы не разделить, поэтому триггеры
+-- функции перечислены в triggers (таблица, имя, момент, события, уровень).
+-- total_ms включает вложенные вызовы (триггеры на audit_log и т.д.), self_ms - нет
+DROP FUNCTION IF EXISTS trigger_profile(BOOLEAN);
+CREATE FUNCTION trigger_profile(current_transaction BOOLEAN DEFAULT FALSE)
+RETURNS TABLE(
+    function_name TEXT,
+    table_names TEXT[],
+    trigger_names TEXT[],
+    triggers JSONB,
+    calls BIGINT,
+    total_ms DOUBLE PRECISION,
+    self_ms DOUBLE PRECISION
+) AS $$
+    SELECT
+        p.proname::TEXT,
+        array_agg(DISTINCT t.table_name ORDER BY t.table_name),
+        array_agg(t.trigger_name ORDER BY t.table_name, t.trigger_name),
+        jsonb_agg(jsonb_build_object(
+                      'table_name', t.table_name,
+                      'trigger_name', t.trigger_name,
+                      'timing', t.timing,
+                      'events', t.events,
+                      'level', t.level
+                  ) ORDER BY t.table_name, t.trigger_name),
+        COALESCE(MAX(s.calls), 0),
+        COALESCE(MAX(s.total_time), 0),
+        COALESCE(MAX(s.self_time), 0)
+    FROM (
+        SELECT
+            tg.tgfoid,
+            tg.tgrelid::REGCLASS::TEXT AS table_name,
+            tg.tgname::TEXT AS trigger_name,
+            CASE WHEN tg.tgtype & 2 = 2 THEN 'BEFORE' WHEN tg.tgtype & 64 = 64 THEN 'INSTEAD OF' ELSE 'AFTER' END AS timing,
+            concat_ws(' OR ',
+                      CASE WHEN tg.tgtype & 4 = 4 THEN 'INSERT' END,
+                      CASE WHEN tg.tgtype & 16 = 16 THEN 'UPDATE' END,
+                      CASE WHEN tg.tgtype & 8 = 8 THEN 'DELETE' END,
+                      CASE WHEN tg.tgtype & 32 = 32 THEN 'TRUNCATE' END) AS events,
+            CASE WHEN tg.tgtype & 1 = 1 THEN 'ROW' ELSE 'STATEMENT' END AS level
+        FROM pg_trigger tg
+        WHERE NOT tg.tgisinternal
+    ) t
+    JOIN pg_proc p ON p.oid = t.tgfoid
+    LEFT JOIN (
+        SELECT funcid, calls, total_time, self_time
+        FROM pg_stat_user_functions
+        WHERE NOT current_transaction
+        UNION ALL
+        SELECT funcid, calls, total_time, self_time
+        FROM pg_stat_xact_user_functions
+        WHERE current_transaction
+    ) s ON s.funcid = t.tgfoid
+    GROUP BY p.oid, p.proname
+    ORDER BY COALESCE(MAX(s.total_time), 0) DESC, 1;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION trigger_profile(BOOLEAN) IS 'Вызовы и время функций триггеров и их триггеры (track_functions = pl); TRUE - в текущей транзакции';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Профилирование триггеров: trigger_profile(), track_functions = pl';
+END $$;
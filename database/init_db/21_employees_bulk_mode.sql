@@ -0,0 +1,376 @@
+-- Массовый режим загрузки и миграций employees без построчных триггеров (backend/bulk_load.py)
+
+-- Каждая строка, вставленная или измененная в employees, проходит больше десятка
+-- триггеров: проверки иерархии и бюджета отдела (бюджет - сумма по всему отделу на
+-- каждую строку), аудит, история зарплат, периоды окладов, уведомления. При загрузке
+-- тысяч строк это основная часть времени.
+--
+-- В массовом режиме триггеры и проверки внешних ключей отключены на время транзакции
+-- (session_replication_role = replica), а employees_bulk_finish() один раз, запросами
+-- по всему набору строк, выполняет те же проверки и записи:
+--   employees_bulk_begin(ARRAY[id, ...])  - id изменяемых сотрудников (для вставки - пусто)
+--   INSERT / COPY / UPDATE employees ...   - без SAVEPOINT, в той же транзакции
+--   employees_bulk_finish()                - проверки, аудит, производные таблицы
+-- Все три шага - в одной транзакции: при ошибке проверки откатывается вся загрузка,
+-- как откатился бы оператор при исключении в триггере.
+
+-- Переключение session_replication_role требует прав суперпользователя; функция
+-- выполняется с правами владельца и доступна только тем, кому она выдана явно.
+-- Изменение действует до конца транзакции (is_local = TRUE)
+CREATE OR REPLACE FUNCTION set_bulk_replication_role(enabled BOOLEAN)
+RETURNS VOID AS $$
+BEGIN
+    PERFORM pg_catalog.set_config(
+        'session_replication_role',
+        CASE WHEN enabled THEN 'replica' ELSE 'origin' END,
+        TRUE
+    );
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+REVOKE ALL ON FUNCTION set_bulk_replication_role(BOOLEAN) FROM PUBLIC;
+
+-- Включен ли триггер на employees: повторяются только действия существующих триггеров
+CREATE OR REPLACE FUNCTION employees_trigger_enabled(p_trigger_name TEXT)
+RETURNS BOOLEAN AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgrelid = 'employees'::REGCLASS
+          AND tgname = p_trigger_name
+          AND tgenabled <> 'D'
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Начало массового режима: снимок изменяемых строк (старые значения для аудита и
+-- истории зарплат) под блокировкой и отключение триггеров
+CREATE OR REPLACE FUNCTION employees_bulk_begin(p_employee_ids INT[] DEFAULT '{}')
+RETURNS VOID AS $$
+BEGIN
+    IF current_setting('app.employees_bulk', TRUE) = 'on' THEN
+        RAISE EXCEPTION 'Массовый режим уже включен в этой транзакции';
+    END IF;
+
+    PERFORM 1 FROM employees WHERE employee_id = ANY (p_employee_ids) FOR UPDATE;
+
+    DROP TABLE IF EXISTS pg_temp.employees_bulk_before;
+    CREATE TEMP TABLE employees_bulk_before ON COMMIT DROP AS
+    SELECT * FROM employees WHERE employee_id = ANY (p_employee_ids);
+    ALTER TABLE employees_bulk_before ADD PRIMARY KEY (employee_id);
+
+    PERFORM set_config('app.employees_bulk', 'on', TRUE);
+    PERFORM set_bulk_replication_role(TRUE);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Завершение массового режима. Изменения находятся сравнением со снимком (обновленные)
+-- и по реестру employee_registry (новые: register_employee_insert не сработал).
+-- Удаление в массовом режиме не поддерживается: каскады внешних ключей отключены
+CREATE OR REPLACE FUNCTION employees_bulk_finish()
+RETURNS TABLE(inserted INT, updated INT) AS $$
+DECLARE
+    current_xid BIGINT := pg_current_xact_id()::TEXT::BIGINT % 4294967296;
+    changed_by_user INT := COALESCE(NULLIF(current_setting('app.current_user_id', TRUE), '')::INT, 1);
+    offending INT;
+    over_budget RECORD;
+    affected_projects INT[];
+BEGIN
+    IF current_setting('app.employees_bulk', TRUE) IS DISTINCT FROM 'on' THEN
+        RAISE EXCEPTION 'Массовый режим не включен: сначала employees_bulk_begin()';
+    END IF;
+
+    -- 1. Что изменилось (триггеры еще отключены)
+    DROP TABLE IF EXISTS pg_temp.employees_bulk_changes;
+    CREATE TEMP TABLE employees_bulk_changes (
+        employee_id INT PRIMARY KEY,
+        is_new BOOLEAN NOT NULL
+    ) ON COMMIT DROP;
+
+    INSERT INTO employees_bulk_changes (employee_id, is_new)
+    SELECT e.employee_id, TRUE
+    FROM employees e
+    WHERE NOT EXISTS (SELECT 1 FROM employee_registry r WHERE r.employee_id = e.employee_id)
+    UNION ALL
+    SELECT e.employee_id, FALSE
+    FROM employees e
+    JOIN employees_bulk_before b ON b.employee_id = e.employee_id
+    WHERE to_jsonb(e) IS DISTINCT FROM to_jsonb(b);
+
+    SELECT b.employee_id INTO offending
+    FROM employees_bulk_before b
+    WHERE NOT EXISTS (SELECT 1 FROM employees e WHERE e.employee_id = b.employee_id)
+    LIMIT 1;
+    IF offending IS NOT NULL THEN
+        RAISE EXCEPTION 'Сотрудник % удален в массовом режиме: удаление не поддерживается', offending;
+    END IF;
+
+    -- Строки, измененные этой транзакцией, но не объявленные в employees_bulk_begin,
+    -- остались бы без аудита
+    SELECT e.employee_id INTO offending
+    FROM employees e
+    WHERE e.xmin::TEXT::BIGINT = current_xid
+      AND NOT EXISTS (SELECT 1 FROM employees_bulk_before b WHERE b.employee_id = e.employee_id)
+      AND NOT EXISTS (SELECT 1 FROM employees_bulk_changes c WHERE c.employee_id = e.employee_id AND c.is_new)
+    LIMIT 1;
+    IF offending IS NOT NULL THEN
+        RAISE EXCEPTION 'Сотрудник % изменен, но не передан в employees_bulk_begin()', offending;
+    END IF;
+
+    -- update_employees_updated_at (BEFORE UPDATE)
+    IF employees_trigger_enabled('update_employees_updated_at') THEN
+        UPDATE employees e
+        SET updated_at = CURRENT_TIMESTAMP
+        FROM employees_bulk_changes c
+        WHERE c.employee_id = e.employee_id AND NOT c.is_new;
+    END IF;
+
+    -- register_employee_insert (BEFORE INSERT)
+    INSERT INTO employee_registry (employee_id)
+    SELECT employee_id FROM employees_bulk_changes WHERE is_new
+    ON CONFLICT (employee_id) DO UPDATE SET archived_at = NULL;
+
+    -- Дальше триггеры включены: записи в audit_log, departments и т.д. проходят их обычным путем
+    PERFORM set_bulk_replication_role(FALSE);
+    PERFORM set_config('app.employees_bulk', '', TRUE);
+
+    -- 2. Проверки
+    -- Внешние ключи (при replica не проверялись). Как и RI-триггеры, сначала блокируем
+    -- строки, на которые ссылаемся (FOR KEY SHARE): иначе параллельная транзакция может
+    -- удалить отдел, должность или руководителя между проверкой и фиксацией
+    PERFORM 1 FROM departments d
+    WHERE d.department_id IN (
+        SELECT e.department_id FROM employees_bulk_changes c JOIN employees e ON e.employee_id = c.employee_id
+    )
+    ORDER BY d.department_id
+    FOR KEY SHARE;
+    PERFORM 1 FROM positions p
+    WHERE p.position_id IN (
+        SELECT e.position_id FROM employees_bulk_changes c JOIN employees e ON e.employee_id = c.employee_id
+    )
+    ORDER BY p.position_id
+    FOR KEY SHARE;
+    PERFORM 1 FROM employees m
+    WHERE m.employee_id IN (
+        SELECT e.manager_id FROM employees_bulk_changes c JOIN employees e ON e.employee_id = c.employee_id
+    )
+    ORDER BY m.employee_id
+    FOR KEY SHARE;
+
+    SELECT c.employee_id INTO offending
+    FROM employees_bulk_changes c
+    JOIN employees e ON e.employee_id = c.employee_id
+    WHERE NOT EXISTS (SELECT 1 FROM departments d WHERE d.department_id = e.department_id)
+       OR NOT EXISTS (SELECT 1 FROM positions p WHERE p.position_id = e.position_id)
+       OR (e.manager_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM employees m WHERE m.employee_id = e.manager_id))
+    LIMIT 1;
+    IF offending IS NOT NULL THEN
+        RAISE EXCEPTION 'Сотрудник %: отдел, должность или руководитель не существует', offending;
+    END IF;
+
+    -- validate_management_hierarchy: нет циклов от новых сотрудников и сменивших руководителя
+    IF employees_trigger_enabled('validate_management_hierarchy') THEN
+        WITH RECURSIVE chain AS (
+            SELECT c.employee_id AS start_id, e.manager_id AS current_id, 1 AS depth
+            FROM employees_bulk_changes c
+            JOIN employees e ON e.employee_id = c.employee_id
+            LEFT JOIN employees_bulk_before b ON b.employee_id = c.employee_id
+            WHERE e.manager_id IS NOT NULL
+              AND (c.is_new OR e.manager_id IS DISTINCT FROM b.manager_id)
+            UNION ALL
+            SELECT chain.start_id, e.manager_id, chain.depth + 1
+            FROM chain
+            JOIN employees e ON e.employee_id = chain.current_id
+            WHERE chain.current_id <> chain.start_id
+              AND e.manager_id IS NOT NULL
+              AND chain.depth < 1000
+        )
+        SELECT start_id INTO offending FROM chain WHERE current_id = start_id LIMIT 1;
+        IF offending IS NOT NULL THEN
+            RAISE EXCEPTION 'Обнаружена циклическая ссылка в иерархии подчинения (сотрудник %)', offending;
+        END IF;
+    END IF;
+
+    -- validate_department_budget_on_hire: фонд оплаты активных в затронутых отделах
+    -- не больше 70% бюджета (итоговое состояние вместо проверки на каждой строке)
+    IF employees_trigger_enabled('validate_department_budget_on_hire') THEN
+        SELECT d.department_id, d.budget, SUM(e.salary) AS salary_sum INTO over_budget
+        FROM departments d
+        JOIN employees e ON e.department_id = d.department_id AND e.is_active = TRUE
+        WHERE d.department_id IN (
+            SELECT e2.department_id
+            FROM employees_bulk_changes c
+            JOIN employees e2 ON e2.employee_id = c.employee_id
+            LEFT JOIN employees_bulk_before b ON b.employee_id = c.employee_id
+            WHERE c.is_new
+               OR e2.salary IS DISTINCT FROM b.salary
+               OR e2.department_id IS DISTINCT FROM b.department_id
+        )
+        GROUP BY d.department_id, d.budget
+        HAVING SUM(e.salary) > d.budget * 0.7
+        LIMIT 1;
+        IF over_budget.department_id IS NOT NULL THEN
+            RAISE EXCEPTION 'Превышен бюджет отдела %. Фонд оплаты труда (%) превышает 70%% бюджета отдела (%)',
+                over_budget.department_id, over_budget.salary_sum, round(over_budget.budget * 0.7, 2);
+        END IF;
+    END IF;
+
+    -- 3. Записи, которые делали триггеры
+    -- audit_employees_changes
+    IF employees_trigger_enabled('audit_employees_changes') THEN
+        INSERT INTO audit_log (table_name, record_id, operation_type, old_values, new_values, changed_by, changed_at)
+        SELECT
+            'employees',
+            e.employee_id,
+            CASE WHEN c.is_new THEN 'INSERT' ELSE 'UPDATE' END,
+            CASE WHEN NOT c.is_new THEN jsonb_build_object(
+                'first_name', b.first_name,
+                'last_name', b.last_name,
+                'email', b.email,
+                'salary', b.salary,
+                'department_id', b.department_id,
+                'position_id', b.position_id,
+                'manager_id', b.manager_id
+            ) END,
+            jsonb_build_object(
+                'first_name', e.first_name,
+                'last_name', e.last_name,
+                'email', e.email,
+                'salary', e.salary,
+                'department_id', e.department_id,
+                'position_id', e.position_id,
+                'manager_id', e.manager_id
+            ),
+            changed_by_user,
+            CURRENT_TIMESTAMP
+        FROM employees_bulk_changes c
+        JOIN employees e ON e.employee_id = c.employee_id
+        LEFT JOIN employees_bulk_before b ON b.employee_id = c.employee_id
+        ORDER BY e.employee_id;
+    END IF;
+
+    -- track_salary_changes
+    IF employees_trigger_enabled('track_salary_changes') THEN
+        INSERT INTO salary_history (employee_id, old_salary, new_salary, change_date, change_reason, changed_by)
+        SELECT
+            e.employee_id,
+            COALESCE(b.salary, 0),
+            e.salary,
+            CURRENT_DATE,
+            COALESCE(current_setting('app.salary_change_reason', TRUE), 'salary_adjustment'),
+            changed_by_user
+        FROM employees_bulk_changes c
+        JOIN employees e ON e.employee_id = c.employee_id
+        JOIN employees_bulk_before b ON b.employee_id = c.employee_id
+        WHERE e.salary IS DISTINCT FROM b.salary;
+    END IF;
+
+    -- set_department_manager_on_position_change: руководящая должность делает сотрудника
+    -- руководителем отдела; при нескольких в отделе - последний, как при построчной обработке
+    IF employees_trigger_enabled('set_department_manager_on_position_change') THEN
+        UPDATE departments d
+        SET manager_id = m.employee_id,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT DISTINCT ON (e.department_id) e.department_id, e.employee_id
+            FROM employees_bulk_changes c
+            JOIN employees e ON e.employee_id = c.employee_id
+            LEFT JOIN employees_bulk_before b ON b.employee_id = c.employee_id
+            WHERE (c.is_new OR e.position_id IS DISTINCT FROM b.position_id
+                   OR e.department_id IS DISTINCT FROM b.department_id)
+              AND e.position_id IN (
+                  SELECT position_id FROM positions
+                  WHERE position_level IN ('manager', 'director', 'executive')
+              )
+            ORDER BY e.department_id, e.employee_id DESC
+        ) m
+        WHERE d.department_id = m.department_id;
+    END IF;
+
+    -- track_salary_period_insert / track_salary_period_update
+    IF employees_trigger_enabled('track_salary_period_update') THEN
+        CREATE TEMP TABLE employees_bulk_periods ON COMMIT DROP AS
+        SELECT e.employee_id
+        FROM employees_bulk_changes c
+        JOIN employees e ON e.employee_id = c.employee_id
+        JOIN employees_bulk_before b ON b.employee_id = c.employee_id
+        WHERE e.salary IS DISTINCT FROM b.salary
+           OR e.department_id IS DISTINCT FROM b.department_id
+           OR e.is_active IS DISTINCT FROM b.is_active;
+
+        DELETE FROM salary_periods sp
+        USING employees_bulk_periods p
+        WHERE sp.employee_id = p.employee_id
+          AND upper_inf(sp.valid_during)
+          AND lower(sp.valid_during) >= CURRENT_DATE;
+
+        UPDATE salary_periods sp
+        SET valid_during = daterange(lower(sp.valid_during), CURRENT_DATE)
+        FROM employees_bulk_periods p
+        WHERE sp.employee_id = p.employee_id
+          AND upper_inf(sp.valid_during);
+
+        INSERT INTO salary_periods (employee_id, department_id, salary, valid_during)
+        SELECT e.employee_id, e.department_id, e.salary, daterange(GREATEST(CURRENT_DATE, e.hire_date), NULL)
+        FROM employees_bulk_periods p
+        JOIN employees e ON e.employee_id = p.employee_id
+        WHERE e.is_active;
+
+        DROP TABLE employees_bulk_periods;
+    END IF;
+    IF employees_trigger_enabled('track_salary_period_insert') THEN
+        INSERT INTO salary_periods (employee_id, department_id, salary, valid_during)
+        SELECT e.employee_id, e.department_id, e.salary, daterange(e.hire_date, NULL)
+        FROM employees_bulk_changes c
+        JOIN employees e ON e.employee_id = c.employee_id
+        WHERE c.is_new AND e.is_active;
+    END IF;
+
+    -- refresh_costs_on_employee_update: проекты сотрудников со сменой оклада или увольнением
+    IF employees_trigger_enabled('refresh_costs_on_employee_update') THEN
+        SELECT array_agg(DISTINCT ep.project_id) INTO affected_projects
+        FROM employees_bulk_changes c
+        JOIN employees e ON e.employee_id = c.employee_id
+        JOIN employees_bulk_before b ON b.employee_id = c.employee_id
+        JOIN employee_projects ep ON ep.employee_id = c.employee_id
+        WHERE e.salary IS DISTINCT FROM b.salary
+           OR e.is_active IS DISTINCT FROM b.is_active;
+        IF affected_projects IS NOT NULL THEN
+            PERFORM refresh_project_cost_summary(affected_projects);
+        END IF;
+    END IF;
+
+    -- notify_org_chart_insert_delete / notify_org_chart_manager_change
+    IF employees_trigger_enabled('notify_org_chart_insert_delete') THEN
+        PERFORM pg_notify('org_chart', json_build_object(
+            'op', CASE WHEN c.is_new THEN 'INSERT' ELSE 'UPDATE' END,
+            'employee_id', e.employee_id,
+            'manager_id', e.manager_id,
+            'department_id', e.department_id
+        )::TEXT)
+        FROM employees_bulk_changes c
+        JOIN employees e ON e.employee_id = c.employee_id
+        LEFT JOIN employees_bulk_before b ON b.employee_id = c.employee_id
+        WHERE c.is_new
+           OR e.manager_id IS DISTINCT FROM b.manager_id
+           OR e.department_id IS DISTINCT FROM b.department_id;
+    END IF;
+
+    -- recalc_department_stats_on_salary_change не повторяется: его записи в audit_log
+    -- с operation_type = 'CALCULATE' не проходят ограничение chk_operation_type
+
+    SELECT COUNT(*) FILTER (WHERE is_new), COUNT(*) FILTER (WHERE NOT is_new)
+    INTO inserted, updated
+    FROM employees_bulk_changes;
+
+    DROP TABLE employees_bulk_changes;
+    DROP TABLE employees_bulk_before;
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION employees_bulk_begin(INT[]) IS 'Массовый режим employees: снимок изменяемых строк, триггеры отключены до employees_bulk_finish()';
+COMMENT ON FUNCTION employees_bulk_finish() IS 'Проверки и записи триггеров employees одним проходом по загруженным и измененным строкам';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Массовый режим employees: employees_bulk_begin() / employees_bulk_finish()';
+END $$;
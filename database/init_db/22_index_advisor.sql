@@ -0,0 +1,115 @@
+-- Советник по индексам: дубликаты, избыточные префиксы, неиспользуемые индексы (backend/index_advisor.py)
+
+-- pg_stat_statements - статистика запросов по нормализованному тексту. Собирает данные,
+-- только если загружено при старте сервера (shared_preload_libraries, docker-compose.yml);
+-- без этого советник работает по статистике индексов и таблиц
+CREATE EXTENSION IF NOT EXISTS pg_stat_statements;
+
+-- Индексы схемы public с ключевыми столбцами в сравнимом виде.
+-- key_columns - определения ключевых столбцов (имя или выражение), include_columns - INCLUDE.
+-- Классы операторов и порядок сортировки (indoption) нужны, чтобы индексы по одним
+-- столбцам, но с разными операторами (text_pattern_ops, DESC) не считались дубликатами
+CREATE OR REPLACE VIEW index_catalog AS
+SELECT
+    i.indexrelid,
+    i.indrelid,
+    t.relname::TEXT AS table_name,
+    c.relname::TEXT AS index_name,
+    am.amname::TEXT AS method,
+    ARRAY(SELECT pg_get_indexdef(i.indexrelid, n, TRUE)
+          FROM generate_series(1, i.indnkeyatts) n ORDER BY n) AS key_columns,
+    ARRAY(SELECT pg_get_indexdef(i.indexrelid, n, TRUE)
+          FROM generate_series(i.indnkeyatts + 1, i.indnatts) n ORDER BY n) AS include_columns,
+    (string_to_array(i.indkey::TEXT, ' ')::INT[])[1:i.indnkeyatts] AS key_attnums,
+    string_to_array(i.indclass::TEXT, ' ')::OID[] AS key_opclasses,
+    string_to_array(i.indoption::TEXT, ' ')::INT[] AS key_options,
+    pg_get_expr(i.indpred, i.indrelid) AS predicate,
+    i.indisunique AS is_unique,
+    i.indisprimary AS is_primary,
+    i.indisvalid AS is_valid,
+    con.conname::TEXT AS constraint_name,
+    COALESCE(s.idx_scan, 0) AS idx_scan,
+    COALESCE(s.idx_tup_read, 0) AS idx_tup_read,
+    pg_relation_size(i.indexrelid) AS size_bytes,
+    pg_get_indexdef(i.indexrelid) AS definition
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_class t ON t.oid = i.indrelid
+JOIN pg_am am ON am.oid = c.relam
+LEFT JOIN pg_constraint con ON con.conindid = i.indexrelid AND con.contype IN ('p', 'u', 'x')
+LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = i.indexrelid
+WHERE t.relnamespace = 'public'::REGNAMESPACE;
+
+-- Индексы, которые можно удалить без потери планов: запросы обслужит covered_by.
+--   duplicate - те же ключевые столбцы, операторы и условие (idx_employees_email и
+--               индекс ограничения UNIQUE (email));
+--   prefix    - ключ индекса - начало ключа другого B-tree индекса с тем же условием
+--               (idx_employees_manager_id и idx_emp_manager_active).
+-- Индексы ограничений и уникальные индексы (кроме дубликата другого уникального) не
+-- предлагаются: они обеспечивают правило, а не скорость. Индекс с INCLUDE избыточен,
+-- только если covered_by содержит и эти столбцы (иначе теряется Index Only Scan).
+-- Из нескольких дубликатов остается индекс ограничения, уникальный или созданный первым
+CREATE OR REPLACE VIEW index_redundancy AS
+SELECT DISTINCT ON (r.indexrelid)
+    r.indexrelid,
+    r.table_name,
+    r.index_name,
+    CASE WHEN k.key_columns = r.key_columns THEN 'duplicate' ELSE 'prefix' END AS reason,
+    k.index_name AS covered_by,
+    k.definition AS covered_by_definition
+FROM index_catalog r
+JOIN index_catalog k ON k.indrelid = r.indrelid AND k.indexrelid <> r.indexrelid
+WHERE r.constraint_name IS NULL
+  AND r.is_valid AND k.is_valid
+  AND r.method = k.method
+  AND r.predicate IS NOT DISTINCT FROM k.predicate
+  AND k.key_columns[1:cardinality(r.key_columns)] = r.key_columns
+  AND k.key_opclasses[1:cardinality(r.key_columns)] = r.key_opclasses
+  AND k.key_options[1:cardinality(r.key_columns)] = r.key_options
+  AND r.include_columns <@ (k.key_columns || k.include_columns)
+  AND (
+      -- Дубликат: остается индекс ограничения, уникальный или более старый
+      (cardinality(k.key_columns) = cardinality(r.key_columns)
+       AND (NOT r.is_unique OR k.is_unique)
+       AND (k.constraint_name IS NOT NULL OR k.is_unique AND NOT r.is_unique OR k.indexrelid < r.indexrelid))
+      -- Префикс: только B-tree умеет искать по началу ключа
+      OR (cardinality(k.key_columns) > cardinality(r.key_columns)
+          AND r.method = 'btree'
+          AND NOT r.is_unique)
+  )
+ORDER BY r.indexrelid,
+         (k.constraint_name IS NOT NULL) DESC,
+         cardinality(k.key_columns) DESC,
+         k.indexrelid;
+
+-- Внешние ключи и есть ли индекс, начинающийся с их столбцов: без него удаление или
+-- изменение ключа в родительской таблице читает дочернюю целиком
+CREATE OR REPLACE VIEW foreign_key_indexes AS
+SELECT
+    con.conrelid::REGCLASS::TEXT AS table_name,
+    con.conname::TEXT AS constraint_name,
+    con.confrelid::REGCLASS::TEXT AS referenced_table,
+    ARRAY(SELECT a.attname::TEXT
+          FROM unnest(con.conkey) WITH ORDINALITY k(attnum, n)
+          JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+          ORDER BY k.n) AS columns,
+    EXISTS (
+        SELECT 1
+        FROM index_catalog ic
+        WHERE ic.indrelid = con.conrelid
+          AND ic.is_valid
+          AND ic.predicate IS NULL
+          AND ic.key_attnums[1:cardinality(con.conkey)] @> con.conkey::INT[]
+    ) AS indexed
+FROM pg_constraint con
+WHERE con.contype = 'f'
+  AND con.connamespace = 'public'::REGNAMESPACE;
+
+COMMENT ON VIEW index_catalog IS 'Индексы схемы public: ключи, операторы, условие, ограничение, число сканирований и размер';
+COMMENT ON VIEW index_redundancy IS 'Дублирующие и префиксно-избыточные индексы и индексы, которые их заменяют';
+COMMENT ON VIEW foreign_key_indexes IS 'Внешние ключи и наличие индекса по их столбцам';
+
+DO $$
+BEGIN
+    RAISE NOTICE 'Советник по индексам: index_catalog, index_redundancy, foreign_key_indexes';
+END $$;
@@ -0,0 +1,343 @@
+"""
+Нагрузочное тестирование и бенчмарк HR API.
+
+Запускает сценарии для горячих эндпоинтов (список и карточка сотрудника,
+подчиненные, отчеты, представления, батчевый импорт, повышение зарплаты),
+считает p50/p95/p99 и пропускную способность и сравнивает результат
+с сохраненной базовой линией, чтобы регрессии были видны в PR.
+
+Работает только на стандартной библиотеке Python.
+
+Примеры:
+    # Прогон всех читающих сценариев, 8 потоков по 15 секунд
+    python test_data/load_test.py --url http://localhost:8000 --concurrency 8 --duration 15
+
+    # Сохранить результат как базовую линию
+    python test_data/load_test.py --save-baseline
+
+    # Включить пишущие сценарии (импорт и повышение зарплаты меняют данные!)
+    python test_data/load_test.py --include-writes --workload batch_import --workload salary_increase
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlparse
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+FIRST_NAMES = ['Иван', 'Алексей', 'Дмитрий', 'Сергей', 'Андрей', 'Ольга', 'Елена', 'Анна', 'Мария', 'Наталья']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попова', 'Васильева', 'Павлова', 'Семенова', 'Голубева']
+
+
+# ========== ДАННЫЕ ДЛЯ СЦЕНАРИЕВ ==========
+
+class Dataset:
+    """Идентификаторы, по которым строятся запросы сценариев"""
+
+    def __init__(self, employee_ids, manager_ids, department_ids, position_ids):
+        self.employee_ids = employee_ids
+        self.manager_ids = manager_ids or employee_ids
+        self.department_ids = department_ids
+        self.position_ids = position_ids
+
+    @classmethod
+    def discover(cls, client):
+        """Получение существующих идентификаторов через API (эндпоинты на сыром SQL)"""
+        status, body = client.request("GET", "/reports/employee-hierarchy")
+        if status != 200:
+            raise RuntimeError(f"Не удалось получить иерархию сотрудников: HTTP {status}")
+        rows = json.loads(body)
+        employee_ids = [row["employee_id"] for row in rows]
+        manager_ids = sorted({row["manager_id"] for row in rows if row.get("manager_id")})
+        position_ids = sorted({row["position_id"] for row in rows if row.get("position_id")})
+
+        status, body = client.request("GET", "/reports/department-salary")
+        if status != 200:
+            raise RuntimeError(f"Не удалось получить список отделов: HTTP {status}")
+        department_ids = [row["department_id"] for row in json.loads(body)]
+
+        if not employee_ids or not department_ids:
+            raise RuntimeError("База пуста: сначала загрузите данные (database/test_data/02_generate_data.py)")
+        return cls(employee_ids, manager_ids, department_ids, position_ids)
+
+
+def generate_employees_csv(rows, dataset, rng):
+    """
+    Генерация CSV для батчевого импорта.
+    Email уникален в пределах прогона, чтобы импорт не упирался в ограничение уникальности.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    lines = ["first_name,last_name,email,hire_date,salary,department_id,position_id,manager_id"]
+    for i in range(rows):
+        hire_date = date.today() - timedelta(days=rng.randint(0, 3650))
+        lines.append(",".join([
+            rng.choice(FIRST_NAMES),
+            rng.choice(LAST_NAMES),
+            f"bench.{run_id}.{i}@company.com",
+            hire_date.isoformat(),
+            f"{rng.uniform(30000, 150000):.2f}",
+            str(rng.choice(dataset.department_ids)),
+            str(rng.choice(dataset.position_ids)) if dataset.position_ids else "",
+            str(rng.choice(dataset.manager_ids)),
+        ]))
+    return "\n".join(lines).encode("utf-8")
+
+
+# ========== HTTP-КЛИЕНТ ==========
+
+class Client:
+    """Постоянное HTTP-соединение (по одному на поток нагрузки)"""
+
+    def __init__(self, base_url, timeout=60):
+        parsed = urlparse(base_url)
+        connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self._connection = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        try:
+            self._connection.request(method, path, body=body, headers=headers or {})
+            response = self._connection.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            # Соединение разорвано - переоткрываем его при следующем запросе
+            self._connection.close()
+            raise
+
+    def close(self):
+        self._connection.close()
+
+
+def multipart_file(field, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+# ========== СЦЕНАРИИ ==========
+
+def _employees_list(dataset, rng, options):
+    skip = rng.randint(0, max(0, len(dataset.employee_ids) - options.page_size))
+    return "GET", f"/employees/?skip={skip}&limit={options.page_size}", None, None
+
+def _employee_detail(dataset, rng, options):
+    return "GET", f"/employees/{rng.choice(dataset.employee_ids)}", None, None
+
+def _subordinates(dataset, rng, options):
+    return "GET", f"/employees/{rng.choice(dataset.manager_ids)}/subordinates", None, None
+
+def _department_salary(dataset, rng, options):
+    return "GET", "/reports/department-salary", None, None
+
+def _department_employees(dataset, rng, options):
+    return "GET", f"/reports/department/{rng.choice(dataset.department_ids)}/employees", None, None
+
+def _employee_hierarchy(dataset, rng, options):
+    return "GET", "/reports/employee-hierarchy", None, None
+
+def _view_employee_full_info(dataset, rng, options):
+    return "GET", "/views/employee-full-info", None, None
+
+def _view_department_budget(dataset, rng, options):
+    return "GET", "/views/department-budget", None, None
+
+def _batch_import(dataset, rng, options):
+    body, headers = multipart_file("file", "bench.csv", generate_employees_csv(options.import_rows, dataset, rng))
+    return "POST", "/batch/import-employees", body, headers
+
+def _salary_increase(dataset, rng, options):
+    department_id = rng.choice(dataset.department_ids)
+    return "POST", f"/procedures/increase-salary?department_id={department_id}&percent=0.01", None, None
+
+
+# имя -> (построитель запроса, меняет ли данные)
+WORKLOADS = {
+    "employees_list": (_employees_list, False),
+    "employee_detail": (_employee_detail, False),
+    "subordinates": (_subordinates, False),
+    "department_salary": (_department_salary, False),
+    "department_employees": (_department_employees, False),
+    "employee_hierarchy": (_employee_hierarchy, False),
+    "view_employee_full_info": (_view_employee_full_info, False),
+    "view_department_budget": (_view_department_budget, False),
+    "batch_import": (_batch_import, True),
+    "salary_increase": (_salary_increase, True),
+}
+
+
+# ========== ПРОГОН И СТАТИСТИКА ==========
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_workload(name, options, dataset):
+    """Прогон одного сценария: options.concurrency потоков в течение options.duration секунд"""
+    builder, _ = WORKLOADS[name]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + options.warmup + options.duration
+    measure_from = time.perf_counter() + options.warmup
+
+    def worker(worker_index):
+        rng = random.Random(options.seed * 1000 + worker_index)
+        client = Client(options.url)
+        local_latencies = []
+        local_errors = []
+        while time.perf_counter() < deadline:
+            method, path, body, headers = builder(dataset, rng, options)
+            start = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body, headers)
+                ok = 200 <= status < 300
+            except (http.client.HTTPException, OSError) as e:
+                status, ok = str(e), False
+            elapsed = time.perf_counter() - start
+            if start >= measure_from:
+                local_latencies.append(elapsed)
+                if not ok:
+                    local_errors.append(status)
+        with lock:
+            latencies.extend(local_latencies)
+            errors.extend(local_errors)
+
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        list(executor.map(worker, range(options.concurrency)))
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": [str(error) for error in errors[:5]],
+        "throughput_rps": round(len(latencies) / options.duration, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def compare_with_baseline(results, baseline, max_regression):
+    """Список регрессий: рост p95 или падение пропускной способности больше допуска"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("workloads", {}).get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} мс")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} rps")
+        if current["errors"] and not previous.get("errors"):
+            regressions.append(f"{name}: появились ошибки ({current['errors']})")
+    return regressions
+
+
+def print_report(results, baseline):
+    header = f"{'сценарий':<26}{'запросов':>9}{'ошибок':>8}{'rps':>10}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'Δp95':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        previous = (baseline or {}).get("workloads", {}).get(name)
+        delta = ""
+        if previous and previous["p95_ms"]:
+            delta = f"{(r['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%"
+        print(f"{name:<26}{r['requests']:>9}{r['errors']:>8}{r['throughput_rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{delta:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк HR API")
+    parser.add_argument("--url", default=os.getenv("API_URL", "http://localhost:8000"), help="Базовый URL API")
+    parser.add_argument("--workload", action="append", choices=sorted(WORKLOADS), help="Сценарий (можно несколько); по умолчанию все читающие")
+    parser.add_argument("--include-writes", action="store_true", help="Разрешить сценарии, меняющие данные")
+    parser.add_argument("--concurrency", type=int, default=8, help="Число параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=15, help="Длительность замера сценария, сек")
+    parser.add_argument("--warmup", type=float, default=3, help="Прогрев перед замером, сек")
+    parser.add_argument("--page-size", type=int, default=100, help="Размер страницы для списка сотрудников")
+    parser.add_argument("--import-rows", type=int, default=100, help="Строк в CSV для батчевого импорта")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора случайных чисел")
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Файл базовой линии")
+    parser.add_argument("--save-baseline", action="store_true", help="Записать результаты как новую базовую линию")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Допустимое ухудшение относительно базовой линии (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+
+    workloads = options.workload or [name for name, (_, writes) in WORKLOADS.items() if not writes]
+    writing = [name for name in workloads if WORKLOADS[name][1]]
+    if writing and not options.include_writes:
+        print(f"Сценарии {', '.join(writing)} меняют данные: добавьте --include-writes")
+        return 2
+
+    dataset = Dataset.discover(Client(options.url))
+    print(f"Данные: {len(dataset.employee_ids)} сотрудников, {len(dataset.manager_ids)} руководителей, "
+          f"{len(dataset.department_ids)} отделов")
+    print(f"Нагрузка: {options.concurrency} клиентов, {options.duration} с на сценарий (+{options.warmup} с прогрева)\n")
+
+    results = {}
+    for name in workloads:
+        print(f"→ {name}...", flush=True)
+        results[name] = run_workload(name, options, dataset)
+
+    baseline = None
+    if os.path.exists(options.baseline) and not options.save_baseline:
+        with open(options.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print()
+    print_report(results, baseline)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "url": options.url,
+        "concurrency": options.concurrency,
+        "duration": options.duration,
+        "employees": len(dataset.employee_ids),
+        "workloads": results,
+    }
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if options.save_baseline:
+        with open(options.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовая линия сохранена: {options.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"\nБазовая линия {options.baseline} не найдена - сравнение пропущено (создайте ее через --save-baseline)")
+        return 0
+
+    regressions = compare_with_baseline(results, baseline, options.max_regression)
+    if regressions:
+        print(f"\n✗ Регрессии относительно базовой линии (допуск {options.max_regression:.0%}):")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("\n✓ Регрессий относительно базовой линии нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
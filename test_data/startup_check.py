@@ -0,0 +1,135 @@
+"""
+Проверка времени холодного старта и памяти воркера API.
+
+Несколько раз запускает `python -X importtime -c "import app"` в отдельном
+процессе (как это делает новый воркер), замеряет время до окончания импорта
+приложения и RSS процесса, печатает время импорта по корневым пакетам
+и завершается с кодом 1, если:
+  * медианное время холодного старта превышает --budget-ms;
+  * RSS после импорта превышает --rss-budget-mb;
+  * при старте загружен модуль, который должен импортироваться лениво (--forbid).
+
+Работает только на стандартной библиотеке Python.
+
+Примеры:
+    python test_data/startup_check.py
+    python test_data/startup_check.py --budget-ms 1500 --rss-budget-mb 120 --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# Тяжелые зависимости, нужные отдельным эндпоинтам (pandas - только батчевому импорту)
+DEFAULT_FORBIDDEN = ("pandas", "numpy", "pyarrow")
+
+# Дочерний процесс: импорт приложения и отчет о памяти и загруженных модулях
+CHILD_SCRIPT = """
+import json, resource, sys
+import app
+rss_kb = None
+try:
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            if line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+except OSError:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"rss_kb": rss_kb, "modules": sorted(sys.modules)}))
+"""
+
+
+def parse_importtime(stderr):
+    """Строки `import time: self | cumulative | module` -> {module: (self_us, cumulative_us, depth)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def run_once(python, env):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [python, "-X", "importtime", "-c", CHILD_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"Импорт приложения завершился с ошибкой:\n{completed.stderr[-2000:]}")
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    return elapsed_ms, report, parse_importtime(completed.stderr)
+
+
+def top_level_breakdown(modules):
+    """Суммарное время импорта по корневым пакетам (без вложенного двойного учета)"""
+    totals = {}
+    for name, (self_us, _, _) in modules.items():
+        root = name.split(".")[0]
+        totals[root] = totals.get(root, 0) + self_us
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бюджет холодного старта воркера HRM API")
+    parser.add_argument("--runs", type=int, default=3, help="Число запусков (берется медиана)")
+    parser.add_argument("--budget-ms", type=float, default=2500, help="Бюджет времени холодного старта, мс")
+    parser.add_argument("--rss-budget-mb", type=float, default=150, help="Бюджет RSS воркера после импорта, МБ")
+    parser.add_argument("--forbid", action="append", help="Модуль, запрещенный при старте (по умолчанию pandas, numpy, pyarrow)")
+    parser.add_argument("--top", type=int, default=15, help="Сколько корневых пакетов вывести")
+    parser.add_argument("--python", default=sys.executable)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = dict(os.environ)
+    forbidden = args.forbid or DEFAULT_FORBIDDEN
+
+    # Прогревочный запуск: компиляция .pyc не должна попадать в замер
+    run_once(args.python, env)
+    timings, rss_values, modules, loaded = [], [], {}, set()
+    for _ in range(args.runs):
+        elapsed_ms, report, modules = run_once(args.python, env)
+        timings.append(elapsed_ms)
+        rss_values.append(report["rss_kb"] / 1024)
+        loaded = set(report["modules"])
+
+    cold_start_ms = statistics.median(timings)
+    rss_mb = max(rss_values)
+    app_import_ms = modules.get("app", (0, 0, 0))[1] / 1000
+
+    print(f"Холодный старт (медиана из {args.runs}): {cold_start_ms:.0f} мс, импорт app: {app_import_ms:.0f} мс")
+    print(f"RSS после импорта: {rss_mb:.1f} МБ, модулей загружено: {len(loaded)}")
+    print(f"\n{'пакет':<28} {'мс':>8}")
+    for root, self_us in top_level_breakdown(modules)[:args.top]:
+        print(f"{root:<28} {self_us / 1000:>8.1f}")
+
+    failures = []
+    if cold_start_ms > args.budget_ms:
+        failures.append(f"холодный старт {cold_start_ms:.0f} мс превышает бюджет {args.budget_ms:.0f} мс")
+    if rss_mb > args.rss_budget_mb:
+        failures.append(f"RSS {rss_mb:.1f} МБ превышает бюджет {args.rss_budget_mb:.0f} МБ")
+    for name in forbidden:
+        if name in loaded:
+            failures.append(f"модуль {name} загружается при старте (должен импортироваться лениво)")
+
+    if failures:
+        print("\nПРОВАЛ:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    print("\nOK: запуск укладывается в бюджет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Масштабирование пропускной способности API по числу воркеров.
+
+Для каждого числа воркеров поднимает сервер (gunicorn с gunicorn.conf.py или
+uvicorn --workers) на свободном порту, ждет готовности всех воркеров, прогоняет
+читающие сценарии load_test.py и печатает rps, p95, ускорение относительно
+одного воркера и эффективность (ускорение / число воркеров).
+
+Бюджет соединений DB_CONNECTION_BUDGET делится между воркерами так же, как в боевом режиме.
+
+Примеры:
+    python test_data/worker_scaling.py --workers 1 --workers 2 --workers 4
+    python test_data/worker_scaling.py --server uvicorn --workload employees_list --duration 10
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import load_test  # noqa: E402
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+DEFAULT_WORKLOADS = ("employees_list", "employee_detail", "subordinates")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, workers, port, env):
+    env = dict(env, WEB_CONCURRENCY=str(workers))
+    if kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "app:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, start_new_session=True)
+
+
+def wait_ready(url, workers, timeout):
+    """Все воркеры прошли startup-обработчики (отчет /metrics/startup каждого воркера)"""
+    deadline = time.monotonic() + timeout
+    ready = set()
+    while time.monotonic() < deadline:
+        # Новое соединение на каждый опрос: иначе keep-alive закрепит клиента за одним воркером
+        client = load_test.Client(url, timeout=5)
+        try:
+            status, body = client.request("GET", "/metrics/startup")
+            if status == 200:
+                report = json.loads(body)
+                if report.get("ready_seconds") is not None:
+                    ready.add(report["pid"])
+                if len(ready) >= workers:
+                    return True
+        except OSError:
+            time.sleep(0.2)
+        finally:
+            client.close()
+        time.sleep(0.02)
+    return False
+
+
+def stop_server(process, timeout=40):
+    # SIGTERM - плавная остановка: воркеры дорабатывают запросы и выполняют shutdown
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пропускная способность HR API в зависимости от числа воркеров")
+    parser.add_argument("--workers", type=int, action="append", help="Число воркеров (можно несколько)")
+    parser.add_argument("--server", choices=("gunicorn", "uvicorn"), default="gunicorn")
+    parser.add_argument("--workload", action="append", choices=sorted(load_test.WORKLOADS),
+                        help="Читающий сценарий load_test.py (можно несколько)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Параллельных клиентов (по умолчанию 4 на воркер)")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    counts = args.workers or sorted({1, 2, max(1, (os.cpu_count() or 1) // 2), os.cpu_count() or 1})
+    workloads = args.workload or list(DEFAULT_WORKLOADS)
+    writing = [name for name in workloads if load_test.WORKLOADS[name][1]]
+    if writing:
+        print(f"Сценарии {', '.join(writing)} меняют данные и не подходят для сравнения")
+        return 2
+
+    results = {}
+    for workers in counts:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        process = start_server(args.server, workers, port, os.environ)
+        try:
+            if not wait_ready(url, workers, args.startup_timeout):
+                print(f"Сервер с {workers} воркерами не запустился за {args.startup_timeout} с")
+                return 1
+            dataset = load_test.Dataset.discover(load_test.Client(url))
+            options = SimpleNamespace(
+                url=url, concurrency=args.concurrency or 4 * workers, duration=args.duration,
+                warmup=args.warmup, page_size=args.page_size, seed=args.seed, import_rows=0,
+            )
+            print(f"→ {workers} воркеров, {options.concurrency} клиентов", flush=True)
+            for name in workloads:
+                results[(workers, name)] = load_test.run_workload(name, options, dataset)
+        finally:
+            stop_server(process)
+
+    header = f"{'сценарий':<22}{'воркеров':>9}{'rps':>10}{'p95 мс':>10}{'ошибок':>8}{'ускорение':>11}{'эффект.':>9}"
+    print()
+    print(header)
+    print("-" * len(header))
+    for name in workloads:
+        base = results[(counts[0], name)]["throughput_rps"] or None
+        for workers in counts:
+            r = results[(workers, name)]
+            speedup = r["throughput_rps"] / base if base else 0
+            efficiency = speedup * counts[0] / workers
+            print(f"{name:<22}{workers:>9}{r['throughput_rps']:>10}{r['p95_ms']:>10}{r['errors']:>8}"
+                  f"{speedup:>10.2f}x{efficiency:>9.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())